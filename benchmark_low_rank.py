@@ -0,0 +1,132 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares CPU inference latency and accuracy of factorized feed-forwards.
+
+For every rank in `--ranks`, factorizes all feed-forward kernels of the
+checkpoint to that rank with `factorize_checkpoint.py` (rank 0 is the
+original model), times inference batches of random inputs and, with an
+`--eval_file`, reports the dev accuracy, e.g.
+
+  python benchmark_low_rank.py --bert_config_file=... \\
+    --init_checkpoint=... --eval_file=... --output_dir=/tmp/low_rank \\
+    --ranks=0,512,256,128,64
+
+Without `--init_checkpoint` the model is randomly initialized and only the
+latency is measured. Uses the flags of `factorize_checkpoint.py`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+
+import factorize_checkpoint
+import feature_reader
+import modeling
+import numpy as np
+import prune_checkpoint
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    "ranks", "0,512,256,128,64",
+    "Comma-separated feed-forward ranks to compare. 0 is the unfactorized "
+    "model.")
+
+flags.DEFINE_integer("num_warmup_steps", 2,
+                     "Number of batches to run before timing.")
+
+flags.DEFINE_integer("num_steps", 10, "Number of timed batches.")
+
+
+def time_inference(bert_config, init_checkpoint):
+  """Returns the mean seconds per inference batch of random inputs."""
+  rng = np.random.RandomState(12345)
+  with tf.Graph().as_default():
+    input_ids = tf.constant(
+        rng.randint(
+            bert_config.vocab_size,
+            size=[FLAGS.batch_size, FLAGS.max_seq_length]),
+        dtype=tf.int32)
+    model = modeling.BertModel(
+        config=bert_config, is_training=False, input_ids=input_ids)
+    if init_checkpoint:
+      (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+          tf.trainable_variables(), init_checkpoint)
+      tf.train.init_from_checkpoint(init_checkpoint, assignment_map)
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      for _ in range(FLAGS.num_warmup_steps):
+        sess.run(model.get_pooled_output())
+      start_time = time.time()
+      for _ in range(FLAGS.num_steps):
+        sess.run(model.get_pooled_output())
+      return (time.time() - start_time) / FLAGS.num_steps
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+  if FLAGS.init_checkpoint and not FLAGS.output_dir:
+    raise ValueError("The factorized checkpoints are written to `output_dir`.")
+  batches = None
+  if FLAGS.eval_file and FLAGS.init_checkpoint:
+    batches = list(
+        feature_reader.read_feature_batches(
+            FLAGS.eval_file,
+            FLAGS.batch_size,
+            max_examples=FLAGS.num_eval_examples))
+
+  results = []
+  for rank in [int(x) for x in FLAGS.ranks.split(",")]:
+    config = bert_config
+    checkpoint = FLAGS.init_checkpoint
+    if rank and checkpoint:
+      checkpoint = os.path.join(FLAGS.output_dir, "rank_%d" % rank,
+                                "model.ckpt")
+      (config, _) = factorize_checkpoint.factorize_checkpoint(
+          bert_config, FLAGS.init_checkpoint, checkpoint,
+          FLAGS.error_budget, rank=rank)
+    elif rank:
+      config = modeling.BertConfig.from_dict(bert_config.to_dict())
+      config.ffn_ranks_per_layer = [[rank, rank]] * config.num_hidden_layers
+
+    seconds_per_batch = time_inference(config, checkpoint)
+    accuracy = None
+    if batches:
+      (_, accuracy) = factorize_checkpoint.evaluate_checkpoint(
+          config, checkpoint, batches)
+    results.append((rank, factorize_checkpoint.get_num_ffn_parameters(config),
+                    seconds_per_batch, accuracy))
+
+  tf.logging.info("***** Low-rank benchmark *****")
+  tf.logging.info("  batch_size = %d, seq_length = %d", FLAGS.batch_size,
+                  FLAGS.max_seq_length)
+  for (rank, num_parameters, seconds_per_batch, accuracy) in results:
+    tf.logging.info(
+        "  rank %4d: %10d feed-forward parameters, %8.1f ms/batch%s",
+        rank, num_parameters, 1000.0 * seconds_per_batch,
+        "" if accuracy is None else ", dev accuracy %.4f" % accuracy)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("bert_config_file")
+  tf.app.run()
@@ -0,0 +1,109 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures training memory and speed with and without recomputation.
+
+Runs training steps of `BertModel` on random inputs and reports the peak
+resident memory of the process and the training throughput. The peak is per
+process, so compare settings with one run each, e.g.
+
+  for n in 0 1 2 4; do
+    python benchmark_recompute.py --bert_config_file=... \\
+      --recompute_every_n_layers=$n
+  done
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import resource
+import time
+
+import modeling
+import numpy as np
+import optimization
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    "bert_config_file", None,
+    "The config json file corresponding to the pre-trained BERT model.")
+
+flags.DEFINE_integer(
+    "recompute_every_n_layers", 0,
+    "Overrides `recompute_every_n_layers` of the config. 0 disables "
+    "recomputation.")
+
+flags.DEFINE_integer("batch_size", 4, "Batch size.")
+
+flags.DEFINE_integer("seq_length", 512, "Sequence length.")
+
+flags.DEFINE_integer("num_warmup_steps", 1,
+                     "Number of steps to run before timing.")
+
+flags.DEFINE_integer("num_steps", 5, "Number of timed steps.")
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+  bert_config.recompute_every_n_layers = FLAGS.recompute_every_n_layers
+
+  rng = np.random.RandomState(12345)
+  input_ids = tf.constant(
+      rng.randint(
+          bert_config.vocab_size, size=[FLAGS.batch_size, FLAGS.seq_length]),
+      dtype=tf.int32)
+  model = modeling.BertModel(
+      config=bert_config, is_training=True, input_ids=input_ids)
+
+  # A stand-in for a task loss that depends on every position.
+  loss = tf.reduce_mean(tf.square(model.get_sequence_output()))
+  train_op = optimization.create_optimizer(
+      loss,
+      init_lr=1e-5,
+      num_train_steps=FLAGS.num_warmup_steps + FLAGS.num_steps,
+      num_warmup_steps=0,
+      use_tpu=False)
+
+  with tf.Session() as sess:
+    sess.run(tf.global_variables_initializer())
+    for _ in range(FLAGS.num_warmup_steps):
+      sess.run(train_op)
+
+    start_time = time.time()
+    for _ in range(FLAGS.num_steps):
+      sess.run(train_op)
+    elapsed = time.time() - start_time
+
+  # `ru_maxrss` is in kilobytes on Linux.
+  peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+  tf.logging.info("***** Recompute benchmark *****")
+  tf.logging.info("  recompute_every_n_layers = %d",
+                  FLAGS.recompute_every_n_layers)
+  tf.logging.info("  batch_size = %d, seq_length = %d", FLAGS.batch_size,
+                  FLAGS.seq_length)
+  tf.logging.info("  peak resident memory = %.0f MB", peak_rss)
+  tf.logging.info("  %.2f s/step, %.2f examples/s", elapsed / FLAGS.num_steps,
+                  FLAGS.batch_size * FLAGS.num_steps / elapsed)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("bert_config_file")
+  tf.app.run()
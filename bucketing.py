@@ -0,0 +1,140 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sequence-length bucketing for the fine-tuning input pipelines.
+
+Features are written padded to `max_seq_length`. Running the model at that
+length spends most of the attention FLOPs on padding when inputs are short.
+The functions here batch examples so that every batch is trimmed to the
+shortest of a few bucket lengths that still holds all of its real tokens.
+
+Padding positions are masked out of attention, so trimming them does not
+change the outputs at the real positions.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+
+def parse_seq_length_buckets(buckets_string, max_seq_length):
+  """Parses a comma-separated list of bucket lengths.
+
+  Args:
+    buckets_string: String such as "32,64". May be empty.
+    max_seq_length: int. The length the features were padded to. It is always
+      the last bucket.
+
+  Returns:
+    A sorted list of distinct ints ending with `max_seq_length`, or None if
+    `buckets_string` is empty.
+
+  Raises:
+    ValueError: A bucket is not in [1, max_seq_length].
+  """
+  if not buckets_string:
+    return None
+
+  buckets = set([max_seq_length])
+  for x in buckets_string.split(","):
+    bucket = int(x)
+    if bucket < 1 or bucket > max_seq_length:
+      raise ValueError(
+          "Sequence length bucket %d is not in [1, max_seq_length=%d]." %
+          (bucket, max_seq_length))
+    buckets.add(bucket)
+  return sorted(buckets)
+
+
+def get_bucket_length(length, seq_length_buckets):
+  """Returns the smallest bucket that is >= `length`, as an int32 Tensor."""
+  buckets = tf.constant(seq_length_buckets, dtype=tf.int32)
+  index = tf.reduce_sum(tf.to_int32(tf.less(buckets, length)))
+  index = tf.minimum(index, len(seq_length_buckets) - 1)
+  return buckets[index]
+
+
+def trim_batch_to_bucket(features, seq_length_buckets, sequence_feature_names,
+                         mask_feature_name="input_mask"):
+  """Trims the sequence features of a batch to its bucket length.
+
+  Args:
+    features: dict of batched Tensors.
+    seq_length_buckets: Sorted list of bucket lengths, as returned by
+      `parse_seq_length_buckets`.
+    sequence_feature_names: Names of the [batch_size, length] features to
+      trim. A feature that is shorter than `max_seq_length` by some offset
+      (e.g. per-token labels that skip [CLS]) is trimmed to the bucket length
+      minus the same offset.
+    mask_feature_name: Name of the [batch_size, max_seq_length] feature with 1
+      for real tokens and 0 for padding.
+
+  Returns:
+    A dict like `features` with the sequence features trimmed.
+  """
+  max_seq_length = seq_length_buckets[-1]
+  lengths = tf.reduce_sum(features[mask_feature_name], axis=1)
+  bucket_length = get_bucket_length(
+      tf.reduce_max(lengths), seq_length_buckets)
+
+  output = dict(features)
+  for name in sequence_feature_names:
+    offset = max_seq_length - features[name].shape.as_list()[1]
+    output[name] = features[name][:, :bucket_length - offset]
+  return output
+
+
+def batch_by_sequence_length(dataset, batch_size, seq_length_buckets,
+                             sequence_feature_names, group_by_length,
+                             drop_remainder, mask_feature_name="input_mask"):
+  """Batches a dataset of decoded examples into bucket-trimmed batches.
+
+  Args:
+    dataset: `tf.data.Dataset` of dicts of unbatched example Tensors.
+    batch_size: int. The batch size.
+    seq_length_buckets: Sorted list of bucket lengths, as returned by
+      `parse_seq_length_buckets`.
+    sequence_feature_names: See `trim_batch_to_bucket`.
+    group_by_length: bool. If True, examples are grouped so that each batch
+      only holds examples of the same bucket. This reorders the examples, so
+      it should only be used for training. If False, the order is kept and
+      each batch runs at the bucket of its longest example.
+    drop_remainder: bool. Whether to drop the last, smaller batch (of each
+      bucket, if `group_by_length` is True).
+    mask_feature_name: See `trim_batch_to_bucket`.
+
+  Returns:
+    A `tf.data.Dataset` of batches.
+  """
+  if group_by_length:
+
+    def key_func(example):
+      length = tf.reduce_sum(example[mask_feature_name])
+      bucket_length = get_bucket_length(length, seq_length_buckets)
+      return tf.to_int64(bucket_length)
+
+    def reduce_func(unused_key, window):
+      return window.batch(batch_size, drop_remainder=drop_remainder)
+
+    dataset = dataset.apply(
+        tf.contrib.data.group_by_window(
+            key_func=key_func, reduce_func=reduce_func,
+            window_size=batch_size))
+  else:
+    dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+
+  return dataset.map(lambda features: trim_batch_to_bucket(
+      features, seq_length_buckets, sequence_feature_names, mask_feature_name))
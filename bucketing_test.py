@@ -0,0 +1,85 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bucketing
+import tensorflow as tf
+
+
+class BucketingTest(tf.test.TestCase):
+
+  def make_dataset(self, lengths, max_seq_length):
+    input_mask = [[1] * x + [0] * (max_seq_length - x) for x in lengths]
+    # Per-token labels that skip the first position.
+    label_ids = [[x] * (max_seq_length - 1) for x in lengths]
+    return tf.data.Dataset.from_tensor_slices({
+        "input_mask": tf.constant(input_mask, dtype=tf.int32),
+        "label_ids": tf.constant(label_ids, dtype=tf.int32),
+    })
+
+  def read_batches(self, dataset):
+    next_batch = dataset.make_one_shot_iterator().get_next()
+    batches = []
+    with self.test_session() as sess:
+      while True:
+        try:
+          batches.append(sess.run(next_batch))
+        except tf.errors.OutOfRangeError:
+          return batches
+
+  def test_parse_seq_length_buckets(self):
+    self.assertIsNone(bucketing.parse_seq_length_buckets("", 128))
+    self.assertEqual(
+        bucketing.parse_seq_length_buckets("64,32,64", 128), [32, 64, 128])
+    with self.assertRaises(ValueError):
+      bucketing.parse_seq_length_buckets("256", 128)
+
+  def test_batch_by_sequence_length(self):
+    dataset = bucketing.batch_by_sequence_length(
+        self.make_dataset([3, 2, 7, 4, 1], max_seq_length=8),
+        batch_size=2,
+        seq_length_buckets=[2, 4, 8],
+        sequence_feature_names=["input_mask", "label_ids"],
+        group_by_length=False,
+        drop_remainder=False)
+    batches = self.read_batches(dataset)
+
+    self.assertEqual([x["input_mask"].shape for x in batches],
+                     [(2, 4), (2, 8), (1, 2)])
+    self.assertAllEqual(batches[0]["label_ids"], [[3, 3, 3], [2, 2, 2]])
+    self.assertAllEqual(batches[2]["input_mask"], [[1, 0]])
+
+  def test_batch_by_sequence_length_grouped(self):
+    dataset = bucketing.batch_by_sequence_length(
+        self.make_dataset([3, 2, 7, 4, 1, 8], max_seq_length=8),
+        batch_size=2,
+        seq_length_buckets=[2, 4, 8],
+        sequence_feature_names=["input_mask", "label_ids"],
+        group_by_length=True,
+        drop_remainder=True)
+    batches = self.read_batches(dataset)
+
+    lengths = sorted(
+        sorted(x["label_ids"][:, 0].tolist()) for x in batches)
+    self.assertEqual(lengths, [[1, 2], [3, 4], [7, 8]])
+    for batch in batches:
+      self.assertEqual(batch["input_mask"].shape[1],
+                       batch["label_ids"].shape[1] + 1)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,50 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compile a BERT vocab file into a binary snapshot for fast loading."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tokenization
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string("vocab_file", None,
+                    "The vocabulary file that the BERT model was trained on.")
+
+flags.DEFINE_string(
+    "output_file", None,
+    "Where to write the snapshot. Pass it to the other scripts with "
+    "--vocab_snapshot_file.")
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  tokenization.write_vocab_snapshot(FLAGS.vocab_file, FLAGS.output_file)
+  vocab = tokenization.Vocab.from_snapshot(
+      FLAGS.output_file, vocab_file=FLAGS.vocab_file)
+  tf.logging.info("Wrote a snapshot of %d tokens to %s", len(vocab),
+                  FLAGS.output_file)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("vocab_file")
+  flags.mark_flag_as_required("output_file")
+  tf.app.run()
@@ -42,6 +42,24 @@ flags.DEFINE_bool(
     "Whether to lower case the input text. Should be True for uncased "
     "models and False for cased models.")
 
+flags.DEFINE_integer(
+    "tokenizer_cache_size", 0,
+    "If > 0, the tokenizer keeps the WordPiece output of up to this many "
+    "distinct words in an LRU cache. Frequent words then skip the WordPiece "
+    "search entirely.")
+
+flags.DEFINE_string(
+    "vocab_snapshot_file", None,
+    "Optional snapshot of `vocab_file` written by compile_vocab_snapshot.py. "
+    "If set, the vocab is loaded from it instead of parsing `vocab_file`; a "
+    "snapshot that does not match `vocab_file` is rejected.")
+
+flags.DEFINE_bool(
+    "input_is_token_id_shards", False,
+    "Whether `input_file` lists token id shards written by "
+    "tokenize_corpus.py rather than raw text. The shards must have been "
+    "written with the same vocab.")
+
 flags.DEFINE_bool(
     "do_whole_word_mask", False,
     "Whether to use whole word masking rather than per-WordPiece masking.")
@@ -178,8 +196,30 @@ def create_float_feature(values):
 
 def create_training_instances(input_files, tokenizer, max_seq_length,
                               dupe_factor, short_seq_prob, masked_lm_prob,
-                              max_predictions_per_seq, rng):
-  """Create `TrainingInstance`s from raw text."""
+                              max_predictions_per_seq, rng,
+                              input_is_token_id_shards=False):
+  """Create `TrainingInstance`s from raw text or token id shards."""
+  if input_is_token_id_shards:
+    all_documents = read_documents_from_token_id_shards(input_files, tokenizer)
+  else:
+    all_documents = read_documents_from_text(input_files, tokenizer)
+  rng.shuffle(all_documents)
+
+  vocab_words = list(tokenizer.vocab.keys())
+  instances = []
+  for _ in range(dupe_factor):
+    for document_index in range(len(all_documents)):
+      instances.extend(
+          create_instances_from_document(
+              all_documents, document_index, max_seq_length, short_seq_prob,
+              masked_lm_prob, max_predictions_per_seq, vocab_words, rng))
+
+  rng.shuffle(instances)
+  return instances
+
+
+def read_documents_from_text(input_files, tokenizer):
+  """Tokenizes raw text files into a list of documents."""
   all_documents = [[]]
 
   # Input file format:
@@ -205,19 +245,29 @@ def create_training_instances(input_files, tokenizer, max_seq_length,
 
   # Remove empty documents
   all_documents = [x for x in all_documents if x]
-  rng.shuffle(all_documents)
-
-  vocab_words = list(tokenizer.vocab.keys())
-  instances = []
-  for _ in range(dupe_factor):
-    for document_index in range(len(all_documents)):
-      instances.extend(
-          create_instances_from_document(
-              all_documents, document_index, max_seq_length, short_seq_prob,
-              masked_lm_prob, max_predictions_per_seq, vocab_words, rng))
-
-  rng.shuffle(instances)
-  return instances
+  return all_documents
+
+
+def read_documents_from_token_id_shards(shard_files, tokenizer):
+  """Reads the documents of shards written by `tokenize_corpus.py`.
+
+  The result is the same as `read_documents_from_text` on the text the shards
+  were written from, without tokenizing it again.
+  """
+  vocab_size = len(tokenizer.vocab)
+  all_documents = []
+  for shard_file in shard_files:
+    shard = tokenization.TokenIdShard(shard_file)
+    if shard.vocab_size != vocab_size:
+      raise ValueError(
+          "The token id shard `%s` was written with a vocab of %d tokens, but "
+          "the vocab has %d." % (shard_file, shard.vocab_size, vocab_size))
+    for doc_index in range(shard.num_documents):
+      all_documents.append([
+          tokenizer.convert_ids_to_tokens(ids.tolist())
+          for ids in shard.get_document(doc_index)
+      ])
+  return all_documents
 
 
 def create_instances_from_document(
@@ -437,7 +487,9 @@ def main(_):
   tf.logging.set_verbosity(tf.logging.INFO)
 
   tokenizer = tokenization.FullTokenizer(
-      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case)
+      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case,
+      cache_size=FLAGS.tokenizer_cache_size,
+      snapshot_file=FLAGS.vocab_snapshot_file)
 
   input_files = []
   for input_pattern in FLAGS.input_file.split(","):
@@ -451,7 +503,13 @@ def main(_):
   instances = create_training_instances(
       input_files, tokenizer, FLAGS.max_seq_length, FLAGS.dupe_factor,
       FLAGS.short_seq_prob, FLAGS.masked_lm_prob, FLAGS.max_predictions_per_seq,
-      rng)
+      rng, input_is_token_id_shards=FLAGS.input_is_token_id_shards)
+
+  cache_stats = tokenizer.get_cache_stats()
+  if cache_stats is not None:
+    tf.logging.info("*** Tokenizer cache ***")
+    for key in sorted(cache_stats.keys()):
+      tf.logging.info("  %s = %s", key, cache_stats[key])
 
   output_files = FLAGS.output_file.split(",")
   tf.logging.info("*** Writing to output files ***")
@@ -21,6 +21,7 @@ from __future__ import print_function
 import codecs
 import collections
 import json
+import os
 import re
 
 import modeling
@@ -60,6 +61,18 @@ flags.DEFINE_bool(
     "Whether to lower case the input text. Should be True for uncased "
     "models and False for cased models.")
 
+flags.DEFINE_integer(
+    "tokenizer_cache_size", 0,
+    "If > 0, the tokenizer keeps the WordPiece output of up to this many "
+    "distinct words in an LRU cache. Frequent words then skip the WordPiece "
+    "search entirely.")
+
+flags.DEFINE_string(
+    "vocab_snapshot_file", None,
+    "Optional snapshot of `vocab_file` written by compile_vocab_snapshot.py. "
+    "If set, the vocab is loaded from it instead of parsing `vocab_file`; a "
+    "snapshot that does not match `vocab_file` is rejected.")
+
 flags.DEFINE_integer("batch_size", 32, "Batch size for predictions.")
 
 flags.DEFINE_bool("use_tpu", False, "Whether to use TPU or GPU/CPU.")
@@ -348,7 +361,9 @@ def main(_):
   bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
 
   tokenizer = tokenization.FullTokenizer(
-      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case)
+      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case,
+      cache_size=FLAGS.tokenizer_cache_size,
+      snapshot_file=FLAGS.vocab_snapshot_file)
 
   is_per_host = tf.contrib.tpu.InputPipelineConfig.PER_HOST_V2
   run_config = tf.contrib.tpu.RunConfig(
@@ -366,9 +381,12 @@ def main(_):
   for feature in features:
     unique_id_to_feature[feature.unique_id] = feature
 
+  init_checkpoint = modeling.maybe_fuse_qkv_checkpoint(
+      bert_config, FLAGS.init_checkpoint, os.path.dirname(FLAGS.output_file))
+
   model_fn = model_fn_builder(
       bert_config=bert_config,
-      init_checkpoint=FLAGS.init_checkpoint,
+      init_checkpoint=init_checkpoint,
       layer_indexes=layer_indexes,
       use_tpu=FLAGS.use_tpu,
       use_one_hot_embeddings=FLAGS.use_one_hot_embeddings)
@@ -0,0 +1,237 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Low-rank factorization of the feed-forward kernels of a checkpoint.
+
+Replaces the "intermediate" and "output" dense kernels of every encoder layer
+by their truncated SVD, W ~= U_r diag(s_r) V_r^T, stored as the two thin
+kernels "kernel_u" = U_r diag(sqrt(s_r)) and "kernel_v" = diag(sqrt(s_r))
+V_r^T that `modeling.low_rank_dense` multiplies. The rank of each kernel is
+the smallest one whose relative reconstruction error ||W - U_r diag(s_r)
+V_r^T|| / ||W|| (Frobenius) is within `error_budget`. Kernels that would not
+get smaller stay whole. Writes the factorized checkpoint (model.ckpt) and the
+matching `bert_config.json`, which sets `ffn_ranks_per_layer`.
+
+Uses the flags of `prune_checkpoint.py`; with an `eval_file`, the dev loss
+and accuracy of a fine-tuned checkpoint are reported before and after.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+
+import feature_reader
+import modeling
+import numpy as np
+import prune_checkpoint
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_float(
+    "error_budget", 0.1,
+    "The largest relative (Frobenius) reconstruction error allowed for each "
+    "factorized kernel.")
+
+flags.DEFINE_integer(
+    "rank", None,
+    "If set, every feed-forward kernel is factorized to this rank instead of "
+    "the one chosen by `error_budget`.")
+
+# The factorized kernels, under "bert/encoder/layer_%d/".
+FFN_KERNELS = ("intermediate/dense/kernel", "output/dense/kernel")
+
+
+def choose_rank(singular_values, error_budget):
+  """Returns the smallest rank within a relative reconstruction error.
+
+  Args:
+    singular_values: Array of the singular values of a kernel, in decreasing
+      order.
+    error_budget: float. The largest relative Frobenius error.
+
+  Returns:
+    int. The rank, at least 1 and at most the number of singular values.
+  """
+  squares = np.square(singular_values.astype(np.float64))
+  # `tail_errors[r]` is the relative error of keeping the first r values.
+  tail_errors = np.sqrt(
+      np.append(np.cumsum(squares[::-1])[::-1], 0.0) / np.sum(squares))
+  return max(int(np.nonzero(tail_errors <= error_budget)[0][0]), 1)
+
+
+def factorize_kernel(kernel, rank):
+  """Returns the ("kernel_u", "kernel_v") factors of `kernel` at `rank`."""
+  (u, s, vt) = np.linalg.svd(kernel.astype(np.float64), full_matrices=False)
+  sqrt_s = np.sqrt(s[:rank])
+  kernel_u = u[:, :rank] * sqrt_s
+  kernel_v = sqrt_s[:, np.newaxis] * vt[:rank]
+  return (kernel_u.astype(kernel.dtype), kernel_v.astype(kernel.dtype))
+
+
+def factorize_checkpoint(bert_config, init_checkpoint, output_checkpoint,
+                         error_budget, rank=None):
+  """Writes a checkpoint with factorized feed-forward kernels.
+
+  Args:
+    bert_config: `BertConfig` of `init_checkpoint`, without
+      `ffn_ranks_per_layer`.
+    init_checkpoint: The checkpoint to factorize.
+    output_checkpoint: Where to write the factorized checkpoint.
+    error_budget: float. The largest relative Frobenius error of a kernel.
+    rank: (optional) int. If set, all kernels are factorized to this rank
+      (at most their smaller dimension) regardless of `error_budget`.
+
+  Returns:
+    (factorized_config, errors): The `BertConfig` of the factorized
+    checkpoint and a list with the [intermediate, output] relative
+    reconstruction errors of each layer.
+
+  Raises:
+    ValueError: If the checkpoint is already factorized or its feed-forward
+      kernels are shared across layers.
+  """
+  if bert_config.ffn_ranks_per_layer:
+    raise ValueError("%s already has factorized feed-forward kernels" %
+                     init_checkpoint)
+  if bert_config.share_ffn_across_layers:
+    raise ValueError("Cannot factorize feed-forward kernels that are shared "
+                     "across layers.")
+
+  reader = tf.train.load_checkpoint(init_checkpoint)
+  factorized = {}
+  ranks = []
+  errors = []
+  for layer_idx in range(bert_config.num_hidden_layers):
+    layer_ranks = []
+    layer_errors = []
+    for name in FFN_KERNELS:
+      full_name = "bert/encoder/layer_%d/%s" % (layer_idx, name)
+      kernel = reader.get_tensor(full_name)
+      (num_rows, num_columns) = kernel.shape
+      singular_values = np.linalg.svd(kernel, compute_uv=False)
+      if rank is None:
+        kernel_rank = choose_rank(singular_values, error_budget)
+        if kernel_rank * (num_rows + num_columns) >= num_rows * num_columns:
+          # The factors would not be smaller than the kernel.
+          kernel_rank = 0
+      else:
+        kernel_rank = min(rank, num_rows, num_columns)
+      layer_ranks.append(kernel_rank)
+      layer_errors.append(0.0)
+      if kernel_rank:
+        factorized[full_name] = factorize_kernel(kernel, kernel_rank)
+        layer_errors[-1] = float(
+            np.sqrt(np.sum(np.square(singular_values[kernel_rank:]))) /
+            np.sqrt(np.sum(np.square(singular_values))))
+    ranks.append(layer_ranks)
+    errors.append(layer_errors)
+
+  values = {}
+  for name in sorted(reader.get_variable_to_shape_map()):
+    variable_name = name
+    for suffix in ("/adam_m", "/adam_v"):
+      if name.endswith(suffix):
+        variable_name = name[:-len(suffix)]
+    if variable_name in factorized:
+      # The optimizer slots of a factorized kernel have no counterpart.
+      if variable_name == name:
+        (values[name + "_u"], values[name + "_v"]) = factorized[name]
+      continue
+    values[name] = reader.get_tensor(name)
+  modeling.write_checkpoint(values, output_checkpoint)
+
+  factorized_config = copy.deepcopy(bert_config)
+  factorized_config.ffn_ranks_per_layer = ranks
+  return (factorized_config, errors)
+
+
+def get_num_ffn_parameters(bert_config):
+  """Returns the number of feed-forward kernel parameters of the encoder."""
+  (_, intermediate_size_per_layer) = prune_checkpoint.get_layer_sizes(
+      bert_config)
+  ranks = (bert_config.ffn_ranks_per_layer or
+           [[0, 0]] * bert_config.num_hidden_layers)
+  total = 0
+  for (intermediate_size, layer_ranks) in zip(intermediate_size_per_layer,
+                                              ranks):
+    for kernel_rank in layer_ranks:
+      if kernel_rank:
+        total += kernel_rank * (bert_config.hidden_size + intermediate_size)
+      else:
+        total += bert_config.hidden_size * intermediate_size
+  return total
+
+
+def evaluate_checkpoint(bert_config, init_checkpoint, batches):
+  """Returns the dev (loss, accuracy) of a fine-tuned checkpoint."""
+  with tf.Graph().as_default():
+    task_graph = prune_checkpoint.TaskGraph(bert_config, init_checkpoint,
+                                            FLAGS.max_seq_length)
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      return prune_checkpoint.evaluate(task_graph, sess, batches)
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+
+  tf.gfile.MakeDirs(FLAGS.output_dir)
+  output_checkpoint = os.path.join(FLAGS.output_dir, "model.ckpt")
+  (factorized_config, errors) = factorize_checkpoint(
+      bert_config, FLAGS.init_checkpoint, output_checkpoint,
+      FLAGS.error_budget, FLAGS.rank)
+  output_config_file = os.path.join(FLAGS.output_dir, "bert_config.json")
+  with tf.gfile.GFile(output_config_file, "w") as writer:
+    writer.write(factorized_config.to_json_string())
+
+  tf.logging.info("***** Factorization results *****")
+  tf.logging.info("  Wrote %s and %s", output_checkpoint, output_config_file)
+  for (layer_idx, (layer_ranks, layer_errors)) in enumerate(
+      zip(factorized_config.ffn_ranks_per_layer, errors)):
+    tf.logging.info(
+        "  layer %d: intermediate rank %d (error %.4f), output rank %d "
+        "(error %.4f)", layer_idx, layer_ranks[0], layer_errors[0],
+        layer_ranks[1], layer_errors[1])
+  tf.logging.info("  feed-forward kernel parameters: %d -> %d",
+                  get_num_ffn_parameters(bert_config),
+                  get_num_ffn_parameters(factorized_config))
+
+  if FLAGS.eval_file:
+    batches = list(
+        feature_reader.read_feature_batches(
+            FLAGS.eval_file,
+            FLAGS.batch_size,
+            max_examples=FLAGS.num_eval_examples))
+    (loss, accuracy) = evaluate_checkpoint(bert_config, FLAGS.init_checkpoint,
+                                           batches)
+    (factorized_loss, factorized_accuracy) = evaluate_checkpoint(
+        factorized_config, output_checkpoint, batches)
+    tf.logging.info("  dev loss: %.4f -> %.4f", loss, factorized_loss)
+    tf.logging.info("  dev accuracy: %.4f -> %.4f", accuracy,
+                    factorized_accuracy)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("bert_config_file")
+  flags.mark_flag_as_required("init_checkpoint")
+  flags.mark_flag_as_required("output_dir")
+  tf.app.run()
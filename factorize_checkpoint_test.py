@@ -0,0 +1,119 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import factorize_checkpoint
+import modeling
+import numpy as np
+import tensorflow as tf
+
+
+class FactorizeCheckpointTest(tf.test.TestCase):
+
+  def get_config(self):
+    return modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=37)
+
+  def create_checkpoint(self, bert_config):
+    """Writes a randomly initialized checkpoint with an optimizer slot."""
+    checkpoint = os.path.join(self.get_temp_dir(), "model.ckpt")
+    with tf.Graph().as_default():
+      modeling.BertModel(
+          config=bert_config,
+          is_training=False,
+          input_ids=tf.zeros([1, 4], dtype=tf.int32))
+      tf.get_variable("bert/encoder/layer_0/output/dense/kernel/adam_m",
+                      [bert_config.intermediate_size, bert_config.hidden_size])
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, checkpoint)
+    return checkpoint
+
+  def run_model(self, bert_config, init_checkpoint, input_ids):
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=bert_config,
+          is_training=False,
+          input_ids=tf.constant(input_ids))
+      with tf.Session() as sess:
+        tf.train.Saver().restore(sess, init_checkpoint)
+        return sess.run(model.get_sequence_output())
+
+  def test_choose_rank(self):
+    singular_values = np.array([4.0, 2.0, 1.0, 0.0])
+    # The relative errors of ranks 0 to 4 are 1, sqrt(5/21), sqrt(1/21), 0, 0.
+    self.assertEqual(factorize_checkpoint.choose_rank(singular_values, 0.5), 1)
+    self.assertEqual(factorize_checkpoint.choose_rank(singular_values, 0.4), 2)
+    self.assertEqual(factorize_checkpoint.choose_rank(singular_values, 0.0), 3)
+    self.assertEqual(factorize_checkpoint.choose_rank(singular_values, 1.0), 1)
+
+  def test_factorize_kernel(self):
+    kernel = np.random.RandomState(0).randn(6, 4).astype(np.float32)
+    (kernel_u, kernel_v) = factorize_checkpoint.factorize_kernel(kernel, 4)
+    self.assertAllEqual(kernel_u.shape, [6, 4])
+    self.assertAllEqual(kernel_v.shape, [4, 4])
+    self.assertAllClose(np.dot(kernel_u, kernel_v), kernel, atol=1e-5)
+
+  def test_factorize_checkpoint(self):
+    bert_config = self.get_config()
+    init_checkpoint = self.create_checkpoint(bert_config)
+    input_ids = [[31, 51, 98, 3, 7], [15, 5, 9, 0, 1]]
+    expected = self.run_model(bert_config, init_checkpoint, input_ids)
+
+    # At full rank the factorized model computes the same function.
+    full_rank_checkpoint = os.path.join(self.get_temp_dir(), "full.ckpt")
+    (factorized_config, errors) = factorize_checkpoint.factorize_checkpoint(
+        bert_config, init_checkpoint, full_rank_checkpoint, 0.0, rank=100)
+    self.assertEqual(factorized_config.ffn_ranks_per_layer,
+                     [[32, 32], [32, 32]])
+    self.assertAllClose(errors, [[0.0, 0.0], [0.0, 0.0]], atol=1e-6)
+    self.assertAllClose(
+        self.run_model(factorized_config, full_rank_checkpoint, input_ids),
+        expected,
+        atol=1e-4)
+    variable_names = [x for (x, _) in tf.train.list_variables(
+        full_rank_checkpoint)]
+    self.assertIn("bert/encoder/layer_0/output/dense/kernel_u", variable_names)
+    self.assertNotIn("bert/encoder/layer_0/output/dense/kernel",
+                     variable_names)
+    self.assertNotIn("bert/encoder/layer_0/output/dense/kernel/adam_m",
+                     variable_names)
+
+    # A random kernel has a flat spectrum, so a loose budget is needed for
+    # the factors to be smaller than the kernel.
+    budget_checkpoint = os.path.join(self.get_temp_dir(), "budget.ckpt")
+    (factorized_config, errors) = factorize_checkpoint.factorize_checkpoint(
+        bert_config, init_checkpoint, budget_checkpoint, 0.5)
+    for (layer_ranks, layer_errors) in zip(
+        factorized_config.ffn_ranks_per_layer, errors):
+      for (rank, error) in zip(layer_ranks, layer_errors):
+        self.assertLess(rank, 32 * 37 // (32 + 37) + 1)
+        self.assertLessEqual(error, 0.5)
+    self.assertLess(
+        factorize_checkpoint.get_num_ffn_parameters(factorized_config),
+        factorize_checkpoint.get_num_ffn_parameters(bert_config))
+    self.run_model(factorized_config, budget_checkpoint, input_ids)
+
+
+if __name__ == "__main__":
+  tf.test.main()
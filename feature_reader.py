@@ -0,0 +1,80 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reads converted features into NumPy batches outside of an input_fn.
+
+The checkpoint tools (`prune_checkpoint.py`, `quantize_checkpoint.py`, ...)
+score models on the TFRecord files written by `run_classifier.py` or
+`run_pos_tagging.py` with plain `Session.run` or NumPy calls.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+
+import numpy as np
+import six
+import tensorflow as tf
+
+
+def read_feature_batches(input_file, batch_size, max_examples=None,
+                         max_seq_length=None):
+  """Yields dicts of batched int32 feature arrays from a TFRecord file.
+
+  Args:
+    input_file: TFRecord file of `tf.train.Example`s with int64 features.
+    batch_size: int. The size of every batch but possibly the last.
+    max_examples: (optional) int. Only this many examples are read.
+    max_seq_length: (optional) int. If set, the length the features must
+      have been written with.
+
+  Yields:
+    Dicts from feature name to an int32 array of shape [batch_size, length],
+    or [batch_size] for single-value features.
+
+  Raises:
+    ValueError: The "input_ids" are not `max_seq_length` long.
+  """
+  records = tf.python_io.tf_record_iterator(input_file)
+  if max_examples is not None:
+    records = itertools.islice(records, max_examples)
+
+  batch = []
+  for record in records:
+    example = tf.train.Example.FromString(record)
+    features = {}
+    for (name, feature) in six.iteritems(example.features.feature):
+      features[name] = np.array(feature.int64_list.value, dtype=np.int32)
+    if (max_seq_length is not None and
+        len(features["input_ids"]) != max_seq_length):
+      raise ValueError(
+          "%s was written with max_seq_length %d, not %d" %
+          (input_file, len(features["input_ids"]), max_seq_length))
+    batch.append(features)
+    if len(batch) == batch_size:
+      yield _stack_features(batch)
+      batch = []
+  if batch:
+    yield _stack_features(batch)
+
+
+def _stack_features(batch):
+  output = {}
+  for name in batch[0]:
+    output[name] = np.stack([x[name] for x in batch])
+    if output[name].shape[1:] == (1,):
+      output[name] = output[name][:, 0]
+  return output
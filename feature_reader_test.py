@@ -0,0 +1,58 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import feature_reader
+import tensorflow as tf
+
+
+class FeatureReaderTest(tf.test.TestCase):
+
+  def test_read_feature_batches(self):
+    input_file = os.path.join(self.get_temp_dir(), "features.tf_record")
+    with tf.python_io.TFRecordWriter(input_file) as writer:
+      for i in range(5):
+        example = tf.train.Example(
+            features=tf.train.Features(
+                feature={
+                    "input_ids":
+                        tf.train.Feature(
+                            int64_list=tf.train.Int64List(value=[i, i, 0])),
+                    "label_ids":
+                        tf.train.Feature(
+                            int64_list=tf.train.Int64List(value=[i % 2])),
+                }))
+        writer.write(example.SerializeToString())
+
+    batches = list(feature_reader.read_feature_batches(input_file, 2))
+    self.assertEqual([len(x["label_ids"]) for x in batches], [2, 2, 1])
+    self.assertAllEqual(batches[1]["input_ids"], [[2, 2, 0], [3, 3, 0]])
+    self.assertAllEqual(batches[1]["label_ids"], [0, 1])
+
+    batches = list(
+        feature_reader.read_feature_batches(
+            input_file, 2, max_examples=3, max_seq_length=3))
+    self.assertEqual([len(x["label_ids"]) for x in batches], [2, 1])
+    with self.assertRaises(ValueError):
+      list(feature_reader.read_feature_batches(input_file, 2,
+                                               max_seq_length=4))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -22,6 +22,7 @@ import collections
 import copy
 import json
 import math
+import os
 import re
 import numpy as np
 import six
@@ -42,7 +43,19 @@ class BertConfig(object):
                attention_probs_dropout_prob=0.1,
                max_position_embeddings=512,
                type_vocab_size=16,
-               initializer_range=0.02):
+               initializer_range=0.02,
+               fuse_qkv=False,
+               compute_dtype="float32",
+               recompute_every_n_layers=0,
+               attention_window=0,
+               num_global_tokens=1,
+               token_pruning_schedule=None,
+               num_attention_heads_per_layer=None,
+               intermediate_size_per_layer=None,
+               ffn_ranks_per_layer=None,
+               embedding_size=None,
+               share_attention_across_layers=False,
+               share_ffn_across_layers=False):
     """Constructs BertConfig.
 
     Args:
@@ -66,6 +79,66 @@ class BertConfig(object):
         `BertModel`.
       initializer_range: The stdev of the truncated_normal_initializer for
         initializing all weight matrices.
+      fuse_qkv: Whether self-attention computes the query, key and value
+        projections with a single matmul against one [hidden_size,
+        3 * hidden_size] kernel. Checkpoints with separate kernels can be
+        converted with `fuse_qkv_in_checkpoint`.
+      compute_dtype: The dtype the encoder runs its matmuls and activations
+        in: "float32", "bfloat16" or "float16". The variables are always
+        stored in float32, and layer normalization and the attention softmax
+        always run in float32. Training with "float16" needs loss scaling,
+        see `optimization.create_optimizer`.
+      recompute_every_n_layers: If > 0, training saves memory by recomputing
+        activations in the backward pass. The encoder layers are split into
+        blocks of this many layers, and of each block only the input and the
+        layer outputs are kept; attention probabilities and feed-forward
+        activations are recomputed from the block input when the gradients
+        are computed. This costs about one extra forward pass.
+      attention_window: If > 0, self-attention is local: each position only
+        attends to the positions at most this far away, plus to the global
+        positions, so memory grows linearly with the sequence length instead
+        of quadratically. The global positions attend to all positions. By
+        default only the first token ([CLS]) is global; see the
+        `global_attention_mask` argument of `BertModel`. The variables are the
+        same as for full attention.
+      num_global_tokens: The maximum number of global positions per sequence
+        when `attention_window` > 0. Further global positions are treated as
+        local ones.
+      token_pruning_schedule: (optional) A list of [layer, num_positions]
+        pairs, e.g. [[4, 64], [8, 32]]. The `layer`-th encoder layer (1-based)
+        keeps only the `num_positions` positions that received the most
+        attention in its self-attention, and its feed-forward network and all
+        later layers only process those. The first token ([CLS]) is always
+        kept, so the pooled output stays available; the sequence output then
+        only holds the kept positions. Not supported with `attention_window`
+        or `recompute_every_n_layers`.
+      num_attention_heads_per_layer: (optional) A list with the number of
+        attention heads of each encoder layer, e.g. after pruning heads. The
+        size of each head stays `hidden_size / num_attention_heads`.
+      intermediate_size_per_layer: (optional) A list with the intermediate
+        size of each encoder layer.
+      ffn_ranks_per_layer: (optional) A list with an [intermediate_rank,
+        output_rank] pair for each encoder layer. A rank r > 0 factorizes the
+        [hidden_size, intermediate_size] "intermediate" or the
+        [intermediate_size, hidden_size] "output" kernel of the feed-forward
+        network into two thin rank-r kernels, "kernel_u" and "kernel_v",
+        which take two small matmuls instead of one large one. 0 keeps the
+        kernel whole. See `low_rank_dense`; `factorize_checkpoint.py`
+        converts a checkpoint with a truncated SVD.
+      embedding_size: (optional) The width of the word, position and token
+        type embeddings. If it differs from `hidden_size`, the embeddings are
+        projected up to `hidden_size` by the "embeddings/
+        embedding_hidden_mapping_in" dense layer, as in ALBERT, so the
+        [vocab_size, embedding_size] word embedding table can be much smaller
+        than a [vocab_size, hidden_size] one. Defaults to `hidden_size`.
+      share_attention_across_layers: Whether all encoder layers use the
+        self-attention variables of the first layer, "layer_0/attention/",
+        as in ALBERT. Sharing divides the number of encoder parameters by up
+        to `num_hidden_layers` but not the compute. Not supported with
+        `recompute_every_n_layers`.
+      share_ffn_across_layers: Whether all encoder layers use the
+        feed-forward variables of the first layer, "layer_0/intermediate/"
+        and "layer_0/output/". Not supported with `recompute_every_n_layers`.
     """
     self.vocab_size = vocab_size
     self.hidden_size = hidden_size
@@ -78,6 +151,18 @@ class BertConfig(object):
     self.max_position_embeddings = max_position_embeddings
     self.type_vocab_size = type_vocab_size
     self.initializer_range = initializer_range
+    self.fuse_qkv = fuse_qkv
+    self.compute_dtype = compute_dtype
+    self.recompute_every_n_layers = recompute_every_n_layers
+    self.attention_window = attention_window
+    self.num_global_tokens = num_global_tokens
+    self.token_pruning_schedule = token_pruning_schedule
+    self.num_attention_heads_per_layer = num_attention_heads_per_layer
+    self.intermediate_size_per_layer = intermediate_size_per_layer
+    self.ffn_ranks_per_layer = ffn_ranks_per_layer
+    self.embedding_size = embedding_size
+    self.share_attention_across_layers = share_attention_across_layers
+    self.share_ffn_across_layers = share_ffn_across_layers
 
   @classmethod
   def from_dict(cls, json_object):
@@ -135,7 +220,10 @@ class BertModel(object):
                input_mask=None,
                token_type_ids=None,
                use_one_hot_embeddings=False,
-               scope=None):
+               scope=None,
+               global_attention_mask=None,
+               pooled_output_only=False,
+               num_layers_to_run=None):
     """Constructor for BertModel.
 
     Args:
@@ -148,6 +236,19 @@ class BertModel(object):
       use_one_hot_embeddings: (optional) bool. Whether to use one-hot word
         embeddings or tf.embedding_lookup() for the word embeddings.
       scope: (optional) variable scope. Defaults to "bert".
+      global_attention_mask: (optional) int32 Tensor of shape [batch_size,
+        seq_length], with 1 for the positions that attend to and are attended
+        from all positions when `config.attention_window` > 0, e.g. the
+        question tokens for SQuAD. Defaults to the first token only.
+      pooled_output_only: (optional) bool. If True, the final encoder layer
+        only computes the first token, which is all the pooled output needs.
+        This saves most of the compute of one layer when only
+        `get_pooled_output` is used. `get_sequence_output` and the last
+        entry of `get_all_encoder_layers` then only hold the first token.
+      num_layers_to_run: (optional) int. If set, only the first this many
+        encoder layers are run and the outputs of the model are those of the
+        last of them. The remaining layers can be run later with
+        `run_encoder_layers`, e.g. on fewer examples.
 
     Raises:
       ValueError: The config is invalid or one of the input tensor shapes
@@ -157,6 +258,7 @@ class BertModel(object):
     if not is_training:
       config.hidden_dropout_prob = 0.0
       config.attention_probs_dropout_prob = 0.0
+      config.recompute_every_n_layers = 0
 
     input_shape = get_shape_list(input_ids, expected_rank=2)
     batch_size = input_shape[0]
@@ -168,13 +270,20 @@ class BertModel(object):
     if token_type_ids is None:
       token_type_ids = tf.zeros(shape=[batch_size, seq_length], dtype=tf.int32)
 
+    if config.attention_window and global_attention_mask is None:
+      global_attention_mask = create_first_token_mask(input_ids)
+
+    self.config = config
+    self.compute_dtype = get_compute_dtype(config)
+    embedding_size = get_embedding_size(config)
+
     with tf.variable_scope(scope, default_name="bert"):
       with tf.variable_scope("embeddings"):
         # Perform embedding lookup on the word ids.
         (self.embedding_output, self.embedding_table) = embedding_lookup(
             input_ids=input_ids,
             vocab_size=config.vocab_size,
-            embedding_size=config.hidden_size,
+            embedding_size=embedding_size,
             initializer_range=config.initializer_range,
             word_embedding_name="word_embeddings",
             use_one_hot_embeddings=use_one_hot_embeddings)
@@ -193,27 +302,37 @@ class BertModel(object):
             max_position_embeddings=config.max_position_embeddings,
             dropout_prob=config.hidden_dropout_prob)
 
-      with tf.variable_scope("encoder"):
+        if embedding_size != config.hidden_size:
+          self.embedding_output = tf.layers.dense(
+              self.embedding_output,
+              config.hidden_size,
+              name="embedding_hidden_mapping_in",
+              kernel_initializer=create_initializer(config.initializer_range))
+
+      # The embeddings are looked up in float32, so only the gathered rows and
+      # not the whole tables get cast to `compute_dtype`.
+      with tf.variable_scope(
+          "encoder", custom_getter=get_custom_getter(
+              self.compute_dtype)) as self.encoder_scope:
         # This converts a 2D mask of shape [batch_size, seq_length] to a 3D
         # mask of shape [batch_size, seq_length, seq_length] which is used
-        # for the attention scores.
-        attention_mask = create_attention_mask_from_input_mask(
-            input_ids, input_mask)
+        # for the attention scores. Local attention never materializes the
+        # 3D mask and takes the 2D one.
+        if config.attention_window:
+          attention_mask = input_mask
+        else:
+          attention_mask = create_attention_mask_from_input_mask(
+              input_ids, input_mask)
+
+        self.attention_mask = attention_mask
+        self.global_attention_mask = global_attention_mask
 
         # Run the stacked transformer.
         # `sequence_output` shape = [batch_size, seq_length, hidden_size].
-        self.all_encoder_layers = transformer_model(
-            input_tensor=self.embedding_output,
-            attention_mask=attention_mask,
-            hidden_size=config.hidden_size,
-            num_hidden_layers=config.num_hidden_layers,
-            num_attention_heads=config.num_attention_heads,
-            intermediate_size=config.intermediate_size,
-            intermediate_act_fn=get_activation(config.hidden_act),
-            hidden_dropout_prob=config.hidden_dropout_prob,
-            attention_probs_dropout_prob=config.attention_probs_dropout_prob,
-            initializer_range=config.initializer_range,
-            do_return_all_layers=True)
+        self.all_encoder_layers = self._run_transformer(
+            self.embedding_output, attention_mask, global_attention_mask,
+            start_layer=0, end_layer=num_layers_to_run,
+            final_layer_first_token_only=pooled_output_only)
 
       self.sequence_output = self.all_encoder_layers[-1]
       # The "pooler" converts the encoded sequence tensor of shape
@@ -254,12 +373,95 @@ class BertModel(object):
       to the output of the embedding layer, after summing the word
       embeddings with the positional embeddings and the token type embeddings,
       then performing layer normalization. This is the input to the transformer.
+      With a smaller `embedding_size`, this is after the projection up to
+      `hidden_size`.
     """
     return self.embedding_output
 
   def get_embedding_table(self):
+    """Gets the [vocab_size, embedding_size] word embedding table."""
     return self.embedding_table
 
+  def get_attention_mask(self):
+    """Gets the attention mask that the encoder layers use.
+
+    Returns:
+      int32 Tensor of shape [batch_size, seq_length, seq_length], or of shape
+      [batch_size, seq_length] with `config.attention_window` > 0.
+    """
+    return self.attention_mask
+
+  def get_global_attention_mask(self):
+    """Gets the global positions of local attention, or None without it."""
+    return self.global_attention_mask
+
+  def run_encoder_layers(self, layer_input, start_layer, end_layer=None,
+                         attention_mask=None, global_attention_mask=None):
+    """Runs encoder layers `start_layer` to `end_layer - 1` of this model.
+
+    The layers are created in, or reused from, the encoder of this model, so
+    they run with the same config and variables as in the constructor.
+
+    Args:
+      layer_input: float Tensor of shape [batch_size, seq_length,
+        hidden_size], the output of layer `start_layer - 1`, e.g.
+        `get_sequence_output()` of a model built with `num_layers_to_run`.
+        It may hold a subset of the examples of the model.
+      start_layer: int. Index of the first layer to run.
+      end_layer: (optional) int. Index one past the last layer to run.
+        Defaults to all the remaining layers.
+      attention_mask: (optional) The rows of `get_attention_mask()` of the
+        examples in `layer_input`. Defaults to all of them.
+      global_attention_mask: (optional) The rows of
+        `get_global_attention_mask()` of the examples in `layer_input`.
+        Defaults to all of them.
+
+    Returns:
+      A list of the float Tensors of shape [batch_size, seq_length,
+      hidden_size] output by each layer that was run.
+    """
+    if attention_mask is None:
+      attention_mask = self.attention_mask
+    if global_attention_mask is None:
+      global_attention_mask = self.global_attention_mask
+    with tf.variable_scope(self.encoder_scope):
+      return self._run_transformer(layer_input, attention_mask,
+                                   global_attention_mask, start_layer,
+                                   end_layer)
+
+  def _run_transformer(self, layer_input, attention_mask,
+                       global_attention_mask, start_layer, end_layer,
+                       final_layer_first_token_only=False):
+    """Runs `transformer_model` with `self.config` in the current scope."""
+    config = self.config
+    all_layer_outputs = transformer_model(
+        input_tensor=tf.cast(layer_input, self.compute_dtype),
+        attention_mask=attention_mask,
+        hidden_size=config.hidden_size,
+        num_hidden_layers=config.num_hidden_layers,
+        num_attention_heads=config.num_attention_heads,
+        intermediate_size=config.intermediate_size,
+        intermediate_act_fn=get_activation(config.hidden_act),
+        hidden_dropout_prob=config.hidden_dropout_prob,
+        attention_probs_dropout_prob=config.attention_probs_dropout_prob,
+        initializer_range=config.initializer_range,
+        do_return_all_layers=True,
+        fuse_qkv=config.fuse_qkv,
+        recompute_every_n_layers=config.recompute_every_n_layers,
+        attention_window=config.attention_window,
+        global_attention_mask=global_attention_mask,
+        num_global_tokens=config.num_global_tokens,
+        token_pruning_schedule=config.token_pruning_schedule,
+        final_layer_first_token_only=final_layer_first_token_only,
+        num_attention_heads_per_layer=config.num_attention_heads_per_layer,
+        intermediate_size_per_layer=config.intermediate_size_per_layer,
+        ffn_ranks_per_layer=config.ffn_ranks_per_layer,
+        share_attention_across_layers=config.share_attention_across_layers,
+        share_ffn_across_layers=config.share_ffn_across_layers,
+        start_layer=start_layer,
+        end_layer=end_layer)
+    return [tf.cast(layer, tf.float32) for layer in all_layer_outputs]
+
 
 def gelu(x):
   """Gaussian Error Linear Unit.
@@ -314,40 +516,167 @@ def get_activation(activation_string):
     raise ValueError("Unsupported activation: %s" % act)
 
 
-def get_assignment_map_from_checkpoint(tvars, init_checkpoint):
-  """Compute the union of the current variables and checkpoint variables."""
+def get_assignment_map_from_checkpoint(tvars, init_checkpoint, layer_map=None,
+                                       scope=None):
+  """Compute the union of the current variables and checkpoint variables.
+
+  Args:
+    tvars: The variables to initialize.
+    init_checkpoint: The checkpoint to initialize them from.
+    layer_map: (optional) dict from the index of an encoder layer of the model
+      to the index of the checkpoint layer to initialize it from, e.g. to
+      initialize a shallower student model from selected layers of its
+      teacher. Encoder layers that are not in the map are not initialized.
+    scope: (optional) Only variables under this variable scope are
+      initialized, each from the checkpoint variable with its name without
+      the scope prefix.
+
+  Returns:
+    (assignment_map, initialized_variable_names), where `assignment_map` maps
+    checkpoint variable names to model variable names for
+    `tf.train.init_from_checkpoint`.
+  """
   assignment_map = {}
   initialized_variable_names = {}
 
-  name_to_variable = collections.OrderedDict()
+  checkpoint_name_to_name = collections.OrderedDict()
   for var in tvars:
     name = var.name
     m = re.match("^(.*):\\d+$", name)
     if m is not None:
       name = m.group(1)
-    name_to_variable[name] = var
+    checkpoint_name = name
+    if scope is not None:
+      if not name.startswith(scope + "/"):
+        continue
+      checkpoint_name = name[len(scope) + 1:]
+    if layer_map is not None:
+      m = re.match("^(.*/encoder/layer_)(\\d+)(/.*)$", checkpoint_name)
+      if m is not None:
+        layer_idx = int(m.group(2))
+        if layer_idx not in layer_map:
+          continue
+        checkpoint_name = "%s%d%s" % (m.group(1), layer_map[layer_idx],
+                                      m.group(3))
+    checkpoint_name_to_name[checkpoint_name] = name
 
   init_vars = tf.train.list_variables(init_checkpoint)
 
   assignment_map = collections.OrderedDict()
   for x in init_vars:
-    (name, var) = (x[0], x[1])
-    if name not in name_to_variable:
+    (checkpoint_name, var) = (x[0], x[1])
+    if checkpoint_name not in checkpoint_name_to_name:
       continue
-    assignment_map[name] = name
+    name = checkpoint_name_to_name[checkpoint_name]
+    assignment_map[checkpoint_name] = name
     initialized_variable_names[name] = 1
     initialized_variable_names[name + ":0"] = 1
 
   return (assignment_map, initialized_variable_names)
 
 
-def dropout(input_tensor, dropout_prob):
+def fuse_qkv_in_checkpoint(init_checkpoint, output_checkpoint):
+  """Rewrites a checkpoint for a `BertConfig` with `fuse_qkv` set.
+
+  Every self-attention layer's separate "query", "key" and "value" kernels
+  and biases are concatenated, in that order, into the "query_key_value"
+  variables that `attention_layer(..., fuse_qkv=True)` creates. All other
+  variables are copied unchanged.
+
+  Args:
+    init_checkpoint: The checkpoint to convert.
+    output_checkpoint: Where to write the converted checkpoint.
+
+  Returns:
+    The checkpoint to initialize the fused model from: `output_checkpoint`,
+    or `init_checkpoint` itself if it has no separate projections to fuse.
+  """
+  reader = tf.train.load_checkpoint(init_checkpoint)
+  var_to_shape = reader.get_variable_to_shape_map()
+
+  fused_names = collections.OrderedDict()
+  for name in sorted(var_to_shape):
+    m = re.match("^(.*)/query/(kernel|bias)$", name)
+    if m is None:
+      continue
+    parts = [
+        "%s/%s/%s" % (m.group(1), x, m.group(2))
+        for x in ("query", "key", "value")
+    ]
+    if all(x in var_to_shape for x in parts):
+      fused_names["%s/query_key_value/%s" % (m.group(1), m.group(2))] = parts
+
+  if not fused_names:
+    return init_checkpoint
+
+  skipped_names = set()
+  for parts in fused_names.values():
+    skipped_names.update(parts)
+
+  values = collections.OrderedDict()
+  for name in sorted(var_to_shape):
+    if name not in skipped_names:
+      values[name] = reader.get_tensor(name)
+  for (name, parts) in six.iteritems(fused_names):
+    values[name] = np.concatenate([reader.get_tensor(x) for x in parts],
+                                  axis=-1)
+  write_checkpoint(values, output_checkpoint)
+
+  tf.logging.info("Fused the query/key/value variables of %s into %s",
+                  init_checkpoint, output_checkpoint)
+  return output_checkpoint
+
+
+def maybe_fuse_qkv_checkpoint(bert_config, init_checkpoint, output_dir):
+  """Returns the checkpoint to initialize a model with `bert_config` from.
+
+  If `bert_config.fuse_qkv` is set, `init_checkpoint` is converted with
+  `fuse_qkv_in_checkpoint` into "fused_qkv_init/bert_model.ckpt" under
+  `output_dir`. Otherwise, or without an `init_checkpoint`, it is returned
+  unchanged.
+  """
+  if not bert_config.fuse_qkv or not init_checkpoint:
+    return init_checkpoint
+  return fuse_qkv_in_checkpoint(
+      init_checkpoint,
+      os.path.join(output_dir, "fused_qkv_init", "bert_model.ckpt"))
+
+
+def write_checkpoint(values, output_checkpoint):
+  """Writes a checkpoint with the given variable values.
+
+  Args:
+    values: Mapping from variable names to NumPy arrays.
+    output_checkpoint: Where to write the checkpoint.
+  """
+  with tf.Graph().as_default():
+    variables = []
+    for (name, value) in six.iteritems(values):
+      variables.append(
+          tf.get_variable(
+              name,
+              shape=value.shape,
+              dtype=tf.as_dtype(value.dtype),
+              initializer=tf.zeros_initializer()))
+
+    saver = tf.train.Saver(variables)
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      for (variable, value) in zip(variables, values.values()):
+        variable.load(value, sess)
+      saver.save(sess, output_checkpoint)
+
+
+def dropout(input_tensor, dropout_prob, seed=None):
   """Perform dropout.
 
   Args:
     input_tensor: float Tensor.
     dropout_prob: Python float. The probability of dropping out a value (NOT of
       *keeping* a dimension as in `tf.nn.dropout`).
+    seed: (optional) int64 Tensor of shape [2]. If set, the dropout mask is
+      drawn with a stateless random op seeded from it, so that the same seed
+      always gives the same mask.
 
   Returns:
     A version of `input_tensor` with dropout applied.
@@ -355,14 +684,35 @@ def dropout(input_tensor, dropout_prob):
   if dropout_prob is None or dropout_prob == 0.0:
     return input_tensor
 
-  output = tf.nn.dropout(input_tensor, 1.0 - dropout_prob)
+  if seed is None:
+    output = tf.nn.dropout(input_tensor, 1.0 - dropout_prob)
+  else:
+    keep_mask = tf.contrib.stateless.stateless_random_uniform(
+        tf.shape(input_tensor), seed=seed) >= dropout_prob
+    output = (input_tensor * tf.cast(keep_mask, input_tensor.dtype) /
+              (1.0 - dropout_prob))
   return output
 
 
+def offset_dropout_seed(seed, offset):
+  """Derives a distinct dropout seed from `seed`, which may be None."""
+  if seed is None:
+    return None
+  return seed + tf.constant([0, offset], dtype=seed.dtype)
+
+
 def layer_norm(input_tensor, name=None):
-  """Run layer normalization on the last dimension of the tensor."""
-  return tf.contrib.layers.layer_norm(
-      inputs=input_tensor, begin_norm_axis=-1, begin_params_axis=-1, scope=name)
+  """Run layer normalization on the last dimension of the tensor.
+
+  The normalization is always computed in float32. The output has the dtype
+  of `input_tensor`.
+  """
+  output_tensor = tf.contrib.layers.layer_norm(
+      inputs=tf.cast(input_tensor, tf.float32),
+      begin_norm_axis=-1,
+      begin_params_axis=-1,
+      scope=name)
+  return tf.cast(output_tensor, input_tensor.dtype)
 
 
 def layer_norm_and_dropout(input_tensor, dropout_prob, name=None):
@@ -372,6 +722,82 @@ def layer_norm_and_dropout(input_tensor, dropout_prob, name=None):
   return output_tensor
 
 
+def get_compute_dtype(config):
+  """Returns the `tf.DType` for the `compute_dtype` of a `BertConfig`."""
+  compute_dtype = config.compute_dtype
+  if compute_dtype not in ("float32", "bfloat16", "float16"):
+    raise ValueError("Unsupported compute_dtype: %s" % compute_dtype)
+  return tf.as_dtype(compute_dtype)
+
+
+def get_embedding_size(config):
+  """Returns the embedding width of a `BertConfig`."""
+  return config.embedding_size or config.hidden_size
+
+
+def get_custom_getter(compute_dtype):
+  """Returns a variable getter that keeps the variables in float32.
+
+  Inside a `tf.variable_scope` with this getter, a layer that asks for a
+  `compute_dtype` variable (e.g. `tf.layers.dense` on a bfloat16 input) gets
+  a float32 variable cast to `compute_dtype`. The optimizer and checkpoints
+  only ever see the float32 variable.
+
+  Args:
+    compute_dtype: `tf.DType`.
+
+  Returns:
+    A custom getter for `tf.variable_scope`, or None for float32.
+  """
+  if compute_dtype == tf.float32:
+    return None
+
+  def float32_variable_getter(getter, name, *args, **kwargs):
+    dtype = kwargs.get("dtype")
+    if dtype != compute_dtype:
+      return getter(name, *args, **kwargs)
+    kwargs["dtype"] = tf.float32
+    variable = getter(name, *args, **kwargs)
+    return tf.cast(variable, compute_dtype)
+
+  return float32_variable_getter
+
+
+def get_shared_layer_getter(share_attention, share_ffn):
+  """Returns a variable getter that shares variables across encoder layers.
+
+  Inside the "layer_<index>" scope of an encoder layer, the getter redirects
+  the self-attention ("attention/") and/or the feed-forward ("intermediate/"
+  and "output/") variables to those of "layer_0", which the first layer
+  creates and all later ones reuse.
+
+  Args:
+    share_attention: bool. Whether to share the self-attention variables.
+    share_ffn: bool. Whether to share the feed-forward variables.
+
+  Returns:
+    A custom getter for `tf.variable_scope`, or None if nothing is shared.
+  """
+  shared_scopes = []
+  if share_attention:
+    shared_scopes.append("attention")
+  if share_ffn:
+    shared_scopes.extend(["intermediate", "output"])
+  if not shared_scopes:
+    return None
+  shared_name_re = re.compile("^(.*/)?layer_\\d+/((%s)/.*)$" %
+                              "|".join(shared_scopes))
+
+  def shared_variable_getter(getter, name, *args, **kwargs):
+    m = shared_name_re.match(name)
+    if m is not None:
+      name = "%slayer_0/%s" % (m.group(1) or "", m.group(2))
+      kwargs["reuse"] = tf.AUTO_REUSE
+    return getter(name, *args, **kwargs)
+
+  return shared_variable_getter
+
+
 def create_initializer(initializer_range=0.02):
   """Creates a `truncated_normal_initializer` with the given range."""
   return tf.truncated_normal_initializer(stddev=initializer_range)
@@ -555,6 +981,19 @@ def create_attention_mask_from_input_mask(from_tensor, to_mask):
   return mask
 
 
+def create_first_token_mask(input_ids):
+  """Returns an int32 mask of shape [batch_size, seq_length] of the first token.
+
+  This is the default `global_attention_mask` of `BertModel`, which makes
+  [CLS] attend to and be attended from all positions under local attention.
+  """
+  input_shape = get_shape_list(input_ids, expected_rank=2)
+  return tf.one_hot(
+      tf.zeros([input_shape[0]], dtype=tf.int32),
+      input_shape[1],
+      dtype=tf.int32)
+
+
 def attention_layer(from_tensor,
                     to_tensor,
                     attention_mask=None,
@@ -568,7 +1007,13 @@ def attention_layer(from_tensor,
                     do_return_2d_tensor=False,
                     batch_size=None,
                     from_seq_length=None,
-                    to_seq_length=None):
+                    to_seq_length=None,
+                    fuse_qkv=False,
+                    dropout_seed=None,
+                    attention_window=0,
+                    global_attention_mask=None,
+                    num_global_tokens=1,
+                    do_return_attention_probs=False):
   """Performs multi-headed attention from `from_tensor` to `to_tensor`.
 
   This is an implementation of multi-headed attention based on "Attention
@@ -615,12 +1060,31 @@ def attention_layer(from_tensor,
       of the 3D version of the `from_tensor`.
     to_seq_length: (Optional) If the input is 2D, this might be the seq length
       of the 3D version of the `to_tensor`.
+    fuse_qkv: bool. If True, the query, key and value projections use a
+      single "query_key_value" kernel, and for self-attention, i.e. when
+      `from_tensor` is `to_tensor`, they are computed with one matmul.
+    dropout_seed: (optional) int64 Tensor of shape [2]. Seed of the attention
+      probabilities dropout, see `dropout`.
+    attention_window: int. If > 0, each position only attends to the positions
+      at most this far away and to the global positions, see
+      `local_attention`. Only valid for self-attention, and `attention_mask`
+      is then the int32 Tensor of shape [batch_size, to_seq_length] with 1 for
+      the positions that can be attended to.
+    global_attention_mask: (optional) int32 Tensor of shape [batch_size,
+      from_seq_length] with 1 for the global positions. Only used if
+      `attention_window` > 0.
+    num_global_tokens: int. The maximum number of global positions per
+      sequence. Only used if `attention_window` > 0.
+    do_return_attention_probs: bool. If True, also return the attention
+      probabilities. Not supported with `attention_window`.
 
   Returns:
     float Tensor of shape [batch_size, from_seq_length,
       num_attention_heads * size_per_head]. (If `do_return_2d_tensor` is
       true, this will be of shape [batch_size * from_seq_length,
-      num_attention_heads * size_per_head]).
+      num_attention_heads * size_per_head]). If `do_return_attention_probs` is
+      true, a tuple of this and the attention probabilities of shape
+      [batch_size, num_attention_heads, from_seq_length, to_seq_length].
 
   Raises:
     ValueError: Any of the arguments or tensor shapes are invalid.
@@ -659,32 +1123,96 @@ def attention_layer(from_tensor,
   #   N = `num_attention_heads`
   #   H = `size_per_head`
 
+  if attention_window:
+    if from_tensor is not to_tensor:
+      raise ValueError(
+          "`attention_window` is only supported for self-attention, where "
+          "`from_tensor` and `to_tensor` are the same tensor.")
+    if do_return_attention_probs:
+      raise ValueError(
+          "`do_return_attention_probs` is not supported with "
+          "`attention_window`.")
+    if attention_mask is None:
+      attention_mask = tf.ones([batch_size, to_seq_length], dtype=tf.int32)
+    if global_attention_mask is None:
+      global_attention_mask = tf.zeros([batch_size, from_seq_length],
+                                       dtype=tf.int32)
+
   from_tensor_2d = reshape_to_matrix(from_tensor)
-  to_tensor_2d = reshape_to_matrix(to_tensor)
-
-  # `query_layer` = [B*F, N*H]
-  query_layer = tf.layers.dense(
-      from_tensor_2d,
-      num_attention_heads * size_per_head,
-      activation=query_act,
-      name="query",
-      kernel_initializer=create_initializer(initializer_range))
-
-  # `key_layer` = [B*T, N*H]
-  key_layer = tf.layers.dense(
-      to_tensor_2d,
-      num_attention_heads * size_per_head,
-      activation=key_act,
-      name="key",
-      kernel_initializer=create_initializer(initializer_range))
-
-  # `value_layer` = [B*T, N*H]
-  value_layer = tf.layers.dense(
-      to_tensor_2d,
-      num_attention_heads * size_per_head,
-      activation=value_act,
-      name="value",
-      kernel_initializer=create_initializer(initializer_range))
+
+  if fuse_qkv and from_tensor is to_tensor:
+    # `qkv_layer` = [B*F, 3*N*H]
+    qkv_layer = tf.layers.dense(
+        from_tensor_2d,
+        3 * num_attention_heads * size_per_head,
+        name="query_key_value",
+        kernel_initializer=create_initializer(initializer_range))
+
+    # `query_layer`, `key_layer`, `value_layer` = [B*F, N*H]
+    (query_layer, key_layer, value_layer) = tf.split(
+        qkv_layer, num_or_size_splits=3, axis=-1)
+    if query_act is not None:
+      query_layer = query_act(query_layer)
+    if key_act is not None:
+      key_layer = key_act(key_layer)
+    if value_act is not None:
+      value_layer = value_act(value_layer)
+  elif fuse_qkv:
+    # The same variables as above, but the query part of the kernel only
+    # projects `from_tensor` and the key and value parts only `to_tensor`.
+    to_tensor_2d = reshape_to_matrix(to_tensor)
+    width = num_attention_heads * size_per_head
+    with tf.variable_scope("query_key_value"):
+      kernel = tf.get_variable(
+          "kernel", [from_shape[-1], 3 * width],
+          dtype=from_tensor.dtype,
+          initializer=create_initializer(initializer_range))
+      bias = tf.get_variable(
+          "bias", [3 * width],
+          dtype=from_tensor.dtype,
+          initializer=tf.zeros_initializer())
+
+    # `query_layer` = [B*F, N*H]
+    query_layer = tf.nn.bias_add(
+        tf.matmul(from_tensor_2d, kernel[:, :width]), bias[:width])
+    # `key_layer`, `value_layer` = [B*T, N*H]
+    (key_layer, value_layer) = tf.split(
+        tf.nn.bias_add(
+            tf.matmul(to_tensor_2d, kernel[:, width:]), bias[width:]),
+        num_or_size_splits=2,
+        axis=-1)
+    if query_act is not None:
+      query_layer = query_act(query_layer)
+    if key_act is not None:
+      key_layer = key_act(key_layer)
+    if value_act is not None:
+      value_layer = value_act(value_layer)
+  else:
+    to_tensor_2d = reshape_to_matrix(to_tensor)
+
+    # `query_layer` = [B*F, N*H]
+    query_layer = tf.layers.dense(
+        from_tensor_2d,
+        num_attention_heads * size_per_head,
+        activation=query_act,
+        name="query",
+        kernel_initializer=create_initializer(initializer_range))
+
+    # `key_layer` = [B*T, N*H]
+    key_layer = tf.layers.dense(
+        to_tensor_2d,
+        num_attention_heads * size_per_head,
+        activation=key_act,
+        name="key",
+        kernel_initializer=create_initializer(initializer_range))
+
+    # `value_layer` = [B*T, N*H]
+    value_layer = tf.layers.dense(
+        to_tensor_2d,
+        num_attention_heads * size_per_head,
+        activation=value_act,
+        name="value",
+        kernel_initializer=create_initializer(initializer_range))
 
   # `query_layer` = [B, N, F, H]
   query_layer = transpose_for_scores(query_layer, batch_size,
@@ -695,44 +1223,69 @@ def attention_layer(from_tensor,
   key_layer = transpose_for_scores(key_layer, batch_size, num_attention_heads,
                                    to_seq_length, size_per_head)
 
-  # Take the dot product between "query" and "key" to get the raw
-  # attention scores.
-  # `attention_scores` = [B, N, F, T]
-  attention_scores = tf.matmul(query_layer, key_layer, transpose_b=True)
-  attention_scores = tf.multiply(attention_scores,
-                                 1.0 / math.sqrt(float(size_per_head)))
-
-  if attention_mask is not None:
-    # `attention_mask` = [B, 1, F, T]
-    attention_mask = tf.expand_dims(attention_mask, axis=[1])
-
-    # Since attention_mask is 1.0 for positions we want to attend and 0.0 for
-    # masked positions, this operation will create a tensor which is 0.0 for
-    # positions we want to attend and -10000.0 for masked positions.
-    adder = (1.0 - tf.cast(attention_mask, tf.float32)) * -10000.0
-
-    # Since we are adding it to the raw scores before the softmax, this is
-    # effectively the same as removing these entirely.
-    attention_scores += adder
-
-  # Normalize the attention scores to probabilities.
-  # `attention_probs` = [B, N, F, T]
-  attention_probs = tf.nn.softmax(attention_scores)
-
-  # This is actually dropping out entire tokens to attend to, which might
-  # seem a bit unusual, but is taken from the original Transformer paper.
-  attention_probs = dropout(attention_probs, attention_probs_dropout_prob)
-
-  # `value_layer` = [B, T, N, H]
-  value_layer = tf.reshape(
-      value_layer,
-      [batch_size, to_seq_length, num_attention_heads, size_per_head])
-
-  # `value_layer` = [B, N, T, H]
-  value_layer = tf.transpose(value_layer, [0, 2, 1, 3])
-
-  # `context_layer` = [B, N, F, H]
-  context_layer = tf.matmul(attention_probs, value_layer)
+  if attention_window:
+    # `value_layer` = [B, N, T, H]
+    value_layer = transpose_for_scores(value_layer, batch_size,
+                                       num_attention_heads, to_seq_length,
+                                       size_per_head)
+
+    # `context_layer` = [B, N, F, H]
+    context_layer = local_attention(
+        query_layer,
+        key_layer,
+        value_layer,
+        to_mask=attention_mask,
+        global_attention_mask=global_attention_mask,
+        attention_window=attention_window,
+        num_global_tokens=num_global_tokens,
+        seq_length=from_seq_length,
+        attention_probs_dropout_prob=attention_probs_dropout_prob,
+        dropout_seed=dropout_seed)
+  else:
+    # Take the dot product between "query" and "key" to get the raw
+    # attention scores.
+    # `attention_scores` = [B, N, F, T]
+    attention_scores = tf.matmul(query_layer, key_layer, transpose_b=True)
+    attention_scores = tf.multiply(attention_scores,
+                                   1.0 / math.sqrt(float(size_per_head)))
+
+    # The mask and the softmax are applied in float32 for numerical stability.
+    compute_dtype = attention_scores.dtype
+    attention_scores = tf.cast(attention_scores, tf.float32)
+
+    if attention_mask is not None:
+      # `attention_mask` = [B, 1, F, T]
+      attention_mask = tf.expand_dims(attention_mask, axis=[1])
+
+      # Since attention_mask is 1.0 for positions we want to attend and 0.0 for
+      # masked positions, this operation will create a tensor which is 0.0 for
+      # positions we want to attend and -10000.0 for masked positions.
+      adder = (1.0 - tf.cast(attention_mask, tf.float32)) * -10000.0
+
+      # Since we are adding it to the raw scores before the softmax, this is
+      # effectively the same as removing these entirely.
+      attention_scores += adder
+
+    # Normalize the attention scores to probabilities.
+    # `attention_probs` = [B, N, F, T]
+    attention_probs = tf.nn.softmax(attention_scores)
+
+    # This is actually dropping out entire tokens to attend to, which might
+    # seem a bit unusual, but is taken from the original Transformer paper.
+    attention_probs = dropout(attention_probs, attention_probs_dropout_prob,
+                              seed=dropout_seed)
+    attention_probs = tf.cast(attention_probs, compute_dtype)
+
+    # `value_layer` = [B, T, N, H]
+    value_layer = tf.reshape(
+        value_layer,
+        [batch_size, to_seq_length, num_attention_heads, size_per_head])
+
+    # `value_layer` = [B, N, T, H]
+    value_layer = tf.transpose(value_layer, [0, 2, 1, 3])
+
+    # `context_layer` = [B, N, F, H]
+    context_layer = tf.matmul(attention_probs, value_layer)
 
   # `context_layer` = [B, F, N, H]
   context_layer = tf.transpose(context_layer, [0, 2, 1, 3])
@@ -748,6 +1301,183 @@ def attention_layer(from_tensor,
         context_layer,
         [batch_size, from_seq_length, num_attention_heads * size_per_head])
 
+  if do_return_attention_probs:
+    return (context_layer, attention_probs)
+  return context_layer
+
+
+def local_attention(query_layer,
+                    key_layer,
+                    value_layer,
+                    to_mask,
+                    global_attention_mask,
+                    attention_window,
+                    num_global_tokens,
+                    seq_length,
+                    attention_probs_dropout_prob=0.0,
+                    dropout_seed=None):
+  """Sliding window self-attention with a few global positions.
+
+  Each local position attends to the positions at most `attention_window`
+  away and to the global positions. The global positions attend to all
+  positions. This gives the same result as `attention_layer` with the
+  corresponding [B, S, S] mask, but the sequence is split into blocks of
+  `attention_window` positions whose queries only score the keys of their own
+  and the two neighbouring blocks, so memory is linear in the sequence length.
+
+  Scalar dimensions are named as in `attention_layer`, with S = F = T,
+  W = `attention_window` and G = `num_global_tokens`.
+
+  Args:
+    query_layer: float Tensor of shape [B, N, S, H].
+    key_layer: float Tensor of shape [B, N, S, H].
+    value_layer: float Tensor of shape [B, N, S, H].
+    to_mask: int32 Tensor of shape [B, S], with 1 for the positions that can
+      be attended to.
+    global_attention_mask: int32 Tensor of shape [B, S], with 1 for the
+      global positions. Only the first G global positions of each sequence
+      are global, the others are treated as local ones.
+    attention_window: int. W.
+    num_global_tokens: int. G.
+    seq_length: int or int32 scalar Tensor. S.
+    attention_probs_dropout_prob: float. Dropout probability of the attention
+      probabilities.
+    dropout_seed: (optional) int64 Tensor of shape [2]. Seed of the attention
+      probabilities dropout, see `dropout`.
+
+  Returns:
+    float Tensor of shape [B, N, S, H].
+  """
+  (batch_size, num_attention_heads, _,
+   size_per_head) = get_shape_list(query_layer, expected_rank=4)
+  compute_dtype = query_layer.dtype
+  scale = 1.0 / math.sqrt(float(size_per_head))
+  if isinstance(seq_length, int):
+    num_global_tokens = min(num_global_tokens, seq_length)
+
+  to_mask = tf.cast(to_mask, tf.float32)
+
+  # Find the first G global positions. Sorting by `S - position` puts them in
+  # order; entries past the last global position are invalid.
+  # `global_one_hot` = [B, G, S]
+  priority = tf.cast(global_attention_mask, tf.int32) * (
+      seq_length - tf.range(seq_length))
+  (priority, global_positions) = tf.nn.top_k(priority, k=num_global_tokens)
+  global_one_hot = tf.one_hot(global_positions, seq_length) * tf.expand_dims(
+      tf.cast(priority > 0, tf.float32), -1)
+  # `is_global` = [B, S]
+  is_global = tf.reduce_sum(global_one_hot, axis=1)
+  # `global_to_mask` = [B, G]
+  global_to_mask = tf.reduce_sum(
+      global_one_hot * tf.expand_dims(to_mask, 1), axis=-1)
+
+  # Gathering and scattering the global positions are matmuls with the one-hot
+  # positions. `gather_matrix` = [B, N, G, S]
+  gather_matrix = tf.tile(
+      tf.expand_dims(tf.cast(global_one_hot, compute_dtype), 1),
+      [1, num_attention_heads, 1, 1])
+  # `global_query`, `global_key`, `global_value` = [B, N, G, H]
+  global_query = tf.matmul(gather_matrix, query_layer)
+  global_key = tf.matmul(gather_matrix, key_layer)
+  global_value = tf.matmul(gather_matrix, value_layer)
+
+  # The global positions attend to all positions.
+  # `global_scores` = [B, N, G, S]
+  global_scores = tf.matmul(global_query, key_layer, transpose_b=True)
+  global_scores = tf.cast(global_scores * scale, tf.float32)
+  global_scores += (1.0 - to_mask[:, None, None, :]) * -10000.0
+  global_probs = tf.nn.softmax(global_scores)
+  global_probs = dropout(
+      global_probs,
+      attention_probs_dropout_prob,
+      seed=None if dropout_seed is None else dropout_seed + [1, 0])
+  # `global_context` = [B, N, G, H]
+  global_context = tf.matmul(
+      tf.cast(global_probs, compute_dtype), value_layer)
+
+  # Pad the sequence to `num_blocks` blocks of W positions. The keys and values
+  # get one more block of padding on both sides, so that block b of the
+  # queries scores the three key blocks b - 1, b and b + 1.
+  num_blocks = (seq_length + attention_window - 1) // attention_window
+  padded_length = num_blocks * attention_window
+  padding = padded_length - seq_length
+
+  def to_blocks(tensor, before, after):
+    """[B, N, S, H] -> [B, N, num_blocks + (before + after) / W, W, H]."""
+    tensor = tf.pad(tensor, [[0, 0], [0, 0], [before, after], [0, 0]])
+    return tf.reshape(
+        tensor,
+        [batch_size, num_attention_heads, -1, attention_window, size_per_head])
+
+  def to_windows(blocks, axis):
+    """Concatenates each block of axis 2 with its neighbours along `axis`."""
+    return tf.concat(
+        [blocks[:, :, :-2], blocks[:, :, 1:-1], blocks[:, :, 2:]], axis=axis)
+
+  # `query_blocks` = [B, N, num_blocks, W, H]
+  query_blocks = to_blocks(query_layer, 0, padding)
+  # `key_windows`, `value_windows` = [B, N, num_blocks, 3W, H]
+  key_windows = to_windows(
+      to_blocks(key_layer, attention_window, padding + attention_window),
+      axis=3)
+  value_windows = to_windows(
+      to_blocks(value_layer, attention_window, padding + attention_window),
+      axis=3)
+
+  # The global keys are scored separately below, so they are masked out of the
+  # windows. `window_mask` = [B, 1, num_blocks, 1, 3W]
+  local_to_mask = tf.pad(
+      to_mask * (1.0 - is_global),
+      [[0, 0], [attention_window, padding + attention_window]])
+  local_to_mask = tf.reshape(local_to_mask,
+                             [batch_size, 1, -1, 1, attention_window])
+  window_mask = to_windows(local_to_mask, axis=-1)
+  # Query i of a block may attend to key j of its window if they are at most W
+  # positions apart. `band` = [W, 3W]
+  offsets = np.arange(3 * attention_window)[None, :] - attention_window - (
+      np.arange(attention_window)[:, None])
+  band = tf.constant(np.abs(offsets) <= attention_window, dtype=tf.float32)
+
+  # `local_scores` = [B, N, num_blocks, W, 3W]
+  local_scores = tf.matmul(query_blocks, key_windows, transpose_b=True)
+  local_scores = tf.cast(local_scores * scale, tf.float32)
+  local_scores += (1.0 - window_mask * band) * -10000.0
+
+  # `to_global_scores` = [B, N, num_blocks, W, G]
+  to_global_scores = tf.matmul(
+      tf.reshape(query_blocks,
+                 [batch_size, num_attention_heads, -1, size_per_head]),
+      global_key,
+      transpose_b=True)
+  to_global_scores = tf.reshape(
+      to_global_scores,
+      [batch_size, num_attention_heads, -1, attention_window,
+       num_global_tokens])
+  to_global_scores = tf.cast(to_global_scores * scale, tf.float32)
+  to_global_scores += (1.0 - global_to_mask[:, None, None, None, :]) * -10000.0
+
+  # `probs` = [B, N, num_blocks, W, G + 3W]
+  probs = tf.nn.softmax(tf.concat([to_global_scores, local_scores], axis=-1))
+  probs = dropout(probs, attention_probs_dropout_prob, seed=dropout_seed)
+  probs = tf.cast(probs, compute_dtype)
+  (to_global_probs, local_probs) = tf.split(
+      probs, [num_global_tokens, 3 * attention_window], axis=-1)
+
+  # `context_layer` = [B, N, S, H]
+  context_layer = tf.matmul(local_probs, value_windows)
+  context_layer = tf.reshape(
+      context_layer,
+      [batch_size, num_attention_heads, padded_length, size_per_head])
+  context_layer += tf.matmul(
+      tf.reshape(to_global_probs,
+                 [batch_size, num_attention_heads, -1, num_global_tokens]),
+      global_value)
+  context_layer = context_layer[:, :, :seq_length]
+
+  # Replace the rows of the global positions.
+  context_layer *= tf.cast(1.0 - is_global[:, None, :, None], compute_dtype)
+  context_layer += tf.matmul(
+      gather_matrix, global_context, transpose_a=True)
   return context_layer
 
 
@@ -761,7 +1491,21 @@ def transformer_model(input_tensor,
                       hidden_dropout_prob=0.1,
                       attention_probs_dropout_prob=0.1,
                       initializer_range=0.02,
-                      do_return_all_layers=False):
+                      do_return_all_layers=False,
+                      fuse_qkv=False,
+                      recompute_every_n_layers=0,
+                      attention_window=0,
+                      global_attention_mask=None,
+                      num_global_tokens=1,
+                      token_pruning_schedule=None,
+                      final_layer_first_token_only=False,
+                      num_attention_heads_per_layer=None,
+                      intermediate_size_per_layer=None,
+                      ffn_ranks_per_layer=None,
+                      share_attention_across_layers=False,
+                      share_ffn_across_layers=False,
+                      start_layer=0,
+                      end_layer=None):
   """Multi-headed, multi-layer Transformer from "Attention is All You Need".
 
   This is almost an exact implementation of the original Transformer encoder.
@@ -774,9 +1518,11 @@ def transformer_model(input_tensor,
 
   Args:
     input_tensor: float Tensor of shape [batch_size, seq_length, hidden_size].
+      With `start_layer` > 0, the output of layer `start_layer - 1`.
     attention_mask: (optional) int32 Tensor of shape [batch_size, seq_length,
       seq_length], with 1 for positions that can be attended to and 0 in
-      positions that should not be.
+      positions that should not be. If `attention_window` > 0, this is of
+      shape [batch_size, seq_length] instead.
     hidden_size: int. Hidden size of the Transformer.
     num_hidden_layers: int. Number of layers (blocks) in the Transformer.
     num_attention_heads: int. Number of attention heads in the Transformer.
@@ -791,10 +1537,49 @@ def transformer_model(input_tensor,
       normal).
     do_return_all_layers: Whether to also return all layers or just the final
       layer.
+    fuse_qkv: bool. Whether self-attention uses a single fused query/key/value
+      projection. See `attention_layer`.
+    recompute_every_n_layers: int. If > 0, the layers run in blocks of this
+      many layers whose inner activations are recomputed in the backward pass
+      instead of being kept in memory. See `BertConfig`. The variables of the
+      layers are then resource variables, which `tf.custom_gradient` needs.
+    attention_window: int. If > 0, self-attention is local with this window.
+      See `local_attention`.
+    global_attention_mask: (optional) int32 Tensor of shape [batch_size,
+      seq_length] with 1 for the global positions of local attention.
+    num_global_tokens: int. The maximum number of global positions per
+      sequence of local attention.
+    token_pruning_schedule: (optional) A list of [layer, num_positions] pairs.
+      The `layer`-th layer (1-based) only keeps `num_positions` positions, see
+      `BertConfig`.
+    final_layer_first_token_only: bool. If True, the final layer only
+      computes the output of the first position. See `transformer_layer`.
+    num_attention_heads_per_layer: (optional) list of ints. The number of
+      attention heads of each layer, overriding `num_attention_heads`. The
+      size of each head stays `hidden_size / num_attention_heads`.
+    intermediate_size_per_layer: (optional) list of ints. The intermediate
+      size of each layer, overriding `intermediate_size`.
+    ffn_ranks_per_layer: (optional) list of [intermediate_rank, output_rank]
+      pairs, one per layer. See `BertConfig`.
+    share_attention_across_layers: bool. Whether all layers use the
+      self-attention variables of "layer_0". See `get_shared_layer_getter`.
+    share_ffn_across_layers: bool. Whether all layers use the feed-forward
+      variables of "layer_0".
+    start_layer: int. Index of the first layer to run. The layers before it
+      are skipped, e.g. because an earlier call already ran them.
+    end_layer: (optional) int. Index one past the last layer to run. Defaults
+      to `num_hidden_layers`. The other arguments still describe the whole
+      Transformer, so that a model can be run in several calls that each
+      create or reuse the variables of their own layers.
 
   Returns:
     float Tensor of shape [batch_size, seq_length, hidden_size], the final
-    hidden layer of the Transformer.
+    hidden layer of the Transformer. With `end_layer`, the output of layer
+    `end_layer - 1`, and with `do_return_all_layers`, only the outputs of the
+    layers that were run. With `token_pruning_schedule`, the
+    sequence length of each layer output is the number of positions the
+    layer kept. With `final_layer_first_token_only`, the sequence length of
+    the final layer is 1.
 
   Raises:
     ValueError: A Tensor shape or parameter is invalid.
@@ -804,7 +1589,6 @@ def transformer_model(input_tensor,
         "The hidden size (%d) is not a multiple of the number of attention "
         "heads (%d)" % (hidden_size, num_attention_heads))
 
-  attention_head_size = int(hidden_size / num_attention_heads)
   input_shape = get_shape_list(input_tensor, expected_rank=3)
   batch_size = input_shape[0]
   seq_length = input_shape[1]
@@ -816,82 +1600,484 @@ def transformer_model(input_tensor,
     raise ValueError("The width of the input tensor (%d) != hidden size (%d)" %
                      (input_width, hidden_size))
 
+  attention_head_size = int(hidden_size / num_attention_heads)
+  if num_attention_heads_per_layer is None:
+    num_attention_heads_per_layer = [num_attention_heads] * num_hidden_layers
+  if intermediate_size_per_layer is None:
+    intermediate_size_per_layer = [intermediate_size] * num_hidden_layers
+  if ffn_ranks_per_layer is None:
+    ffn_ranks_per_layer = [[0, 0]] * num_hidden_layers
+  if (len(num_attention_heads_per_layer) != num_hidden_layers or
+      len(intermediate_size_per_layer) != num_hidden_layers or
+      len(ffn_ranks_per_layer) != num_hidden_layers):
+    raise ValueError(
+        "`num_attention_heads_per_layer`, `intermediate_size_per_layer` and "
+        "`ffn_ranks_per_layer` must have one entry per layer (%d)" %
+        num_hidden_layers)
+  if ((share_attention_across_layers and
+       len(set(num_attention_heads_per_layer)) > 1) or
+      (share_ffn_across_layers and
+       (len(set(intermediate_size_per_layer)) > 1 or
+        len(set(tuple(x) for x in ffn_ranks_per_layer)) > 1))):
+    raise ValueError(
+        "Shared layers must have the same number of attention heads, "
+        "intermediate size and feed-forward ranks.")
+  if recompute_every_n_layers and (share_attention_across_layers or
+                                   share_ffn_across_layers):
+    # The recomputed gradients of a block are taken with respect to the block
+    # input too, which already depends on the shared variables through the
+    # earlier blocks, so those would be counted twice.
+    raise ValueError(
+        "Sharing layers is not supported together with "
+        "`recompute_every_n_layers`.")
+  if end_layer is None:
+    end_layer = num_hidden_layers
+  if not 0 <= start_layer < end_layer <= num_hidden_layers:
+    raise ValueError(
+        "Cannot run layers [%d, %d) of a model with %d layers" %
+        (start_layer, end_layer, num_hidden_layers))
+  shared_layer_getter = get_shared_layer_getter(share_attention_across_layers,
+                                                share_ffn_across_layers)
+
+  num_kept_positions = {}
+  if token_pruning_schedule:
+    if attention_window or recompute_every_n_layers:
+      raise ValueError(
+          "`token_pruning_schedule` is not supported together with "
+          "`attention_window` or `recompute_every_n_layers`.")
+    for (layer, num_positions) in token_pruning_schedule:
+      if final_layer_first_token_only and layer == num_hidden_layers:
+        # Only the first position is computed anyway.
+        continue
+      if layer < 1 or layer > num_hidden_layers:
+        raise ValueError(
+            "Cannot prune tokens in layer %d of a model with %d layers" %
+            (layer, num_hidden_layers))
+      num_kept_positions[layer - 1] = num_positions
+    if any(layer_idx < start_layer for layer_idx in num_kept_positions):
+      # The positions that the skipped layers kept are not known here, so
+      # `attention_mask` cannot be pruned to match `input_tensor`.
+      raise ValueError(
+          "Cannot start at layer %d after tokens were pruned in an earlier "
+          "layer." % start_layer)
+
+  # `layer_seq_lengths[i]` is the sequence length of the output of layer i.
+  layer_seq_lengths = []
+  layer_seq_length = seq_length
+  for layer_idx in range(num_hidden_layers):
+    if layer_idx in num_kept_positions:
+      if isinstance(layer_seq_length, int):
+        layer_seq_length = min(num_kept_positions[layer_idx], layer_seq_length)
+      else:
+        layer_seq_length = tf.minimum(num_kept_positions[layer_idx],
+                                      layer_seq_length)
+    layer_seq_lengths.append(layer_seq_length)
+  if final_layer_first_token_only:
+    layer_seq_lengths[-1] = 1
+
   # We keep the representation as a 2D tensor to avoid re-shaping it back and
   # forth from a 3D tensor to a 2D tensor. Re-shapes are normally free on
   # the GPU/CPU but may not be free on the TPU, so we want to minimize them to
   # help the optimizer.
   prev_output = reshape_to_matrix(input_tensor)
 
-  all_layer_outputs = []
-  for layer_idx in range(num_hidden_layers):
-    with tf.variable_scope("layer_%d" % layer_idx):
-      layer_input = prev_output
-
-      with tf.variable_scope("attention"):
-        attention_heads = []
-        with tf.variable_scope("self"):
-          attention_head = attention_layer(
-              from_tensor=layer_input,
-              to_tensor=layer_input,
-              attention_mask=attention_mask,
-              num_attention_heads=num_attention_heads,
-              size_per_head=attention_head_size,
-              attention_probs_dropout_prob=attention_probs_dropout_prob,
-              initializer_range=initializer_range,
-              do_return_2d_tensor=True,
-              batch_size=batch_size,
-              from_seq_length=seq_length,
-              to_seq_length=seq_length)
-          attention_heads.append(attention_head)
-
-        attention_output = None
-        if len(attention_heads) == 1:
-          attention_output = attention_heads[0]
-        else:
-          # In the case where we have other sequences, we just concatenate
-          # them to the self-attention head before the projection.
-          attention_output = tf.concat(attention_heads, axis=-1)
-
-        # Run a linear projection of `hidden_size` then add a residual
-        # with `layer_input`.
-        with tf.variable_scope("output"):
-          attention_output = tf.layers.dense(
-              attention_output,
-              hidden_size,
-              kernel_initializer=create_initializer(initializer_range))
-          attention_output = dropout(attention_output, hidden_dropout_prob)
-          attention_output = layer_norm(attention_output + layer_input)
-
-      # The activation is only applied to the "intermediate" hidden layer.
-      with tf.variable_scope("intermediate"):
-        intermediate_output = tf.layers.dense(
-            attention_output,
-            intermediate_size,
-            activation=intermediate_act_fn,
-            kernel_initializer=create_initializer(initializer_range))
-
-      # Down-project back to `hidden_size` then add the residual.
-      with tf.variable_scope("output"):
-        layer_output = tf.layers.dense(
-            intermediate_output,
-            hidden_size,
-            kernel_initializer=create_initializer(initializer_range))
-        layer_output = dropout(layer_output, hidden_dropout_prob)
-        layer_output = layer_norm(layer_output + attention_output)
-        prev_output = layer_output
-        all_layer_outputs.append(layer_output)
-
+  def run_layers(layer_indices, layer_input, attention_mask,
+                 global_attention_mask, dropout_seeds):
+    """Runs the layers `layer_indices` and returns their outputs."""
+    layer_outputs = []
+    for (i, layer_idx) in enumerate(layer_indices):
+      is_pruned = layer_idx in num_kept_positions
+      input_seq_length = seq_length
+      if layer_idx > 0:
+        input_seq_length = layer_seq_lengths[layer_idx - 1]
+      with tf.variable_scope(
+          "layer_%d" % layer_idx,
+          custom_getter=shared_layer_getter,
+          use_resource=True if recompute_every_n_layers else None):
+        layer_output = transformer_layer(
+            layer_input=layer_input,
+            attention_mask=attention_mask,
+            batch_size=batch_size,
+            seq_length=input_seq_length,
+            hidden_size=hidden_size,
+            num_attention_heads=num_attention_heads_per_layer[layer_idx],
+            intermediate_size=intermediate_size_per_layer[layer_idx],
+            intermediate_act_fn=intermediate_act_fn,
+            ffn_ranks=ffn_ranks_per_layer[layer_idx],
+            hidden_dropout_prob=hidden_dropout_prob,
+            attention_probs_dropout_prob=attention_probs_dropout_prob,
+            initializer_range=initializer_range,
+            fuse_qkv=fuse_qkv,
+            size_per_head=attention_head_size,
+            dropout_seed=(None
+                          if dropout_seeds is None else dropout_seeds[i]),
+            attention_window=attention_window,
+            global_attention_mask=global_attention_mask,
+            num_global_tokens=num_global_tokens,
+            num_kept_positions=(layer_seq_lengths[layer_idx]
+                                if is_pruned else None),
+            first_token_only=(final_layer_first_token_only and
+                              layer_idx == num_hidden_layers - 1))
+      if is_pruned:
+        (layer_output, kept_positions) = layer_output
+        if attention_mask is not None:
+          attention_mask = prune_attention_mask(attention_mask,
+                                                kept_positions)
+      layer_input = layer_output
+      layer_outputs.append(layer_output)
+    return layer_outputs
+
+  if not recompute_every_n_layers:
+    all_layer_outputs = run_layers(
+        range(start_layer, end_layer), prev_output, attention_mask,
+        global_attention_mask, None)
+  else:
+    all_layer_outputs = []
+    for block_start in range(start_layer, end_layer,
+                             recompute_every_n_layers):
+      layer_indices = range(
+          block_start, min(block_start + recompute_every_n_layers, end_layer))
+      all_layer_outputs.extend(
+          _run_recomputed_block(run_layers, layer_indices, prev_output,
+                                attention_mask, global_attention_mask,
+                                hidden_dropout_prob or
+                                attention_probs_dropout_prob))
+      prev_output = all_layer_outputs[-1]
+
+  layer_seq_lengths = layer_seq_lengths[start_layer:end_layer]
   if do_return_all_layers:
     final_outputs = []
-    for layer_output in all_layer_outputs:
-      final_output = reshape_from_matrix(layer_output, input_shape)
+    for (layer_output, layer_seq_length) in zip(all_layer_outputs,
+                                                layer_seq_lengths):
+      final_output = reshape_from_matrix(
+          layer_output, [batch_size, layer_seq_length, hidden_size])
       final_outputs.append(final_output)
     return final_outputs
   else:
-    final_output = reshape_from_matrix(prev_output, input_shape)
+    final_output = reshape_from_matrix(
+        all_layer_outputs[-1], [batch_size, layer_seq_lengths[-1], hidden_size])
     return final_output
 
 
+def _run_recomputed_block(run_layers, layer_indices, layer_input,
+                          attention_mask, global_attention_mask, use_dropout):
+  """Runs `run_layers` so that its activations are recomputed for backprop.
+
+  The recomputation must draw the same dropout masks as the forward pass, so
+  each layer gets a random seed for stateless dropout. The seeds are inputs
+  of the recomputed function and therefore the same in both passes.
+  """
+  inputs = [layer_input]
+  if attention_mask is not None:
+    inputs.append(attention_mask)
+  if global_attention_mask is not None:
+    inputs.append(global_attention_mask)
+  if use_dropout:
+    inputs.append(
+        tf.random_uniform([len(layer_indices), 2],
+                          maxval=tf.int64.max,
+                          dtype=tf.int64))
+
+  def block_fn(*block_inputs):
+    block_inputs = list(block_inputs)
+    block_input = block_inputs.pop(0)
+    block_attention_mask = None
+    if attention_mask is not None:
+      block_attention_mask = block_inputs.pop(0)
+    block_global_attention_mask = None
+    if global_attention_mask is not None:
+      block_global_attention_mask = block_inputs.pop(0)
+    dropout_seeds = None
+    if use_dropout:
+      dropout_seeds = block_inputs.pop(0)
+    return tuple(
+        run_layers(layer_indices, block_input, block_attention_mask,
+                   block_global_attention_mask, dropout_seeds))
+
+  return list(tf.contrib.layers.recompute_grad(block_fn)(*inputs))
+
+
+def transformer_layer(layer_input,
+                      attention_mask,
+                      batch_size,
+                      seq_length,
+                      hidden_size=768,
+                      num_attention_heads=12,
+                      intermediate_size=3072,
+                      intermediate_act_fn=gelu,
+                      ffn_ranks=None,
+                      hidden_dropout_prob=0.1,
+                      attention_probs_dropout_prob=0.1,
+                      initializer_range=0.02,
+                      fuse_qkv=False,
+                      dropout_seed=None,
+                      attention_window=0,
+                      global_attention_mask=None,
+                      num_global_tokens=1,
+                      num_kept_positions=None,
+                      first_token_only=False,
+                      size_per_head=None):
+  """Runs one layer (block) of `transformer_model`.
+
+  The variables are created in the current variable scope, which
+  `transformer_model` names "layer_<index>".
+
+  Args:
+    layer_input: float Tensor of shape [batch_size * seq_length, hidden_size].
+    attention_mask: (optional) int32 Tensor of shape [batch_size, seq_length,
+      seq_length], with 1 for positions that can be attended to and 0 in
+      positions that should not be.
+    batch_size: int or int32 scalar Tensor. The batch size.
+    seq_length: int or int32 scalar Tensor. The sequence length.
+    hidden_size: int. Hidden size of the Transformer.
+    num_attention_heads: int. Number of attention heads.
+    intermediate_size: int. The size of the feed forward layer.
+    intermediate_act_fn: function. The activation of the feed forward layer.
+    ffn_ranks: (optional) An [intermediate_rank, output_rank] pair. A rank >
+      0 factorizes that dense kernel of the feed forward layer, see
+      `low_rank_dense`.
+    hidden_dropout_prob: float. Dropout probability for the hidden layers.
+    attention_probs_dropout_prob: float. Dropout probability of the attention
+      probabilities.
+    initializer_range: float. Range of the initializer.
+    fuse_qkv: bool. Whether self-attention uses a single fused query/key/value
+      projection. See `attention_layer`.
+    dropout_seed: (optional) int64 Tensor of shape [2]. If set, all dropout
+      masks of the layer are derived from it, so that running the layer
+      again with the same seed gives the same output.
+    attention_window: int. If > 0, self-attention is local with this window,
+      and `attention_mask` is of shape [batch_size, seq_length]. See
+      `local_attention`.
+    global_attention_mask: (optional) int32 Tensor of shape [batch_size,
+      seq_length] with 1 for the global positions of local attention.
+    num_global_tokens: int. The maximum number of global positions per
+      sequence of local attention.
+    num_kept_positions: (optional) int or int32 scalar Tensor. If set, only
+      this many positions are kept after self-attention: the first one and
+      those that received the most attention, summed over heads and queries.
+      The feed-forward network only runs on these.
+    first_token_only: bool. If True, only the output of the first position is
+      computed. Its query attends to the keys and values of all positions,
+      as a global position of local attention does.
+    size_per_head: (optional) int. The size of each attention head. Defaults
+      to `hidden_size / num_attention_heads`.
+
+  Returns:
+    float Tensor of shape [batch_size * seq_length, hidden_size]. If
+    `num_kept_positions` is set, a tuple of the output of shape [batch_size *
+    num_kept_positions, hidden_size] and the int32 Tensor of shape
+    [batch_size, num_kept_positions] of the kept positions, in order. If
+    `first_token_only` is True, the output is of shape [batch_size,
+    hidden_size].
+
+  Raises:
+    ValueError: Both `num_kept_positions` and `first_token_only` are set.
+  """
+  attention_head_size = size_per_head
+  if attention_head_size is None:
+    attention_head_size = int(hidden_size / num_attention_heads)
+
+  from_tensor = layer_input
+  from_seq_length = seq_length
+  if first_token_only:
+    if num_kept_positions is not None:
+      raise ValueError(
+          "`num_kept_positions` and `first_token_only` cannot both be set.")
+    # `from_tensor` = [batch_size, hidden_size]
+    from_tensor = tf.reshape(layer_input,
+                             [batch_size, seq_length, hidden_size])[:, 0]
+    from_seq_length = 1
+    if attention_mask is not None:
+      if attention_window:
+        attention_mask = tf.expand_dims(attention_mask, 1)
+      else:
+        attention_mask = attention_mask[:, 0:1, :]
+    attention_window = 0
+
+  with tf.variable_scope("attention"):
+    attention_heads = []
+    with tf.variable_scope("self"):
+      attention_head = attention_layer(
+          from_tensor=from_tensor,
+          to_tensor=layer_input,
+          attention_mask=attention_mask,
+          num_attention_heads=num_attention_heads,
+          size_per_head=attention_head_size,
+          attention_probs_dropout_prob=attention_probs_dropout_prob,
+          initializer_range=initializer_range,
+          do_return_2d_tensor=True,
+          batch_size=batch_size,
+          from_seq_length=from_seq_length,
+          to_seq_length=seq_length,
+          fuse_qkv=fuse_qkv,
+          dropout_seed=offset_dropout_seed(dropout_seed, 0),
+          attention_window=attention_window,
+          global_attention_mask=global_attention_mask,
+          num_global_tokens=num_global_tokens,
+          do_return_attention_probs=num_kept_positions is not None)
+      if num_kept_positions is not None:
+        (attention_head, attention_probs) = attention_head
+      attention_heads.append(attention_head)
+
+    attention_output = None
+    if len(attention_heads) == 1:
+      attention_output = attention_heads[0]
+    else:
+      # In the case where we have other sequences, we just concatenate
+      # them to the self-attention head before the projection.
+      attention_output = tf.concat(attention_heads, axis=-1)
+
+    # Run a linear projection of `hidden_size` then add a residual
+    # with `from_tensor`.
+    with tf.variable_scope("output"):
+      attention_output = tf.layers.dense(
+          attention_output,
+          hidden_size,
+          kernel_initializer=create_initializer(initializer_range))
+      attention_output = dropout(attention_output, hidden_dropout_prob,
+                                 seed=offset_dropout_seed(dropout_seed, 1))
+      attention_output = layer_norm(attention_output + from_tensor)
+
+  if num_kept_positions is not None:
+    # `attention_received` = [batch_size, seq_length]
+    attention_received = tf.reduce_sum(
+        tf.cast(attention_probs, tf.float32), axis=[1, 2])
+    kept_positions = select_kept_positions(attention_received,
+                                           num_kept_positions)
+    attention_output = gather_positions(attention_output, kept_positions,
+                                        seq_length)
+
+  (intermediate_rank, output_rank) = ffn_ranks or (0, 0)
+
+  # The activation is only applied to the "intermediate" hidden layer.
+  with tf.variable_scope("intermediate"):
+    intermediate_output = low_rank_dense(
+        attention_output,
+        intermediate_size,
+        intermediate_rank,
+        activation=intermediate_act_fn,
+        initializer_range=initializer_range)
+
+  # Down-project back to `hidden_size` then add the residual.
+  with tf.variable_scope("output"):
+    layer_output = low_rank_dense(
+        intermediate_output,
+        hidden_size,
+        output_rank,
+        initializer_range=initializer_range)
+    layer_output = dropout(layer_output, hidden_dropout_prob,
+                           seed=offset_dropout_seed(dropout_seed, 2))
+    layer_output = layer_norm(layer_output + attention_output)
+  if num_kept_positions is not None:
+    return (layer_output, kept_positions)
+  return layer_output
+
+
+def low_rank_dense(input_tensor,
+                   units,
+                   rank,
+                   activation=None,
+                   initializer_range=0.02):
+  """A dense layer whose kernel is the product of two rank-`rank` kernels.
+
+  Computes `activation(input_tensor * kernel_u * kernel_v + bias)` with
+  variables "dense/kernel_u" of shape [input_width, rank], "dense/kernel_v" of
+  shape [rank, units] and "dense/bias", which costs rank * (input_width +
+  units) multiply-adds per row instead of input_width * units. With `rank` 0
+  this is `tf.layers.dense`, with the variables "dense/kernel" and
+  "dense/bias".
+
+  Args:
+    input_tensor: float Tensor of shape [batch_size, input_width].
+    units: int. The output width.
+    rank: int. The rank of the kernel, or 0 for a full kernel.
+    activation: (optional) The activation function.
+    initializer_range: float. Range of the initializer.
+
+  Returns:
+    float Tensor of shape [batch_size, units].
+  """
+  if not rank:
+    return tf.layers.dense(
+        input_tensor,
+        units,
+        activation=activation,
+        kernel_initializer=create_initializer(initializer_range))
+
+  input_width = get_shape_list(input_tensor, expected_rank=2)[1]
+  with tf.variable_scope("dense"):
+    kernel_u = tf.get_variable(
+        "kernel_u", [input_width, rank],
+        dtype=input_tensor.dtype,
+        initializer=create_initializer(initializer_range))
+    # With this range the product has about the range of a full kernel.
+    kernel_v = tf.get_variable(
+        "kernel_v", [rank, units],
+        dtype=input_tensor.dtype,
+        initializer=create_initializer(1.0 / math.sqrt(rank)))
+    bias = tf.get_variable(
+        "bias", [units],
+        dtype=input_tensor.dtype,
+        initializer=tf.zeros_initializer())
+  output = tf.matmul(tf.matmul(input_tensor, kernel_u), kernel_v)
+  output = tf.nn.bias_add(output, bias)
+  if activation is not None:
+    output = activation(output)
+  return output
+
+
+def select_kept_positions(scores, num_kept_positions):
+  """Returns the positions with the highest `scores`, in order.
+
+  The first position is always kept.
+
+  Args:
+    scores: float32 Tensor of shape [batch_size, seq_length].
+    num_kept_positions: int or int32 scalar Tensor. The number of positions
+      to keep.
+
+  Returns:
+    int32 Tensor of shape [batch_size, num_kept_positions].
+  """
+  batch_size = get_shape_list(scores, expected_rank=2)[0]
+  scores = tf.concat([tf.fill([batch_size, 1], np.inf), scores[:, 1:]], axis=1)
+  (_, positions) = tf.nn.top_k(scores, k=num_kept_positions)
+  # Restore the sequence order.
+  (positions, _) = tf.nn.top_k(-positions, k=num_kept_positions)
+  return -positions
+
+
+def gather_positions(sequence_matrix, positions, seq_length):
+  """Gathers `positions` from a [batch_size * seq_length, width] matrix.
+
+  Args:
+    sequence_matrix: Tensor of shape [batch_size * seq_length, width].
+    positions: int32 Tensor of shape [batch_size, num_positions].
+    seq_length: int or int32 scalar Tensor. The sequence length of
+      `sequence_matrix`.
+
+  Returns:
+    Tensor of shape [batch_size * num_positions, width].
+  """
+  batch_size = get_shape_list(positions, expected_rank=2)[0]
+  flat_offsets = tf.reshape(
+      tf.range(0, batch_size, dtype=tf.int32) * seq_length, [-1, 1])
+  flat_positions = tf.reshape(positions + flat_offsets, [-1])
+  return tf.gather(sequence_matrix, flat_positions)
+
+
+def prune_attention_mask(attention_mask, positions):
+  """Restricts a [batch_size, seq_length, seq_length] mask to `positions`."""
+  seq_length = get_shape_list(attention_mask, expected_rank=3)[2]
+  # The rows of the mask are the same, see
+  # `create_attention_mask_from_input_mask`.
+  to_mask = tf.reshape(attention_mask[:, 0, :], [-1, 1])
+  to_mask = tf.reshape(
+      gather_positions(to_mask, positions, seq_length),
+      get_shape_list(positions, expected_rank=2))
+  return create_attention_mask_from_input_mask(to_mask, to_mask)
+
+
 def get_shape_list(tensor, expected_rank=None, name=None):
   """Returns a list of the shape of tensor, preferring static dimensions.
 
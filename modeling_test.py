@@ -18,10 +18,12 @@ from __future__ import print_function
 
 import collections
 import json
+import os
 import random
 import re
 
 import modeling
+import numpy as np
 import six
 import tensorflow as tf
 
@@ -48,6 +50,13 @@ class BertModelTest(tf.test.TestCase):
                  max_position_embeddings=512,
                  type_vocab_size=16,
                  initializer_range=0.02,
+                 fuse_qkv=False,
+                 compute_dtype="float32",
+                 attention_window=0,
+                 ffn_ranks_per_layer=None,
+                 embedding_size=None,
+                 share_attention_across_layers=False,
+                 share_ffn_across_layers=False,
                  scope=None):
       self.parent = parent
       self.batch_size = batch_size
@@ -66,6 +75,13 @@ class BertModelTest(tf.test.TestCase):
       self.max_position_embeddings = max_position_embeddings
       self.type_vocab_size = type_vocab_size
       self.initializer_range = initializer_range
+      self.fuse_qkv = fuse_qkv
+      self.compute_dtype = compute_dtype
+      self.attention_window = attention_window
+      self.ffn_ranks_per_layer = ffn_ranks_per_layer
+      self.embedding_size = embedding_size
+      self.share_attention_across_layers = share_attention_across_layers
+      self.share_ffn_across_layers = share_ffn_across_layers
       self.scope = scope
 
     def create_model(self):
@@ -93,7 +109,14 @@ class BertModelTest(tf.test.TestCase):
           attention_probs_dropout_prob=self.attention_probs_dropout_prob,
           max_position_embeddings=self.max_position_embeddings,
           type_vocab_size=self.type_vocab_size,
-          initializer_range=self.initializer_range)
+          initializer_range=self.initializer_range,
+          fuse_qkv=self.fuse_qkv,
+          compute_dtype=self.compute_dtype,
+          attention_window=self.attention_window,
+          ffn_ranks_per_layer=self.ffn_ranks_per_layer,
+          embedding_size=self.embedding_size,
+          share_attention_across_layers=self.share_attention_across_layers,
+          share_ffn_across_layers=self.share_ffn_across_layers)
 
       model = modeling.BertModel(
           config=config,
@@ -126,6 +149,542 @@ class BertModelTest(tf.test.TestCase):
   def test_default(self):
     self.run_tester(BertModelTest.BertModelTester(self))
 
+  def test_fuse_qkv(self):
+    self.run_tester(BertModelTest.BertModelTester(self, fuse_qkv=True))
+
+  def test_fuse_qkv_in_checkpoint(self):
+    config = modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=37)
+    input_ids = [[31, 51, 98], [15, 5, 0]]
+    input_mask = [[1, 1, 1], [1, 1, 0]]
+    checkpoint_dir = self.get_temp_dir()
+
+    def run_model(fuse_qkv, init_checkpoint=None):
+      config.fuse_qkv = fuse_qkv
+      with tf.Graph().as_default():
+        model = modeling.BertModel(
+            config=config,
+            is_training=False,
+            input_ids=tf.constant(input_ids),
+            input_mask=tf.constant(input_mask))
+        if init_checkpoint:
+          (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+              tf.trainable_variables(), init_checkpoint)
+          self.assertEqual(
+              len(assignment_map), len(tf.trainable_variables()))
+          tf.train.init_from_checkpoint(init_checkpoint, assignment_map)
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          if init_checkpoint is None:
+            tf.train.Saver().save(sess, checkpoint_dir + "/model.ckpt")
+          return sess.run(model.get_sequence_output())
+
+    expected = run_model(fuse_qkv=False)
+    fused_checkpoint = modeling.fuse_qkv_in_checkpoint(
+        checkpoint_dir + "/model.ckpt", checkpoint_dir + "/fused.ckpt")
+    self.assertEqual(fused_checkpoint, checkpoint_dir + "/fused.ckpt")
+    self.assertAllClose(
+        run_model(fuse_qkv=True, init_checkpoint=fused_checkpoint), expected)
+
+    # The runners only convert the checkpoint for a fused config.
+    self.assertEqual(
+        modeling.maybe_fuse_qkv_checkpoint(
+            config, checkpoint_dir + "/model.ckpt", checkpoint_dir),
+        os.path.join(checkpoint_dir, "fused_qkv_init", "bert_model.ckpt"))
+    config.fuse_qkv = False
+    self.assertEqual(
+        modeling.maybe_fuse_qkv_checkpoint(
+            config, checkpoint_dir + "/model.ckpt", checkpoint_dir),
+        checkpoint_dir + "/model.ckpt")
+
+  def test_get_assignment_map_with_layer_map_and_scope(self):
+    checkpoint = os.path.join(self.get_temp_dir(), "layers.ckpt")
+    with tf.Graph().as_default():
+      for layer_idx in range(4):
+        tf.get_variable("bert/encoder/layer_%d/kernel" % layer_idx, [2])
+      tf.get_variable("bert/embeddings/word_embeddings", [2])
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, checkpoint)
+
+    with tf.Graph().as_default():
+      student_vars = [
+          tf.get_variable("bert/encoder/layer_0/kernel", [2]),
+          tf.get_variable("bert/encoder/layer_1/kernel", [2]),
+          tf.get_variable("bert/embeddings/word_embeddings", [2])
+      ]
+      teacher_vars = [
+          tf.get_variable("teacher/bert/encoder/layer_3/kernel", [2]),
+          tf.get_variable("teacher/bert/embeddings/word_embeddings", [2])
+      ]
+      (assignment_map, initialized_variable_names
+      ) = modeling.get_assignment_map_from_checkpoint(
+          student_vars + teacher_vars, checkpoint, layer_map={0: 3})
+      self.assertEqual(
+          dict(assignment_map), {
+              "bert/encoder/layer_3/kernel": "bert/encoder/layer_0/kernel",
+              "bert/embeddings/word_embeddings":
+                  "bert/embeddings/word_embeddings",
+          })
+      self.assertIn("bert/encoder/layer_0/kernel:0",
+                    initialized_variable_names)
+      self.assertNotIn("bert/encoder/layer_1/kernel:0",
+                       initialized_variable_names)
+
+      (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+          student_vars + teacher_vars, checkpoint, scope="teacher")
+      self.assertEqual(
+          dict(assignment_map), {
+              "bert/encoder/layer_3/kernel":
+                  "teacher/bert/encoder/layer_3/kernel",
+              "bert/embeddings/word_embeddings":
+                  "teacher/bert/embeddings/word_embeddings",
+          })
+
+  def test_bfloat16(self):
+    self.run_tester(
+        BertModelTest.BertModelTester(self, compute_dtype="bfloat16"))
+
+  def test_compute_dtype_matches_float32(self):
+    config = modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=37)
+    input_ids = tf.constant([[31, 51, 98], [15, 5, 0]])
+    input_mask = tf.constant([[1, 1, 1], [1, 1, 0]])
+
+    outputs = {}
+    for compute_dtype in ("float32", "bfloat16", "float16"):
+      config.compute_dtype = compute_dtype
+      with tf.variable_scope("", reuse=(compute_dtype != "float32")):
+        model = modeling.BertModel(
+            config=config,
+            is_training=False,
+            input_ids=input_ids,
+            input_mask=input_mask,
+            scope="bert")
+      self.assertEqual(model.get_sequence_output().dtype, tf.float32)
+      self.assertEqual(model.get_pooled_output().dtype, tf.float32)
+      outputs[compute_dtype] = model.get_sequence_output()
+
+    for var in tf.global_variables():
+      self.assertEqual(var.dtype.base_dtype, tf.float32)
+
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      outputs = sess.run(outputs)
+    self.assertAllClose(outputs["float16"], outputs["float32"], atol=1e-2)
+    self.assertAllClose(outputs["bfloat16"], outputs["float32"], atol=1e-1)
+
+  def test_recompute_gradients_match(self):
+    input_ids = [[31, 51, 98], [15, 5, 0]]
+    checkpoint = os.path.join(self.get_temp_dir(), "recompute.ckpt")
+
+    def run_gradients(recompute_every_n_layers):
+      config = modeling.BertConfig(
+          vocab_size=99,
+          hidden_size=32,
+          num_hidden_layers=3,
+          num_attention_heads=4,
+          intermediate_size=37,
+          hidden_dropout_prob=0.0,
+          attention_probs_dropout_prob=0.0,
+          recompute_every_n_layers=recompute_every_n_layers)
+      with tf.Graph().as_default():
+        model = modeling.BertModel(
+            config=config, is_training=True, input_ids=tf.constant(input_ids))
+        loss = tf.reduce_sum(tf.square(model.get_pooled_output()))
+        tvars = tf.trainable_variables()
+        grads = tf.gradients(loss, tvars)
+        with tf.Session() as sess:
+          if recompute_every_n_layers:
+            tf.train.Saver().restore(sess, checkpoint)
+          else:
+            sess.run(tf.global_variables_initializer())
+            tf.train.Saver().save(sess, checkpoint)
+          return ([var.op.name for var in tvars], sess.run(grads))
+
+    (expected_names, expected_grads) = run_gradients(0)
+    for recompute_every_n_layers in (1, 2):
+      (names, grads) = run_gradients(recompute_every_n_layers)
+      self.assertEqual(names, expected_names)
+      for (grad, expected_grad) in zip(grads, expected_grads):
+        self.assertAllClose(grad, expected_grad, atol=1e-5)
+
+  def test_dropout_seed(self):
+    with self.test_session() as sess:
+      x = tf.ones([4, 100])
+      seed = tf.constant([7, 11], dtype=tf.int64)
+      (first, second, other) = sess.run(
+          (modeling.dropout(x, 0.5, seed=seed),
+           modeling.dropout(x, 0.5, seed=seed),
+           modeling.dropout(x, 0.5,
+                            seed=modeling.offset_dropout_seed(seed, 1))))
+      self.assertAllEqual(first, second)
+      self.assertNotAllClose(first, other)
+      self.assertEqual(set(first.flatten()), set([0.0, 2.0]))
+
+  def test_attention_window(self):
+    self.run_tester(BertModelTest.BertModelTester(self, attention_window=2))
+
+  def test_ffn_ranks(self):
+    self.run_tester(
+        BertModelTest.BertModelTester(
+            self,
+            ffn_ranks_per_layer=[[8, 0], [0, 8], [4, 4], [0, 0], [16, 16]]))
+
+  def test_embedding_size_and_shared_layers(self):
+    self.run_tester(
+        BertModelTest.BertModelTester(
+            self,
+            embedding_size=8,
+            share_attention_across_layers=True,
+            share_ffn_across_layers=True))
+    with self.assertRaises(ValueError):
+      modeling.transformer_model(
+          tf.zeros([2, 3, 32]),
+          hidden_size=32,
+          num_attention_heads=4,
+          recompute_every_n_layers=2,
+          share_ffn_across_layers=True)
+
+  def test_shared_layers_match_unshared_layers(self):
+    input_ids = [[31, 51, 98], [15, 5, 0]]
+    checkpoint = os.path.join(self.get_temp_dir(), "shared.ckpt")
+    config = modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=3,
+        num_attention_heads=4,
+        intermediate_size=37,
+        embedding_size=8,
+        share_attention_across_layers=True)
+
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=config, is_training=False, input_ids=tf.constant(input_ids))
+      shapes = {
+          var.op.name: var.shape.as_list() for var in tf.global_variables()
+      }
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, checkpoint)
+        expected = sess.run(model.get_sequence_output())
+
+    self.assertEqual(shapes["bert/embeddings/word_embeddings"], [99, 8])
+    self.assertEqual(
+        shapes["bert/embeddings/embedding_hidden_mapping_in/kernel"], [8, 32])
+    self.assertIn("bert/encoder/layer_0/attention/self/query/kernel", shapes)
+    self.assertIn("bert/encoder/layer_2/intermediate/dense/kernel", shapes)
+    self.assertEmpty([
+        name for name in shapes
+        if "/attention/" in name and "/layer_0/" not in name
+    ])
+
+    # Unshared layers that all start from the first layer compute the same.
+    config.share_attention_across_layers = False
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=config, is_training=False, input_ids=tf.constant(input_ids))
+      tvars = tf.trainable_variables()
+      for layer_idx in range(3):
+        (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+            [var for var in tvars if "/attention/" in var.op.name],
+            checkpoint,
+            layer_map={layer_idx: 0})
+        tf.train.init_from_checkpoint(checkpoint, assignment_map)
+      (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+          [var for var in tvars if "/attention/" not in var.op.name],
+          checkpoint)
+      tf.train.init_from_checkpoint(checkpoint, assignment_map)
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        self.assertAllClose(
+            sess.run(model.get_sequence_output()), expected, atol=1e-5)
+
+  def test_local_attention_matches_masked_attention(self):
+    (batch_size, seq_length, num_heads, size_per_head) = (2, 13, 2, 4)
+    (attention_window, num_global_tokens) = (3, 3)
+    rng = np.random.RandomState(0)
+    from_tensor = tf.constant(
+        rng.randn(batch_size, seq_length, num_heads * size_per_head),
+        dtype=tf.float32)
+    to_mask = np.ones([batch_size, seq_length], dtype=np.int32)
+    to_mask[1, 10:] = 0
+    # Only the first `num_global_tokens` global positions are global.
+    global_attention_mask = np.zeros([batch_size, seq_length], dtype=np.int32)
+    global_attention_mask[0, [0, 5, 6, 9]] = 1
+    global_attention_mask[1, [0, 2]] = 1
+    is_global = np.zeros([batch_size, seq_length], dtype=np.int32)
+    is_global[0, [0, 5, 6]] = 1
+    is_global[1, [0, 2]] = 1
+
+    positions = np.arange(seq_length)
+    attention_mask = (
+        (np.abs(positions[:, None] - positions[None, :]) <= attention_window) |
+        (is_global[:, :, None] == 1) | (is_global[:, None, :] == 1))
+    attention_mask = attention_mask * to_mask[:, None, :]
+
+    with self.test_session() as sess:
+      with tf.variable_scope("attention"):
+        expected = modeling.attention_layer(
+            from_tensor,
+            from_tensor,
+            attention_mask=tf.constant(attention_mask, dtype=tf.float32),
+            num_attention_heads=num_heads,
+            size_per_head=size_per_head)
+      with tf.variable_scope("attention", reuse=True):
+        actual = modeling.attention_layer(
+            from_tensor,
+            from_tensor,
+            attention_mask=tf.constant(to_mask),
+            num_attention_heads=num_heads,
+            size_per_head=size_per_head,
+            attention_window=attention_window,
+            global_attention_mask=tf.constant(global_attention_mask),
+            num_global_tokens=num_global_tokens)
+      sess.run(tf.global_variables_initializer())
+      (expected, actual) = sess.run((expected, actual))
+
+    self.assertAllClose(actual, expected, atol=1e-5)
+
+  def test_transformer_layer_token_pruning(self):
+    (batch_size, seq_length, hidden_size) = (2, 6, 32)
+    rng = np.random.RandomState(0)
+    layer_input = tf.constant(
+        rng.randn(batch_size * seq_length, hidden_size), dtype=tf.float32)
+    input_mask = tf.constant([[1] * 6, [1, 1, 1, 0, 0, 0]])
+    attention_mask = modeling.create_attention_mask_from_input_mask(
+        input_mask, input_mask)
+
+    kwargs = dict(
+        layer_input=layer_input,
+        attention_mask=attention_mask,
+        batch_size=batch_size,
+        seq_length=seq_length,
+        hidden_size=hidden_size,
+        num_attention_heads=4,
+        intermediate_size=37,
+        hidden_dropout_prob=0.0,
+        attention_probs_dropout_prob=0.0)
+    with self.test_session() as sess:
+      with tf.variable_scope("layer"):
+        full_output = modeling.transformer_layer(**kwargs)
+      with tf.variable_scope("layer", reuse=True):
+        (pruned_output, kept_positions) = modeling.transformer_layer(
+            num_kept_positions=3, **kwargs)
+      sess.run(tf.global_variables_initializer())
+      (full_output, pruned_output, kept_positions) = sess.run(
+          (full_output, pruned_output, kept_positions))
+
+    self.assertAllEqual(kept_positions.shape, [2, 3])
+    for positions in kept_positions:
+      self.assertEqual(positions[0], 0)
+      self.assertAllEqual(positions, sorted(positions))
+    # The padding receives no attention.
+    self.assertAllEqual(kept_positions[1], [0, 1, 2])
+    # The feed-forward network is position-wise, so the kept rows match.
+    full_output = full_output.reshape([batch_size, seq_length, hidden_size])
+    expected = np.stack(
+        [full_output[i, kept_positions[i]] for i in range(batch_size)])
+    self.assertAllClose(
+        pruned_output.reshape([batch_size, 3, hidden_size]),
+        expected,
+        atol=1e-5)
+
+  def test_token_pruning(self):
+    input_ids = [[31, 51, 98, 3, 7, 8], [15, 5, 9, 0, 0, 0]]
+    input_mask = [[1, 1, 1, 1, 1, 1], [1, 1, 1, 0, 0, 0]]
+
+    def run_model(token_pruning_schedule):
+      config = modeling.BertConfig(
+          vocab_size=99,
+          hidden_size=32,
+          num_hidden_layers=3,
+          num_attention_heads=4,
+          intermediate_size=37,
+          token_pruning_schedule=token_pruning_schedule)
+      with tf.Graph().as_default():
+        tf.set_random_seed(1)
+        model = modeling.BertModel(
+            config=config,
+            is_training=False,
+            input_ids=tf.constant(input_ids),
+            input_mask=tf.constant(input_mask))
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          return sess.run(
+              (model.get_all_encoder_layers(), model.get_pooled_output()))
+
+    (expected_layers, expected_pooled) = run_model(None)
+    # Keeping all positions does not change anything.
+    (layers, pooled) = run_model([[2, 6]])
+    self.assertAllClose(pooled, expected_pooled, atol=1e-5)
+    for (layer, expected_layer) in zip(layers, expected_layers):
+      self.assertAllClose(layer, expected_layer, atol=1e-5)
+
+    (layers, pooled) = run_model([[2, 4], [3, 2]])
+    self.assertAllEqual([x.shape[1] for x in layers], [6, 4, 2])
+    self.assertAllEqual(pooled.shape, [2, 32])
+    self.assertAllClose(layers[0], expected_layers[0], atol=1e-5)
+
+  def test_pooled_output_only(self):
+    input_ids = [[31, 51, 98, 3, 7, 8], [15, 5, 9, 0, 0, 0]]
+    input_mask = [[1, 1, 1, 1, 1, 1], [1, 1, 1, 0, 0, 0]]
+
+    def run_models(**kwargs):
+      """Returns the outputs of the full and the pooled output only model."""
+      config = modeling.BertConfig(
+          vocab_size=99,
+          hidden_size=32,
+          num_hidden_layers=3,
+          num_attention_heads=4,
+          intermediate_size=37,
+          **kwargs)
+      outputs = []
+      with tf.Graph().as_default():
+        for pooled_output_only in (False, True):
+          with tf.variable_scope("", reuse=pooled_output_only):
+            model = modeling.BertModel(
+                config=config,
+                is_training=False,
+                input_ids=tf.constant(input_ids),
+                input_mask=tf.constant(input_mask),
+                scope="bert",
+                pooled_output_only=pooled_output_only)
+          outputs.append(
+              (model.get_sequence_output(), model.get_pooled_output()))
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          return sess.run(outputs)
+
+    for kwargs in ({}, {
+        "fuse_qkv": True
+    }, {
+        "attention_window": 2
+    }, {
+        "token_pruning_schedule": [[2, 4], [3, 2]]
+    }):
+      ((expected_sequence, expected_pooled), (sequence, pooled)) = run_models(
+          **kwargs)
+      self.assertAllEqual(sequence.shape, [2, 1, 32])
+      self.assertAllClose(sequence, expected_sequence[:, :1], atol=1e-5)
+      self.assertAllClose(pooled, expected_pooled, atol=1e-5)
+
+  def test_run_encoder_layers(self):
+    input_ids = [[31, 51, 98, 3, 7, 8], [15, 5, 9, 0, 0, 0]]
+    input_mask = [[1, 1, 1, 1, 1, 1], [1, 1, 1, 0, 0, 0]]
+
+    for kwargs in ({}, {
+        "attention_window": 2
+    }, {
+        "num_attention_heads_per_layer": [4, 2, 1],
+        "intermediate_size_per_layer": [37, 30, 20],
+        "ffn_ranks_per_layer": [[4, 4], [0, 4], [4, 0]]
+    }, {
+        "share_attention_across_layers": True,
+        "share_ffn_across_layers": True
+    }):
+      config = modeling.BertConfig(
+          vocab_size=99,
+          hidden_size=32,
+          num_hidden_layers=3,
+          num_attention_heads=4,
+          intermediate_size=37,
+          **kwargs)
+      with tf.Graph().as_default():
+        model = modeling.BertModel(
+            config=config,
+            is_training=False,
+            input_ids=tf.constant(input_ids),
+            input_mask=tf.constant(input_mask),
+            scope="bert")
+        with tf.variable_scope("", reuse=True):
+          partial_model = modeling.BertModel(
+              config=config,
+              is_training=False,
+              input_ids=tf.constant(input_ids),
+              input_mask=tf.constant(input_mask),
+              scope="bert",
+              num_layers_to_run=1)
+          # Run the remaining layers on the second example only.
+          global_attention_mask = partial_model.get_global_attention_mask()
+          if global_attention_mask is not None:
+            global_attention_mask = global_attention_mask[1:]
+          layer_outputs = partial_model.run_encoder_layers(
+              partial_model.get_sequence_output()[1:], 1,
+              attention_mask=partial_model.get_attention_mask()[1:],
+              global_attention_mask=global_attention_mask)
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          (all_encoder_layers, partial_layers, layer_outputs) = sess.run(
+              (model.get_all_encoder_layers(),
+               partial_model.get_all_encoder_layers(), layer_outputs))
+
+      self.assertLen(partial_layers, 1)
+      self.assertAllClose(partial_layers[0], all_encoder_layers[0], atol=1e-5)
+      self.assertLen(layer_outputs, 2)
+      self.assertAllClose(layer_outputs[0], all_encoder_layers[1][1:],
+                          atol=1e-5)
+      self.assertAllClose(layer_outputs[1], all_encoder_layers[2][1:],
+                          atol=1e-5)
+
+    # The pruned attention mask of the skipped layers is not known.
+    config = modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=3,
+        num_attention_heads=4,
+        intermediate_size=37,
+        token_pruning_schedule=[[1, 4]])
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=config,
+          is_training=False,
+          input_ids=tf.constant(input_ids),
+          num_layers_to_run=1)
+      with self.assertRaises(ValueError):
+        model.run_encoder_layers(model.get_sequence_output(), 1)
+
+  def test_trimmed_padding_matches_full_padding(self):
+    config = modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=37)
+    input_ids = [[31, 51, 98, 3, 0, 0, 0, 0], [15, 5, 0, 0, 0, 0, 0, 0]]
+    input_mask = [[1, 1, 1, 1, 0, 0, 0, 0], [1, 1, 0, 0, 0, 0, 0, 0]]
+
+    with self.test_session() as sess:
+      input_ids_ph = tf.placeholder(tf.int32, shape=[None, None])
+      input_mask_ph = tf.placeholder(tf.int32, shape=[None, None])
+      model = modeling.BertModel(
+          config=config,
+          is_training=False,
+          input_ids=input_ids_ph,
+          input_mask=input_mask_ph)
+      sess.run(tf.global_variables_initializer())
+      ops = [model.get_sequence_output(), model.get_pooled_output()]
+
+      (full_sequence, full_pooled) = sess.run(
+          ops, {input_ids_ph: input_ids, input_mask_ph: input_mask})
+      (trimmed_sequence, trimmed_pooled) = sess.run(
+          ops, {
+              input_ids_ph: [x[:4] for x in input_ids],
+              input_mask_ph: [x[:4] for x in input_mask]
+          })
+
+    self.assertAllEqual(trimmed_sequence.shape, [2, 4, 32])
+    self.assertAllClose(trimmed_sequence, full_sequence[:, :4])
+    self.assertAllClose(trimmed_pooled, full_pooled)
+
   def test_config_to_json_string(self):
     config = modeling.BertConfig(vocab_size=99, hidden_size=37)
     obj = json.loads(config.to_json_string())
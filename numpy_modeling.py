@@ -0,0 +1,549 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A pure NumPy forward pass of `modeling.BertModel` for CPU inference.
+
+This reproduces the inference-mode (no dropout) outputs of `BertModel` from
+its trained variables, without building a TensorFlow graph. Only
+`convert_checkpoint_to_npz` needs TensorFlow; loading an .npz export and
+running the model only needs NumPy, so cold start is a file read.
+
+Example usage:
+
+```python
+# Once, where TensorFlow is installed:
+numpy_modeling.convert_checkpoint_to_npz("bert_model.ckpt", "bert_model.npz")
+
+# At serving time:
+model = numpy_modeling.NumpyBertModel.from_npz(config, "bert_model.npz")
+outputs = model.run(input_ids, input_mask, token_type_ids)
+logits = outputs.pooled_output.dot(output_weights.T) + output_bias
+```
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import math
+import numpy as np
+import six
+
+# The variables of a classifier head ("output_weights" and "output_bias") or a
+# POS tagging head ("loss/dense/*" and the CRF transitions "loss/crf"), which
+# the .npz exports keep next to the model variables.
+TASK_HEAD_VARIABLES = ("output_weights", "output_bias", "loss/dense/kernel",
+                       "loss/dense/bias", "loss/crf")
+
+BertOutputs = collections.namedtuple(
+    "BertOutputs",
+    ["embedding_output", "all_encoder_layers", "sequence_output",
+     "pooled_output"])
+
+
+class NumpyBertModel(object):
+  """Runs `BertModel` in inference mode with NumPy."""
+
+  def __init__(self, config, variables, scope="bert"):
+    """Constructor for NumpyBertModel.
+
+    Args:
+      config: `modeling.BertConfig` instance.
+      variables: Mapping from checkpoint variable names (without the ":0"
+        suffix) to arrays, e.g. the result of `np.load` on an .npz file
+        written by `convert_checkpoint_to_npz`.
+      scope: The variable scope of the model. Defaults to "bert".
+
+    Raises:
+      ValueError: The config is invalid.
+    """
+    if config.hidden_size % config.num_attention_heads != 0:
+      raise ValueError(
+          "The hidden size (%d) is not a multiple of the number of attention "
+          "heads (%d)" % (config.hidden_size, config.num_attention_heads))
+    if config.attention_window:
+      raise ValueError("Local attention (`attention_window` > 0) is not "
+                       "supported by NumpyBertModel.")
+    if config.token_pruning_schedule:
+      raise ValueError("`token_pruning_schedule` is not supported by "
+                       "NumpyBertModel.")
+    if config.ffn_ranks_per_layer:
+      raise ValueError("`ffn_ranks_per_layer` is not supported by "
+                       "NumpyBertModel.")
+    if (config.embedding_size not in (None, config.hidden_size) or
+        config.share_attention_across_layers or
+        config.share_ffn_across_layers):
+      raise ValueError("`embedding_size` and sharing layers are not supported "
+                       "by NumpyBertModel.")
+
+    fused_qkv = {}
+
+    def get(name):
+      if name in fused_qkv:
+        return fused_qkv[name]
+      return np.asarray(variables["%s/%s" % (scope, name)], dtype=np.float32)
+
+    def get_kernel(name):
+      if "%s/%s_int8" % (scope, name) in variables:
+        input_scale = variables.get("%s/%s_input_scale" % (scope, name))
+        return QuantizedKernel(
+            np.asarray(variables["%s/%s_int8" % (scope, name)], dtype=np.int8),
+            get(name + "_scale"),
+            input_scale=None if input_scale is None else float(input_scale))
+      return get(name)
+
+    self.config = config
+    self.scope = scope
+    self.intermediate_act_fn = get_activation(config.hidden_act)
+
+    self.word_embeddings = get("embeddings/word_embeddings")
+    self.token_type_embeddings = get("embeddings/token_type_embeddings")
+    self.position_embeddings = get("embeddings/position_embeddings")
+    self.embedding_layer_norm = (get("embeddings/LayerNorm/gamma"),
+                                 get("embeddings/LayerNorm/beta"))
+
+    self.layers = []
+    for layer_idx in range(config.num_hidden_layers):
+      prefix = "encoder/layer_%d/" % layer_idx
+      attention = prefix + "attention/self/"
+      if ("%s/%squery/kernel" % (scope, attention) in variables and
+          "%s/%squery_key_value/kernel" % (scope, attention) not in variables):
+        # Concatenating the projections here turns three matmuls per layer
+        # into one.
+        for suffix in ("kernel", "bias"):
+          fused_qkv[attention + "query_key_value/" + suffix] = np.concatenate(
+              [get(attention + x + "/" + suffix)
+               for x in ("query", "key", "value")],
+              axis=-1)
+
+      layer = {"num_attention_heads": config.num_attention_heads}
+      if config.num_attention_heads_per_layer:
+        layer["num_attention_heads"] = (
+            config.num_attention_heads_per_layer[layer_idx])
+      for (key, name) in _LAYER_DENSE_VARIABLES:
+        layer[key + "_kernel"] = get_kernel(prefix + name + "kernel")
+        layer[key + "_bias"] = get(prefix + name + "bias")
+      for (key, name) in _LAYER_NORM_VARIABLES:
+        layer[key] = (get(prefix + name + "gamma"), get(prefix + name + "beta"))
+      self.layers.append(layer)
+
+    self.pooler = {
+        "kernel": get_kernel("pooler/dense/kernel"),
+        "bias": get("pooler/dense/bias"),
+    }
+
+  @classmethod
+  def from_npz(cls, config, npz_file, scope="bert"):
+    """Loads a model from a file written by `convert_checkpoint_to_npz`."""
+    with np.load(npz_file) as variables:
+      return cls(config, variables, scope=scope)
+
+  @classmethod
+  def from_checkpoint(cls, config, init_checkpoint, scope="bert"):
+    """Loads a model directly from a TensorFlow checkpoint."""
+    return cls(config, _read_checkpoint(init_checkpoint, scope), scope=scope)
+
+  def get_variables(self):
+    """Returns the model's variables, in the format the constructor reads.
+
+    The query/key/value projections are always returned fused. A
+    `QuantizedKernel` named "<name>/kernel" is returned as the arrays
+    "<name>/kernel_int8", "<name>/kernel_scale" and, if it is calibrated,
+    "<name>/kernel_input_scale".
+    """
+    variables = collections.OrderedDict()
+
+    def put(name, value):
+      name = "%s/%s" % (self.scope, name)
+      if isinstance(value, QuantizedKernel):
+        variables[name + "_int8"] = value.values
+        variables[name + "_scale"] = value.scale
+        if value.input_scale is not None:
+          variables[name + "_input_scale"] = np.float32(value.input_scale)
+      else:
+        variables[name] = value
+
+    put("embeddings/word_embeddings", self.word_embeddings)
+    put("embeddings/token_type_embeddings", self.token_type_embeddings)
+    put("embeddings/position_embeddings", self.position_embeddings)
+    put("embeddings/LayerNorm/gamma", self.embedding_layer_norm[0])
+    put("embeddings/LayerNorm/beta", self.embedding_layer_norm[1])
+    for (layer_idx, layer) in enumerate(self.layers):
+      prefix = "encoder/layer_%d/" % layer_idx
+      for (key, name) in _LAYER_DENSE_VARIABLES:
+        put(prefix + name + "kernel", layer[key + "_kernel"])
+        put(prefix + name + "bias", layer[key + "_bias"])
+      for (key, name) in _LAYER_NORM_VARIABLES:
+        put(prefix + name + "gamma", layer[key][0])
+        put(prefix + name + "beta", layer[key][1])
+    put("pooler/dense/kernel", self.pooler["kernel"])
+    put("pooler/dense/bias", self.pooler["bias"])
+    return variables
+
+  def save_npz(self, npz_file, extra_variables=None):
+    """Writes the model's variables to an .npz file for `from_npz`.
+
+    Args:
+      npz_file: The file to write.
+      extra_variables: (optional) dict of further arrays to write, e.g. the
+        task head returned by `read_task_head`.
+    """
+    variables = self.get_variables()
+    if extra_variables:
+      variables.update(extra_variables)
+    np.savez(npz_file, **variables)
+
+  def get_kernels(self):
+    """Returns a list of (owner, key) pairs addressing every dense kernel.
+
+    `owner[key]` is the kernel, so callers such as `quantize_model` can
+    replace it in place.
+    """
+    kernels = []
+    for layer in self.layers:
+      for (key, _) in _LAYER_DENSE_VARIABLES:
+        kernels.append((layer, key + "_kernel"))
+    kernels.append((self.pooler, "kernel"))
+    return kernels
+
+  def run(self, input_ids, input_mask=None, token_type_ids=None,
+          do_return_all_layers=False):
+    """Runs the model.
+
+    Args:
+      input_ids: int array of shape [batch_size, seq_length].
+      input_mask: (optional) int array of shape [batch_size, seq_length].
+      token_type_ids: (optional) int array of shape [batch_size, seq_length].
+      do_return_all_layers: bool. Whether to keep the output of every encoder
+        layer in `all_encoder_layers`. If False, it only holds the last one.
+
+    Returns:
+      A `BertOutputs` of float32 arrays, shaped like the corresponding
+      `BertModel` getters.
+    """
+    input_ids = np.asarray(input_ids)
+    (batch_size, seq_length) = input_ids.shape
+    if seq_length > self.config.max_position_embeddings:
+      raise ValueError(
+          "The sequence length (%d) is longer than max_position_embeddings "
+          "(%d)" % (seq_length, self.config.max_position_embeddings))
+    if input_mask is None:
+      input_mask = np.ones([batch_size, seq_length], dtype=np.int32)
+    if token_type_ids is None:
+      token_type_ids = np.zeros([batch_size, seq_length], dtype=np.int32)
+
+    # `embedding_output` = [B, S, H]
+    embedding_output = self.word_embeddings[input_ids]
+    embedding_output += self.token_type_embeddings[token_type_ids]
+    embedding_output += self.position_embeddings[:seq_length]
+    layer_norm(embedding_output, *self.embedding_layer_norm)
+
+    # `attention_adder` = [B, 1, 1, S], 0.0 for positions to attend to and
+    # -10000.0 for padding, as in `modeling.attention_layer`.
+    attention_adder = (1.0 - np.asarray(input_mask, dtype=np.float32)) * (
+        -10000.0)
+    attention_adder = attention_adder[:, np.newaxis, np.newaxis, :]
+
+    prev_output = embedding_output.reshape([batch_size * seq_length, -1])
+    all_layer_outputs = []
+    for layer in self.layers:
+      prev_output = self._run_layer(layer, prev_output, attention_adder,
+                                    batch_size, seq_length)
+      if do_return_all_layers:
+        all_layer_outputs.append(
+            prev_output.reshape([batch_size, seq_length, -1]))
+
+    sequence_output = prev_output.reshape([batch_size, seq_length, -1])
+    if not do_return_all_layers:
+      all_layer_outputs.append(sequence_output)
+
+    pooled_output = matmul(sequence_output[:, 0], self.pooler["kernel"])
+    pooled_output += self.pooler["bias"]
+    np.tanh(pooled_output, out=pooled_output)
+
+    return BertOutputs(
+        embedding_output=embedding_output,
+        all_encoder_layers=all_layer_outputs,
+        sequence_output=sequence_output,
+        pooled_output=pooled_output)
+
+  def _run_layer(self, layer, layer_input, attention_adder, batch_size,
+                 seq_length):
+    """Runs one encoder layer on a [B*S, H] input."""
+    num_heads = layer["num_attention_heads"]
+    head_size = self.config.hidden_size // self.config.num_attention_heads
+
+    # `qkv` = [B*S, 3*N*H/N]
+    qkv = matmul(layer_input, layer["qkv_kernel"])
+    qkv += layer["qkv_bias"]
+    # `qkv` = [3, B, N, S, H/N]
+    qkv = qkv.reshape([batch_size, seq_length, 3, num_heads, head_size])
+    qkv = qkv.transpose([2, 0, 3, 1, 4])
+    (query, key, value) = (qkv[0], qkv[1], qkv[2])
+
+    # `attention_probs` = [B, N, S, S]
+    attention_probs = np.matmul(query, key.transpose([0, 1, 3, 2]))
+    attention_probs *= 1.0 / math.sqrt(float(head_size))
+    attention_probs += attention_adder
+    softmax(attention_probs)
+
+    # `context` = [B*S, N*H/N]
+    context = np.matmul(attention_probs, value)
+    context = context.transpose([0, 2, 1, 3]).reshape(
+        [batch_size * seq_length, num_heads * head_size])
+
+    attention_output = matmul(context, layer["attention_output_kernel"])
+    attention_output += layer["attention_output_bias"]
+    attention_output += layer_input
+    layer_norm(attention_output, *layer["attention_layer_norm"])
+
+    intermediate_output = matmul(attention_output,
+                                 layer["intermediate_kernel"])
+    intermediate_output += layer["intermediate_bias"]
+    if self.intermediate_act_fn is not None:
+      self.intermediate_act_fn(intermediate_output)
+
+    layer_output = matmul(intermediate_output, layer["output_kernel"])
+    layer_output += layer["output_bias"]
+    layer_output += attention_output
+    layer_norm(layer_output, *layer["output_layer_norm"])
+    return layer_output
+
+
+# (layer dict key, variable name under "encoder/layer_%d/") of the dense layers
+# and layer norms of an encoder layer.
+_LAYER_DENSE_VARIABLES = [
+    ("qkv", "attention/self/query_key_value/"),
+    ("attention_output", "attention/output/dense/"),
+    ("intermediate", "intermediate/dense/"),
+    ("output", "output/dense/"),
+]
+_LAYER_NORM_VARIABLES = [
+    ("attention_layer_norm", "attention/output/LayerNorm/"),
+    ("output_layer_norm", "output/LayerNorm/"),
+]
+
+
+class QuantizedKernel(object):
+  """A dense kernel quantized to int8 with one scale per output channel.
+
+  `values * scale` approximates the float kernel. Inputs are quantized to
+  int8 too, either with a fixed `input_scale` found by calibration or, if it
+  is None, with a scale per input row computed on the fly. The product of the
+  int8 operands is then rescaled to float32.
+
+  NumPy has no fast integer GEMM, so the int8 values are held as float32 for
+  BLAS and only stored as int8. This shrinks the .npz file by about 4x but
+  not the memory or the latency of inference.
+  """
+
+  def __init__(self, values, scale, input_scale=None):
+    # Converted once here rather than on every `matmul`. The values are
+    # integers in [-127, 127], which float32 holds exactly.
+    self._float_values = values.astype(np.float32)
+    self.scale = scale
+    self.input_scale = input_scale
+    self.calibration_max = None
+
+  @classmethod
+  def from_kernel(cls, kernel):
+    """Quantizes a float [in_width, out_width] kernel symmetrically."""
+    max_abs = np.max(np.abs(kernel), axis=0)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    values = np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8)
+    return cls(values, scale)
+
+  @property
+  def values(self):
+    """The int8 [in_width, out_width] kernel."""
+    return self._float_values.astype(np.int8)
+
+  @property
+  def shape(self):
+    return self._float_values.shape
+
+  def dequantize(self):
+    return self._float_values * self.scale
+
+  def matmul(self, x):
+    """Returns approximately `np.dot(x, dequantize())` for a 2D float `x`."""
+    if self.calibration_max is not None:
+      self.calibration_max = max(self.calibration_max, float(np.max(np.abs(x))))
+
+    if self.input_scale is not None:
+      x_scale = np.float32(self.input_scale)
+    else:
+      x_scale = np.max(np.abs(x), axis=-1, keepdims=True) / np.float32(127.0)
+      x_scale[x_scale == 0] = 1.0
+    x_values = np.rint(x / x_scale)
+    np.clip(x_values, -127, 127, out=x_values)
+
+    # The int8 operands are multiplied as float32 so that the product runs
+    # through BLAS. Every product and partial sum is an integer of at most
+    # 127 * 127 * in_width, which float32 holds exactly up to 2**24 and to
+    # within a relative 6e-8 beyond that.
+    output = np.dot(x_values.astype(np.float32, copy=False),
+                    self._float_values)
+    output *= x_scale
+    output *= self.scale
+    return output
+
+
+def matmul(x, kernel):
+  """Multiplies `x` by a float kernel or a `QuantizedKernel`."""
+  if isinstance(kernel, QuantizedKernel):
+    return kernel.matmul(x)
+  return np.dot(x, kernel)
+
+
+def quantize_model(model, calibration_batches=None):
+  """Quantizes every dense kernel of a `NumpyBertModel` to int8 in place.
+
+  The embedding tables, biases and layer norms stay in float32.
+
+  Args:
+    model: `NumpyBertModel` instance.
+    calibration_batches: (optional) Iterable of dicts of `NumpyBertModel.run`
+      keyword arguments, e.g. a sample of converted dev set features. If
+      given, each kernel gets a fixed input scale from the largest input
+      magnitude it sees on these batches. Otherwise the inputs are quantized
+      with dynamic per-row scales.
+
+  Returns:
+    `model`.
+  """
+  kernels = model.get_kernels()
+  for (owner, key) in kernels:
+    if not isinstance(owner[key], QuantizedKernel):
+      owner[key] = QuantizedKernel.from_kernel(owner[key])
+
+  if calibration_batches is not None:
+    for (owner, key) in kernels:
+      owner[key].input_scale = None
+      owner[key].calibration_max = 0.0
+    for batch in calibration_batches:
+      model.run(**batch)
+    for (owner, key) in kernels:
+      kernel = owner[key]
+      if kernel.calibration_max > 0:
+        kernel.input_scale = kernel.calibration_max / 127.0
+      kernel.calibration_max = None
+  return model
+
+
+def convert_checkpoint_to_npz(init_checkpoint, npz_file, scope="bert"):
+  """Writes the model variables of a checkpoint to an .npz file.
+
+  Optimizer slots and variables outside of `scope` are not written, except
+  for the `TASK_HEAD_VARIABLES` that are present.
+  """
+  np.savez(npz_file, **_read_checkpoint(init_checkpoint, scope,
+                                        extra_names=TASK_HEAD_VARIABLES))
+
+
+def read_task_head(init_checkpoint):
+  """Returns the `TASK_HEAD_VARIABLES` that a checkpoint has, by name."""
+  return _read_checkpoint(init_checkpoint, None,
+                          extra_names=TASK_HEAD_VARIABLES)
+
+
+def _read_checkpoint(init_checkpoint, scope, extra_names=()):
+  # Only this path needs TensorFlow, so it is not imported at module level.
+  import tensorflow as tf  # pylint: disable=g-import-not-at-top
+
+  reader = tf.train.load_checkpoint(init_checkpoint)
+  variables = {}
+  for name in six.iterkeys(reader.get_variable_to_shape_map()):
+    if name.endswith("/adam_m") or name.endswith("/adam_v"):
+      continue
+    if ((scope is not None and name.startswith(scope + "/")) or
+        name in extra_names):
+      variables[name] = reader.get_tensor(name)
+  return variables
+
+
+def gelu(x):
+  """Applies `modeling.gelu` to the float array `x` in place."""
+  cdf = x * x
+  cdf *= x
+  cdf *= 0.044715
+  cdf += x
+  cdf *= np.sqrt(2 / np.pi)
+  np.tanh(cdf, out=cdf)
+  cdf += 1.0
+  cdf *= 0.5
+  x *= cdf
+  return x
+
+
+def relu(x):
+  """Applies ReLU to the float array `x` in place."""
+  np.maximum(x, 0.0, out=x)
+  return x
+
+
+def tanh(x):
+  """Applies tanh to the float array `x` in place."""
+  np.tanh(x, out=x)
+  return x
+
+
+def get_activation(activation_string):
+  """Maps a string to an in-place activation, like `modeling.get_activation`.
+
+  Args:
+    activation_string: String name of the activation function.
+
+  Returns:
+    A function that applies the activation to an array in place, or None for
+    an empty or "linear" activation.
+
+  Raises:
+    ValueError: The `activation_string` does not correspond to a known
+      activation.
+  """
+  if not activation_string:
+    return None
+
+  act = activation_string.lower()
+  if act == "linear":
+    return None
+  elif act == "relu":
+    return relu
+  elif act == "gelu":
+    return gelu
+  elif act == "tanh":
+    return tanh
+  else:
+    raise ValueError("Unsupported activation: %s" % act)
+
+
+def layer_norm(x, gamma, beta, epsilon=1e-12):
+  """Layer-normalizes the last dimension of the float array `x` in place."""
+  x -= x.mean(axis=-1, keepdims=True)
+  variance = np.mean(np.square(x), axis=-1, keepdims=True)
+  variance += epsilon
+  x /= np.sqrt(variance)
+  x *= gamma
+  x += beta
+  return x
+
+
+def softmax(x):
+  """Applies a softmax over the last axis of the float array `x` in place."""
+  x -= x.max(axis=-1, keepdims=True)
+  np.exp(x, out=x)
+  x /= x.sum(axis=-1, keepdims=True)
+  return x
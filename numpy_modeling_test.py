@@ -0,0 +1,192 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import random
+
+import modeling
+import numpy as np
+import numpy_modeling
+import tensorflow as tf
+
+
+class NumpyBertModelTest(tf.test.TestCase):
+
+  def create_config(self, **kwargs):
+    return modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=3,
+        num_attention_heads=4,
+        intermediate_size=37,
+        type_vocab_size=2,
+        **kwargs)
+
+  def create_inputs(self, batch_size=3, seq_length=9):
+    rng = random.Random(12345)
+    input_ids = [[rng.randint(0, 98)
+                  for _ in range(seq_length)]
+                 for _ in range(batch_size)]
+    input_mask = []
+    for _ in range(batch_size):
+      length = rng.randint(1, seq_length)
+      input_mask.append([1] * length + [0] * (seq_length - length))
+    token_type_ids = [[rng.randint(0, 1)
+                       for _ in range(seq_length)]
+                      for _ in range(batch_size)]
+    return (input_ids, input_mask, token_type_ids)
+
+  def run_bert_model(self, config, input_ids, input_mask, token_type_ids):
+    """Returns the outputs of `BertModel` and the values of its variables."""
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=config,
+          is_training=False,
+          input_ids=tf.constant(input_ids),
+          input_mask=tf.constant(input_mask),
+          token_type_ids=tf.constant(token_type_ids))
+      outputs = {
+          "embedding_output": model.get_embedding_output(),
+          "all_encoder_layers": model.get_all_encoder_layers(),
+          "sequence_output": model.get_sequence_output(),
+          "pooled_output": model.get_pooled_output(),
+      }
+      tvars = tf.trainable_variables()
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        (outputs, values) = sess.run((outputs, tvars))
+        checkpoint = os.path.join(self.get_temp_dir(), "model.ckpt")
+        tf.train.Saver().save(sess, checkpoint)
+
+    variables = {}
+    for (var, value) in zip(tvars, values):
+      variables[var.name[:-len(":0")]] = value
+    return (outputs, variables, checkpoint)
+
+  def check_outputs(self, expected, actual):
+    self.assertAllClose(actual.embedding_output, expected["embedding_output"],
+                        atol=1e-5)
+    self.assertEqual(
+        len(actual.all_encoder_layers), len(expected["all_encoder_layers"]))
+    for (x, y) in zip(actual.all_encoder_layers,
+                      expected["all_encoder_layers"]):
+      self.assertAllClose(x, y, atol=1e-5)
+    self.assertAllClose(actual.sequence_output, expected["sequence_output"],
+                        atol=1e-5)
+    self.assertAllClose(actual.pooled_output, expected["pooled_output"],
+                        atol=1e-5)
+
+  def test_matches_bert_model(self):
+    config = self.create_config()
+    (input_ids, input_mask, token_type_ids) = self.create_inputs()
+    (expected, variables, checkpoint) = self.run_bert_model(
+        config, input_ids, input_mask, token_type_ids)
+
+    model = numpy_modeling.NumpyBertModel(config, variables)
+    self.check_outputs(
+        expected,
+        model.run(input_ids, input_mask, token_type_ids,
+                  do_return_all_layers=True))
+
+    npz_file = os.path.join(self.get_temp_dir(), "model.npz")
+    numpy_modeling.convert_checkpoint_to_npz(checkpoint, npz_file)
+    model = numpy_modeling.NumpyBertModel.from_npz(config, npz_file)
+    outputs = model.run(input_ids, input_mask, token_type_ids)
+    self.assertEqual(len(outputs.all_encoder_layers), 1)
+    self.assertAllClose(outputs.pooled_output, expected["pooled_output"],
+                        atol=1e-5)
+
+  def test_matches_bert_model_with_fused_qkv(self):
+    config = self.create_config(fuse_qkv=True, hidden_act="relu")
+    (input_ids, input_mask, token_type_ids) = self.create_inputs()
+    (expected, variables, _) = self.run_bert_model(
+        config, input_ids, input_mask, token_type_ids)
+
+    model = numpy_modeling.NumpyBertModel(config, variables)
+    self.check_outputs(
+        expected,
+        model.run(input_ids, input_mask, token_type_ids,
+                  do_return_all_layers=True))
+
+  def test_matches_bert_model_with_per_layer_sizes(self):
+    config = self.create_config(
+        num_attention_heads_per_layer=[4, 1, 2],
+        intermediate_size_per_layer=[37, 5, 16])
+    (input_ids, input_mask, token_type_ids) = self.create_inputs()
+    (expected, variables, _) = self.run_bert_model(
+        config, input_ids, input_mask, token_type_ids)
+
+    model = numpy_modeling.NumpyBertModel(config, variables)
+    self.check_outputs(
+        expected,
+        model.run(input_ids, input_mask, token_type_ids,
+                  do_return_all_layers=True))
+
+  def test_quantize_model(self):
+    config = self.create_config()
+    (input_ids, input_mask, token_type_ids) = self.create_inputs()
+    (expected, variables, _) = self.run_bert_model(
+        config, input_ids, input_mask, token_type_ids)
+
+    model = numpy_modeling.quantize_model(
+        numpy_modeling.NumpyBertModel(config, variables))
+    for (owner, key) in model.get_kernels():
+      self.assertIsInstance(owner[key], numpy_modeling.QuantizedKernel)
+      self.assertEqual(owner[key].values.dtype, np.int8)
+      self.assertIsNone(owner[key].input_scale)
+    outputs = model.run(input_ids, input_mask, token_type_ids)
+    self.assertAllClose(outputs.sequence_output, expected["sequence_output"],
+                        atol=5e-2)
+    self.assertAllClose(outputs.pooled_output, expected["pooled_output"],
+                        atol=5e-2)
+
+    calibration_batches = [{
+        "input_ids": input_ids,
+        "input_mask": input_mask,
+        "token_type_ids": token_type_ids,
+    }]
+    numpy_modeling.quantize_model(model, calibration_batches)
+    for (owner, key) in model.get_kernels():
+      self.assertGreater(owner[key].input_scale, 0)
+    calibrated_outputs = model.run(input_ids, input_mask, token_type_ids)
+    self.assertAllClose(calibrated_outputs.pooled_output,
+                        expected["pooled_output"], atol=5e-2)
+
+    # The export keeps the task head of the checkpoint, as
+    # quantize_checkpoint.py writes it.
+    head_checkpoint = os.path.join(self.get_temp_dir(), "head.ckpt")
+    output_weights = np.random.RandomState(0).randn(3, 32).astype(np.float32)
+    modeling.write_checkpoint(
+        dict(variables, output_weights=output_weights,
+             output_bias=np.zeros([3], dtype=np.float32)), head_checkpoint)
+    npz_file = os.path.join(self.get_temp_dir(), "quantized.npz")
+    model.save_npz(
+        npz_file,
+        extra_variables=numpy_modeling.read_task_head(head_checkpoint))
+    with np.load(npz_file) as saved:
+      self.assertAllEqual(saved["output_weights"], output_weights)
+      self.assertIn("output_bias", saved)
+    model = numpy_modeling.NumpyBertModel.from_npz(config, npz_file)
+    for (owner, key) in model.get_kernels():
+      self.assertEqual(owner[key].values.dtype, np.int8)
+    outputs = model.run(input_ids, input_mask, token_type_ids)
+    self.assertAllClose(outputs.pooled_output, calibrated_outputs.pooled_output)
+
+
+if __name__ == "__main__":
+  tf.test.main()
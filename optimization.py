@@ -21,9 +21,31 @@ from __future__ import print_function
 import re
 import tensorflow as tf
 
+# Dynamic loss scaling parameters, see `create_optimizer`.
+_INITIAL_LOSS_SCALE = 2.0**15
+_LOSS_SCALE_INCREMENT_EVERY = 2000
 
-def create_optimizer(loss, init_lr, num_train_steps, num_warmup_steps, use_tpu):
-  """Creates an optimizer training op."""
+
+def create_optimizer(loss, init_lr, num_train_steps, num_warmup_steps, use_tpu,
+                     use_loss_scaling=False):
+  """Creates an optimizer training op.
+
+  Args:
+    loss: float32 scalar Tensor.
+    init_lr: float. The peak learning rate.
+    num_train_steps: int. Number of steps over which the learning rate decays.
+    num_warmup_steps: int. Number of steps of linear warmup.
+    use_tpu: bool. Whether the model runs on TPU.
+    use_loss_scaling: bool. Whether to use dynamic loss scaling, which a model
+      with a float16 `compute_dtype` needs so that small gradients do not
+      underflow. The loss is multiplied by a scale before differentiation
+      and the gradients are divided by it. A step whose gradients overflow is
+      skipped and halves the scale; the scale doubles after every
+      `_LOSS_SCALE_INCREMENT_EVERY` steps without overflow.
+
+  Returns:
+    The training op.
+  """
   global_step = tf.train.get_or_create_global_step()
 
   learning_rate = tf.constant(value=init_lr, shape=[], dtype=tf.float32)
@@ -68,22 +90,83 @@ def create_optimizer(loss, init_lr, num_train_steps, num_warmup_steps, use_tpu):
     optimizer = tf.contrib.tpu.CrossShardOptimizer(optimizer)
 
   tvars = tf.trainable_variables()
-  grads = tf.gradients(loss, tvars)
+  if not use_loss_scaling:
+    grads = tf.gradients(loss, tvars)
+  else:
+    loss_scale = tf.get_variable(
+        name="loss_scale",
+        shape=[],
+        dtype=tf.float32,
+        trainable=False,
+        initializer=tf.constant_initializer(_INITIAL_LOSS_SCALE))
+    grads = tf.gradients(loss * loss_scale, tvars)
+    grads = [None if grad is None else grad / loss_scale for grad in grads]
+    all_finite = tf.reduce_all(
+        [tf.reduce_all(tf.is_finite(grad)) for grad in grads
+         if grad is not None])
+    # Keep the non-finite values out of the global norm below. The update of
+    # an overflowed step is skipped anyway.
+    grads = [
+        None if grad is None else tf.where(all_finite, grad,
+                                           tf.zeros_like(grad))
+        for grad in grads
+    ]
 
   # This is how the model was pre-trained.
   (grads, _) = tf.clip_by_global_norm(grads, clip_norm=1.0)
 
-  train_op = optimizer.apply_gradients(
-      zip(grads, tvars), global_step=global_step)
+  if not use_loss_scaling:
+    train_op = optimizer.apply_gradients(
+        zip(grads, tvars), global_step=global_step)
+  else:
+    train_op = tf.cond(
+        all_finite,
+        lambda: optimizer.apply_gradients(zip(grads, tvars)),
+        tf.no_op)
+    train_op = tf.group(train_op,
+                        update_loss_scale(loss_scale, all_finite))
 
   # Normally the global step update is done inside of `apply_gradients`.
   # However, `AdamWeightDecayOptimizer` doesn't do this. But if you use
   # a different optimizer, you should probably take this line out.
   new_global_step = global_step + 1
+  if use_loss_scaling:
+    # Skipped steps are retried, so that the model still gets
+    # `num_train_steps` updates.
+    new_global_step = tf.where(all_finite, new_global_step, global_step)
   train_op = tf.group(train_op, [global_step.assign(new_global_step)])
   return train_op
 
 
+def update_loss_scale(loss_scale, all_finite):
+  """Returns an op that updates the dynamic loss scale after a step.
+
+  Args:
+    loss_scale: float32 scalar variable.
+    all_finite: bool scalar Tensor. Whether all the gradients of the step
+      were finite.
+
+  Returns:
+    The update op.
+  """
+  good_steps = tf.get_variable(
+      name="loss_scale_good_steps",
+      shape=[],
+      dtype=tf.int32,
+      trainable=False,
+      initializer=tf.zeros_initializer())
+
+  next_good_steps = tf.where(all_finite, good_steps + 1, 0)
+  do_increment = next_good_steps >= _LOSS_SCALE_INCREMENT_EVERY
+  next_loss_scale = tf.where(
+      all_finite,
+      tf.where(do_increment, loss_scale * 2.0, loss_scale),
+      tf.maximum(loss_scale / 2.0, 1.0))
+  next_good_steps = tf.where(do_increment, 0, next_good_steps)
+  return tf.group(
+      loss_scale.assign(next_loss_scale), good_steps.assign(next_good_steps))
+
+
 class AdamWeightDecayOptimizer(tf.train.Optimizer):
   """A basic Adam optimizer that includes "correct" L2 weight decay."""
 
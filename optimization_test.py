@@ -43,6 +43,41 @@ class OptimizationTest(tf.test.TestCase):
       w_np = sess.run(w)
       self.assertAllClose(w_np.flat, [0.4, 0.2, -0.5], rtol=1e-2, atol=1e-2)
 
+  def test_loss_scaling_skips_overflowed_steps(self):
+    with self.test_session() as sess:
+      w = tf.get_variable(
+          "w",
+          shape=[3],
+          initializer=tf.constant_initializer([0.1, -0.2, -0.1]))
+      x = tf.constant([0.4, 0.2, -0.5])
+      overflow = tf.placeholder(tf.bool, shape=[])
+      loss = tf.reduce_mean(tf.square(x - w))
+      loss *= tf.where(overflow, float("inf"), 1.0)
+      train_op = optimization.create_optimizer(
+          loss,
+          init_lr=0.2,
+          num_train_steps=1000,
+          num_warmup_steps=0,
+          use_tpu=False,
+          use_loss_scaling=True)
+      global_step = tf.train.get_global_step()
+      loss_scale = [
+          v for v in tf.global_variables() if v.op.name == "loss_scale"
+      ][0]
+      sess.run(tf.global_variables_initializer())
+      initial_loss_scale = sess.run(loss_scale)
+
+      sess.run(train_op, feed_dict={overflow: True})
+      self.assertAllClose(sess.run(w), [0.1, -0.2, -0.1])
+      self.assertEqual(sess.run(global_step), 0)
+      self.assertEqual(sess.run(loss_scale), initial_loss_scale / 2)
+
+      for _ in range(100):
+        sess.run(train_op, feed_dict={overflow: False})
+      self.assertEqual(sess.run(global_step), 100)
+      self.assertAllClose(
+          sess.run(w), [0.4, 0.2, -0.5], rtol=1e-1, atol=1e-1)
+
 
 if __name__ == "__main__":
   tf.test.main()
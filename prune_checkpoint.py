@@ -0,0 +1,431 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Structured pruning of attention heads and feed-forward neurons.
+
+Scores every attention head and intermediate (feed-forward) neuron of a
+fine-tuned classifier or POS tagging checkpoint by its importance on a dev set,
+removes the least important ones and writes a physically smaller checkpoint
+with the matching `bert_config.json`, which sets `num_attention_heads_per_layer`
+and `intermediate_size_per_layer`.
+
+The importance of a head or neuron is the mask-based score of "Are Sixteen
+Heads Really Better than One?" (Michel et al., 2019): the magnitude of the
+gradient of the loss with respect to a mask multiplying its output, averaged
+over batches. Masking a head or neuron is the same as scaling its rows of the
+following dense kernel, so the score is read off the gradient of that kernel.
+The scores are normalized per layer and ranked across layers, so layers can
+end up with different sizes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+
+import feature_reader
+import modeling
+import numpy as np
+import six
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    "bert_config_file", None,
+    "The config json file corresponding to the fine-tuned BERT model.")
+
+flags.DEFINE_string("init_checkpoint", None,
+                    "The fine-tuned checkpoint to prune.")
+
+flags.DEFINE_string(
+    "eval_file", None,
+    "TFRecord file of converted dev set features with labels, i.e. the "
+    "eval.tf_record written by run_classifier.py (`label_ids`) or "
+    "run_pos_tagging.py (`tag_ids`).")
+
+flags.DEFINE_string(
+    "output_dir", None,
+    "Where to write the pruned checkpoint (model.ckpt) and its "
+    "bert_config.json.")
+
+flags.DEFINE_float("head_keep_ratio", 0.5,
+                   "Fraction of all attention heads to keep.")
+
+flags.DEFINE_float("ffn_keep_ratio", 0.5,
+                   "Fraction of all intermediate neurons to keep.")
+
+flags.DEFINE_integer("max_seq_length", 128,
+                     "The sequence length the features were written with.")
+
+flags.DEFINE_integer("batch_size", 8, "Batch size for scoring and eval.")
+
+flags.DEFINE_integer(
+    "num_eval_examples", None,
+    "If set, only score and evaluate on this many examples.")
+
+
+def get_layer_sizes(bert_config):
+  """Returns the per-layer (num_attention_heads, intermediate_size) lists."""
+  num_attention_heads_per_layer = (
+      bert_config.num_attention_heads_per_layer or
+      [bert_config.num_attention_heads] * bert_config.num_hidden_layers)
+  intermediate_size_per_layer = (
+      bert_config.intermediate_size_per_layer or
+      [bert_config.intermediate_size] * bert_config.num_hidden_layers)
+  return (list(num_attention_heads_per_layer),
+          list(intermediate_size_per_layer))
+
+
+class TaskGraph(object):
+  """The model and task loss of a fine-tuned checkpoint, fed by placeholders.
+
+  The task head is read from the checkpoint, as `run_classifier.create_model`
+  ("output_weights") or `run_pos_tagging.create_model` ("loss/dense", with a
+  CRF) create it.
+  """
+
+  def __init__(self, bert_config, init_checkpoint, max_seq_length):
+    reader = tf.train.load_checkpoint(init_checkpoint)
+    var_to_shape = reader.get_variable_to_shape_map()
+    if "output_weights" in var_to_shape:
+      self.task = "classifier"
+    elif "loss/dense/kernel" in var_to_shape:
+      self.task = "pos"
+    else:
+      raise ValueError("%s has neither a classifier nor a POS tagging head" %
+                       init_checkpoint)
+
+    self.features = {
+        "input_ids": tf.placeholder(tf.int32, [None, max_seq_length]),
+        "input_mask": tf.placeholder(tf.int32, [None, max_seq_length]),
+        "segment_ids": tf.placeholder(tf.int32, [None, max_seq_length]),
+    }
+    model = modeling.BertModel(
+        config=bert_config,
+        is_training=False,
+        input_ids=self.features["input_ids"],
+        input_mask=self.features["input_mask"],
+        token_type_ids=self.features["segment_ids"],
+        pooled_output_only=self.task == "classifier")
+
+    if self.task == "classifier":
+      num_labels = var_to_shape["output_weights"][0]
+      self.features["label_ids"] = tf.placeholder(tf.int32, [None])
+      output_weights = tf.get_variable(
+          "output_weights", [num_labels, bert_config.hidden_size])
+      output_bias = tf.get_variable("output_bias", [num_labels])
+      logits = tf.nn.bias_add(
+          tf.matmul(model.get_pooled_output(), output_weights,
+                    transpose_b=True), output_bias)
+      one_hot_labels = tf.one_hot(
+          self.features["label_ids"], depth=num_labels, dtype=tf.float32)
+      per_example_loss = -tf.reduce_sum(
+          one_hot_labels * tf.nn.log_softmax(logits, axis=-1), axis=-1)
+      is_correct = tf.equal(
+          tf.argmax(logits, axis=-1, output_type=tf.int32),
+          self.features["label_ids"])
+      self.loss = tf.reduce_mean(per_example_loss)
+      self.num_correct = tf.reduce_sum(tf.cast(is_correct, tf.int32))
+      self.num_total = tf.size(is_correct)
+    else:
+      num_tags = var_to_shape["loss/dense/kernel"][1]
+      self.features["tag_ids"] = tf.placeholder(tf.int32,
+                                                [None, max_seq_length - 1])
+      self.features["sentence_len"] = tf.placeholder(tf.int32, [None])
+      with tf.variable_scope("loss"):
+        # Ignore the [CLS] token, as `run_pos_tagging.create_model` does.
+        logits = tf.layers.dense(model.get_sequence_output()[:, 1:, :],
+                                 num_tags)
+        crf_params = tf.get_variable("crf", [num_tags, num_tags])
+      (log_likelihood, _) = tf.contrib.crf.crf_log_likelihood(
+          logits, self.features["tag_ids"], self.features["sentence_len"],
+          crf_params)
+      (pred_ids, _) = tf.contrib.crf.crf_decode(
+          logits, crf_params, self.features["sentence_len"])
+      weights = tf.sequence_mask(self.features["sentence_len"],
+                                 max_seq_length - 1)
+      self.loss = tf.reduce_mean(-log_likelihood)
+      self.num_correct = tf.reduce_sum(
+          tf.cast(tf.equal(pred_ids, self.features["tag_ids"]), tf.int32) *
+          tf.cast(weights, tf.int32))
+      self.num_total = tf.reduce_sum(self.features["sentence_len"])
+
+    tvars = tf.trainable_variables()
+    (assignment_map,
+     _) = modeling.get_assignment_map_from_checkpoint(tvars, init_checkpoint)
+    tf.train.init_from_checkpoint(init_checkpoint, assignment_map)
+
+  def get_feed_dict(self, batch):
+    return {
+        placeholder: batch[name]
+        for (name, placeholder) in six.iteritems(self.features)
+    }
+
+
+def get_importance_tensors(task_graph, bert_config):
+  """Returns per-layer lists of head and neuron importance tensors.
+
+  Args:
+    task_graph: `TaskGraph`.
+    bert_config: `BertConfig` of the model in `task_graph`.
+
+  Returns:
+    (head_importance, neuron_importance): lists with a float Tensor of shape
+    [num_attention_heads] and [intermediate_size] for every layer.
+  """
+  (num_attention_heads_per_layer, _) = get_layer_sizes(bert_config)
+  size_per_head = bert_config.hidden_size // bert_config.num_attention_heads
+  variables = {x.op.name: x for x in tf.global_variables()}
+
+  kernels = []
+  for layer_idx in range(bert_config.num_hidden_layers):
+    prefix = "bert/encoder/layer_%d/" % layer_idx
+    kernels.append(variables[prefix + "attention/output/dense/kernel"])
+    kernels.append(variables[prefix + "output/dense/kernel"])
+  grads = tf.gradients(task_graph.loss, kernels)
+
+  head_importance = []
+  neuron_importance = []
+  for layer_idx in range(bert_config.num_hidden_layers):
+    # d(loss)/d(mask of row i) = sum_j kernel[i, j] * d(loss)/d(kernel[i, j])
+    (attention_kernel, output_kernel) = kernels[2 * layer_idx:2 * layer_idx + 2]
+    (attention_grad, output_grad) = grads[2 * layer_idx:2 * layer_idx + 2]
+    row_scores = tf.reduce_sum(attention_kernel * attention_grad, axis=-1)
+    head_importance.append(
+        tf.abs(
+            tf.reduce_sum(
+                tf.reshape(row_scores, [
+                    num_attention_heads_per_layer[layer_idx], size_per_head
+                ]),
+                axis=-1)))
+    neuron_importance.append(
+        tf.abs(tf.reduce_sum(output_kernel * output_grad, axis=-1)))
+  return (head_importance, neuron_importance)
+
+
+def select_units(importance, keep_ratio):
+  """Selects the most important units (heads or neurons) across layers.
+
+  Args:
+    importance: A list with an array of unit scores for every layer.
+    keep_ratio: float. The fraction of all units to keep.
+
+  Returns:
+    A list with the sorted indices of the kept units of every layer. Every
+    layer keeps at least one unit.
+  """
+  normalized = []
+  for scores in importance:
+    scores = np.asarray(scores, dtype=np.float64)
+    normalized.append(scores / max(np.linalg.norm(scores), 1e-12))
+
+  all_scores = np.concatenate(normalized)
+  num_kept = max(int(round(keep_ratio * len(all_scores))), len(importance))
+  threshold = np.sort(all_scores)[::-1][num_kept - 1]
+
+  kept = []
+  for scores in normalized:
+    indices = np.where(scores >= threshold)[0]
+    if not len(indices):
+      indices = np.array([np.argmax(scores)])
+    kept.append(indices)
+  return kept
+
+
+def _take(value, indices, axis, num_parts=1):
+  """Takes `indices` along `axis` of each of `num_parts` equal parts."""
+  shape = list(value.shape)
+  parts_shape = shape[:axis] + [num_parts, shape[axis] // num_parts]
+  parts_shape += shape[axis + 1:]
+  value = np.take(value.reshape(parts_shape), indices, axis=axis + 1)
+  shape[axis] = num_parts * len(indices)
+  return value.reshape(shape)
+
+
+def prune_checkpoint(bert_config, init_checkpoint, output_checkpoint,
+                     kept_heads, kept_neurons):
+  """Writes a checkpoint with only the given heads and neurons.
+
+  Args:
+    bert_config: `BertConfig` of `init_checkpoint`.
+    init_checkpoint: The checkpoint to prune.
+    output_checkpoint: Where to write the pruned checkpoint.
+    kept_heads: A list with the indices of the heads to keep in every layer.
+    kept_neurons: A list with the indices of the intermediate neurons to keep
+      in every layer.
+
+  Returns:
+    The `BertConfig` of the pruned checkpoint.
+  """
+  size_per_head = bert_config.hidden_size // bert_config.num_attention_heads
+
+  # (name under "bert/encoder/layer_%d/", unit, axis, num_parts)
+  pruned_variables = [
+      ("attention/self/query/kernel", "head", 1, 1),
+      ("attention/self/query/bias", "head", 0, 1),
+      ("attention/self/key/kernel", "head", 1, 1),
+      ("attention/self/key/bias", "head", 0, 1),
+      ("attention/self/value/kernel", "head", 1, 1),
+      ("attention/self/value/bias", "head", 0, 1),
+      ("attention/self/query_key_value/kernel", "head", 1, 3),
+      ("attention/self/query_key_value/bias", "head", 0, 3),
+      ("attention/output/dense/kernel", "head", 0, 1),
+      ("intermediate/dense/kernel", "neuron", 1, 1),
+      ("intermediate/dense/bias", "neuron", 0, 1),
+      ("output/dense/kernel", "neuron", 0, 1),
+  ]
+  pruning = {}
+  for layer_idx in range(bert_config.num_hidden_layers):
+    head_columns = np.concatenate([
+        np.arange(size_per_head) + head * size_per_head
+        for head in sorted(kept_heads[layer_idx])
+    ])
+    indices = {
+        "head": head_columns,
+        "neuron": np.sort(kept_neurons[layer_idx]),
+    }
+    for (name, unit, axis, num_parts) in pruned_variables:
+      pruning["bert/encoder/layer_%d/%s" % (layer_idx, name)] = (
+          indices[unit], axis, num_parts)
+
+  reader = tf.train.load_checkpoint(init_checkpoint)
+  values = {}
+  for name in sorted(reader.get_variable_to_shape_map()):
+    value = reader.get_tensor(name)
+    # Optimizer slots, e.g. ".../kernel/adam_m", are pruned like their
+    # variable.
+    variable_name = name
+    for suffix in ("/adam_m", "/adam_v"):
+      if name.endswith(suffix):
+        variable_name = name[:-len(suffix)]
+    if variable_name in pruning:
+      value = _take(value, *pruning[variable_name])
+    values[name] = value
+  modeling.write_checkpoint(values, output_checkpoint)
+
+  pruned_config = copy.deepcopy(bert_config)
+  pruned_config.num_attention_heads_per_layer = [len(x) for x in kept_heads]
+  pruned_config.intermediate_size_per_layer = [len(x) for x in kept_neurons]
+  return pruned_config
+
+
+def evaluate(task_graph, sess, batches):
+  """Returns the mean loss and the accuracy of `task_graph` on `batches`."""
+  (total_loss, num_examples, num_correct, num_total) = (0.0, 0, 0, 0)
+  for batch in batches:
+    (loss, batch_correct, batch_total) = sess.run(
+        (task_graph.loss, task_graph.num_correct, task_graph.num_total),
+        task_graph.get_feed_dict(batch))
+    batch_size = len(batch["input_ids"])
+    total_loss += loss * batch_size
+    num_examples += batch_size
+    num_correct += batch_correct
+    num_total += batch_total
+  return (total_loss / num_examples, float(num_correct) / max(num_total, 1))
+
+
+def get_num_encoder_parameters(bert_config):
+  """Returns the number of parameters of the heads and FFNs of the encoder."""
+  (num_attention_heads_per_layer,
+   intermediate_size_per_layer) = get_layer_sizes(bert_config)
+  size_per_head = bert_config.hidden_size // bert_config.num_attention_heads
+  total = 0
+  for (num_heads, intermediate_size) in zip(num_attention_heads_per_layer,
+                                            intermediate_size_per_layer):
+    # The query, key, value and attention output kernels and biases.
+    total += num_heads * size_per_head * (4 * bert_config.hidden_size + 3)
+    # The intermediate and output kernels and the intermediate bias.
+    total += intermediate_size * (2 * bert_config.hidden_size + 1)
+  return total
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+  if bert_config.ffn_ranks_per_layer:
+    raise ValueError("Cannot prune factorized feed-forward kernels; prune "
+                     "before running factorize_checkpoint.py.")
+  if (bert_config.share_attention_across_layers or
+      bert_config.share_ffn_across_layers):
+    raise ValueError("Cannot prune layers that share their variables.")
+  batches = list(
+      feature_reader.read_feature_batches(
+          FLAGS.eval_file,
+          FLAGS.batch_size,
+          max_examples=FLAGS.num_eval_examples))
+
+  with tf.Graph().as_default():
+    task_graph = TaskGraph(bert_config, FLAGS.init_checkpoint,
+                           FLAGS.max_seq_length)
+    (head_importance_tensors,
+     neuron_importance_tensors) = get_importance_tensors(
+         task_graph, bert_config)
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      (loss, accuracy) = evaluate(task_graph, sess, batches)
+      head_importance = [np.zeros(x.shape) for x in head_importance_tensors]
+      neuron_importance = [
+          np.zeros(x.shape) for x in neuron_importance_tensors
+      ]
+      for batch in batches:
+        (batch_heads, batch_neurons) = sess.run(
+            (head_importance_tensors, neuron_importance_tensors),
+            task_graph.get_feed_dict(batch))
+        for (total, x) in zip(head_importance + neuron_importance,
+                              batch_heads + batch_neurons):
+          total += x / len(batches)
+
+  kept_heads = select_units(head_importance, FLAGS.head_keep_ratio)
+  kept_neurons = select_units(neuron_importance, FLAGS.ffn_keep_ratio)
+
+  tf.gfile.MakeDirs(FLAGS.output_dir)
+  output_checkpoint = os.path.join(FLAGS.output_dir, "model.ckpt")
+  pruned_config = prune_checkpoint(bert_config, FLAGS.init_checkpoint,
+                                   output_checkpoint, kept_heads, kept_neurons)
+  output_config_file = os.path.join(FLAGS.output_dir, "bert_config.json")
+  with tf.gfile.GFile(output_config_file, "w") as writer:
+    writer.write(pruned_config.to_json_string())
+
+  with tf.Graph().as_default():
+    task_graph = TaskGraph(pruned_config, output_checkpoint,
+                           FLAGS.max_seq_length)
+    with tf.Session() as sess:
+      sess.run(tf.global_variables_initializer())
+      (pruned_loss, pruned_accuracy) = evaluate(task_graph, sess, batches)
+
+  tf.logging.info("***** Pruning results *****")
+  tf.logging.info("  Wrote %s and %s", output_checkpoint, output_config_file)
+  tf.logging.info("  heads per layer = %s",
+                  pruned_config.num_attention_heads_per_layer)
+  tf.logging.info("  intermediate size per layer = %s",
+                  pruned_config.intermediate_size_per_layer)
+  tf.logging.info("  encoder head and FFN parameters: %d -> %d",
+                  get_num_encoder_parameters(bert_config),
+                  get_num_encoder_parameters(pruned_config))
+  tf.logging.info("  dev loss: %.4f -> %.4f", loss, pruned_loss)
+  tf.logging.info("  dev accuracy: %.4f -> %.4f", accuracy, pruned_accuracy)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("bert_config_file")
+  flags.mark_flag_as_required("init_checkpoint")
+  flags.mark_flag_as_required("eval_file")
+  flags.mark_flag_as_required("output_dir")
+  tf.app.run()
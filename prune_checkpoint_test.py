@@ -0,0 +1,146 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import modeling
+import numpy as np
+import prune_checkpoint
+import tensorflow as tf
+
+
+class PruneCheckpointTest(tf.test.TestCase):
+
+  def get_config(self, **kwargs):
+    return modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        intermediate_size=37,
+        **kwargs)
+
+  def create_checkpoint(self, bert_config, name):
+    """Writes a randomly initialized classifier checkpoint."""
+    checkpoint = os.path.join(self.get_temp_dir(), name)
+    with tf.Graph().as_default():
+      modeling.BertModel(
+          config=bert_config,
+          is_training=False,
+          input_ids=tf.zeros([1, 4], dtype=tf.int32))
+      tf.get_variable("output_weights", [3, bert_config.hidden_size])
+      tf.get_variable("output_bias", [3])
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, checkpoint)
+    return checkpoint
+
+  def run_model(self, bert_config, init_checkpoint, input_ids):
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=bert_config,
+          is_training=False,
+          input_ids=tf.constant(input_ids))
+      with tf.Session() as sess:
+        tf.train.Saver().restore(sess, init_checkpoint)
+        return sess.run(model.get_sequence_output())
+
+  def test_select_units(self):
+    importance = [np.array([3.0, 4.0, 0.0]), np.array([0.0, 0.0, 1e-3])]
+    kept = prune_checkpoint.select_units(importance, keep_ratio=0.5)
+    # The scores are normalized per layer, so the second layer keeps its
+    # only useful unit despite the small score.
+    self.assertAllEqual(kept[0], [0, 1])
+    self.assertAllEqual(kept[1], [2])
+
+  def test_prune_checkpoint_matches_masked_model(self):
+    input_ids = [[31, 51, 98, 3, 7], [15, 5, 9, 0, 1]]
+    kept_heads = [[0, 2], [3]]
+    kept_neurons = [[1, 5, 20, 36], [0, 2]]
+
+    for fuse_qkv in (False, True):
+      bert_config = self.get_config(fuse_qkv=fuse_qkv)
+      init_checkpoint = self.create_checkpoint(bert_config,
+                                               "full_%s.ckpt" % fuse_qkv)
+
+      # Zeroing the rows of the dense kernels that follow the removed heads
+      # and neurons removes their contribution.
+      reader = tf.train.load_checkpoint(init_checkpoint)
+      values = {}
+      for name in reader.get_variable_to_shape_map():
+        values[name] = reader.get_tensor(name)
+      for layer_idx in range(bert_config.num_hidden_layers):
+        prefix = "bert/encoder/layer_%d/" % layer_idx
+        kernel = values[prefix + "attention/output/dense/kernel"]
+        for head in range(bert_config.num_attention_heads):
+          if head not in kept_heads[layer_idx]:
+            kernel[head * 8:(head + 1) * 8] = 0.0
+        kernel = values[prefix + "output/dense/kernel"]
+        for neuron in range(bert_config.intermediate_size):
+          if neuron not in kept_neurons[layer_idx]:
+            kernel[neuron] = 0.0
+      masked_checkpoint = os.path.join(self.get_temp_dir(),
+                                       "masked_%s.ckpt" % fuse_qkv)
+      modeling.write_checkpoint(values, masked_checkpoint)
+
+      pruned_checkpoint = os.path.join(self.get_temp_dir(),
+                                       "pruned_%s.ckpt" % fuse_qkv)
+      pruned_config = prune_checkpoint.prune_checkpoint(
+          bert_config, init_checkpoint, pruned_checkpoint, kept_heads,
+          kept_neurons)
+      self.assertEqual(pruned_config.num_attention_heads_per_layer, [2, 1])
+      self.assertEqual(pruned_config.intermediate_size_per_layer, [4, 2])
+
+      expected = self.run_model(bert_config, masked_checkpoint, input_ids)
+      actual = self.run_model(pruned_config, pruned_checkpoint, input_ids)
+      self.assertAllClose(actual, expected, atol=1e-5)
+
+  def test_importance_of_masked_head_is_zero(self):
+    bert_config = self.get_config()
+    init_checkpoint = self.create_checkpoint(bert_config, "importance.ckpt")
+    reader = tf.train.load_checkpoint(init_checkpoint)
+    values = {}
+    for name in reader.get_variable_to_shape_map():
+      values[name] = reader.get_tensor(name)
+    values["bert/encoder/layer_0/attention/output/dense/kernel"][8:16] = 0.0
+    modeling.write_checkpoint(values, init_checkpoint)
+
+    batch = {
+        "input_ids": np.array([[31, 51, 98, 3], [15, 5, 9, 0]]),
+        "input_mask": np.array([[1, 1, 1, 1], [1, 1, 1, 0]]),
+        "segment_ids": np.zeros([2, 4], dtype=np.int32),
+        "label_ids": np.array([0, 2]),
+    }
+    with tf.Graph().as_default():
+      task_graph = prune_checkpoint.TaskGraph(bert_config, init_checkpoint, 4)
+      (head_importance, neuron_importance) = (
+          prune_checkpoint.get_importance_tensors(task_graph, bert_config))
+      with self.test_session() as sess:
+        sess.run(tf.global_variables_initializer())
+        (head_importance, neuron_importance) = sess.run(
+            (head_importance, neuron_importance),
+            task_graph.get_feed_dict(batch))
+
+    self.assertAllEqual([x.shape for x in head_importance], [[4], [4]])
+    self.assertAllEqual([x.shape for x in neuron_importance], [[37], [37]])
+    self.assertEqual(head_importance[0][1], 0.0)
+    self.assertGreater(head_importance[0][0], 0.0)
+
+
+if __name__ == "__main__":
+  tf.test.main()
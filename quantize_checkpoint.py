@@ -0,0 +1,232 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Post-training int8 quantization of a BERT checkpoint for CPU inference.
+
+Writes an .npz file that `numpy_modeling.NumpyBertModel.from_npz` runs with
+int8 dense layers. Given the eval TFRecord file written by `run_classifier.py`
+or `run_pos_tagging.py`, also reports the accuracy and latency of the
+quantized model against the float32 one.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import feature_reader
+import modeling
+import numpy as np
+import numpy_modeling
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    "bert_config_file", None,
+    "The config json file corresponding to the pre-trained BERT model.")
+
+flags.DEFINE_string("init_checkpoint", None,
+                    "The (usually fine-tuned) checkpoint to quantize.")
+
+flags.DEFINE_string("output_file", None,
+                    "Where to write the quantized model (.npz).")
+
+flags.DEFINE_string(
+    "calibration_file", None,
+    "Optional TFRecord file of converted features, e.g. the train.tf_record "
+    "written by run_classifier.py. If set, the activations of every dense "
+    "layer get a fixed int8 scale from a sample of it. Otherwise they are "
+    "quantized per row at run time.")
+
+flags.DEFINE_integer("num_calibration_examples", 256,
+                     "Number of calibration examples to read.")
+
+flags.DEFINE_string(
+    "eval_file", None,
+    "Optional TFRecord file of converted features with labels, i.e. the "
+    "eval.tf_record written by run_classifier.py (`label_ids`) or "
+    "run_pos_tagging.py (`tag_ids`). If set, the float32 and int8 models are "
+    "compared on it.")
+
+flags.DEFINE_integer("max_seq_length", 128,
+                     "The sequence length the features were written with.")
+
+flags.DEFINE_integer("batch_size", 8, "Batch size for calibration and eval.")
+
+
+def get_model_inputs(features):
+  return {
+      "input_ids": features["input_ids"],
+      "input_mask": features["input_mask"],
+      "token_type_ids": features["segment_ids"],
+  }
+
+
+def viterbi_decode(score, transition_params):
+  """Decodes the best tag sequence like `tf.contrib.crf.crf_decode`.
+
+  Args:
+    score: A [seq_len, num_tags] array of unary potentials.
+    transition_params: A [num_tags, num_tags] array of binary potentials.
+
+  Returns:
+    A list of `seq_len` tag indices.
+  """
+  trellis = np.zeros_like(score)
+  backpointers = np.zeros_like(score, dtype=np.int32)
+  trellis[0] = score[0]
+  for t in range(1, score.shape[0]):
+    v = np.expand_dims(trellis[t - 1], 1) + transition_params
+    trellis[t] = score[t] + np.max(v, 0)
+    backpointers[t] = np.argmax(v, 0)
+
+  viterbi = [np.argmax(trellis[-1])]
+  for bp in reversed(backpointers[1:]):
+    viterbi.append(bp[viterbi[-1]])
+  viterbi.reverse()
+  return viterbi
+
+
+class Evaluator(object):
+  """Scores a model on the labels of a classifier or POS eval file."""
+
+  def __init__(self, reader):
+    self.classifier_head = None
+    self.pos_head = None
+    var_to_shape = reader.get_variable_to_shape_map()
+    if "output_weights" in var_to_shape:
+      self.classifier_head = (reader.get_tensor("output_weights"),
+                              reader.get_tensor("output_bias"))
+    elif "loss/dense/kernel" in var_to_shape:
+      self.pos_head = (reader.get_tensor("loss/dense/kernel"),
+                       reader.get_tensor("loss/dense/bias"),
+                       reader.get_tensor("loss/crf"))
+
+  def evaluate(self, model, batches):
+    """Returns (accuracy or None, seconds spent in `model.run`, outputs)."""
+    num_correct = 0
+    num_total = 0
+    run_time = 0.0
+    all_outputs = []
+    for features in batches:
+      start_time = time.time()
+      outputs = model.run(**get_model_inputs(features))
+      run_time += time.time() - start_time
+      all_outputs.append(outputs)
+
+      if self.classifier_head is not None and "label_ids" in features:
+        (weights, bias) = self.classifier_head
+        logits = np.dot(outputs.pooled_output, weights.T) + bias
+        is_real = features.get("is_real_example",
+                               np.ones_like(features["label_ids"]))
+        num_correct += np.sum(
+            (np.argmax(logits, axis=-1) == features["label_ids"]) * is_real)
+        num_total += np.sum(is_real)
+      elif self.pos_head is not None and "tag_ids" in features:
+        (kernel, bias, transition_params) = self.pos_head
+        # Ignore the [CLS] token, as `run_pos_tagging.create_model` does.
+        logits = np.dot(outputs.sequence_output[:, 1:], kernel) + bias
+        for (score, tag_ids, length) in zip(logits, features["tag_ids"],
+                                            features["sentence_len"]):
+          if length == 0:
+            continue
+          pred_ids = viterbi_decode(score[:length], transition_params)
+          num_correct += np.sum(np.array(pred_ids) == tag_ids[:length])
+          num_total += length
+
+    accuracy = None
+    if num_total:
+      accuracy = float(num_correct) / num_total
+    return (accuracy, run_time, all_outputs)
+
+
+def get_kernel_bytes(model):
+  total = 0
+  for (owner, key) in model.get_kernels():
+    kernel = owner[key]
+    if isinstance(kernel, numpy_modeling.QuantizedKernel):
+      total += kernel.values.nbytes + kernel.scale.nbytes
+    else:
+      total += kernel.nbytes
+  return total
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+  float_model = numpy_modeling.NumpyBertModel.from_checkpoint(
+      bert_config, FLAGS.init_checkpoint)
+  int8_model = numpy_modeling.NumpyBertModel(bert_config,
+                                             float_model.get_variables())
+
+  calibration_batches = None
+  if FLAGS.calibration_file:
+    calibration_batches = [
+        get_model_inputs(x) for x in feature_reader.read_feature_batches(
+            FLAGS.calibration_file, FLAGS.batch_size,
+            max_examples=FLAGS.num_calibration_examples,
+            max_seq_length=FLAGS.max_seq_length)
+    ]
+  numpy_modeling.quantize_model(int8_model, calibration_batches)
+  # The task head stays float32, so the export can classify or tag.
+  int8_model.save_npz(
+      FLAGS.output_file,
+      extra_variables=numpy_modeling.read_task_head(FLAGS.init_checkpoint))
+
+  float_bytes = get_kernel_bytes(float_model)
+  int8_bytes = get_kernel_bytes(int8_model)
+  tf.logging.info("*** Wrote %s ***", FLAGS.output_file)
+  # NumPy runs the int8 kernels as float32, so this is the size of the
+  # kernels in the file, not in memory.
+  tf.logging.info("  dense kernels: %.1f MB float32 -> %.1f MB int8 on disk",
+                  float_bytes / 1e6, int8_bytes / 1e6)
+
+  if not FLAGS.eval_file:
+    return
+
+  evaluator = Evaluator(tf.train.load_checkpoint(FLAGS.init_checkpoint))
+  batches = list(
+      feature_reader.read_feature_batches(
+          FLAGS.eval_file, FLAGS.batch_size,
+          max_seq_length=FLAGS.max_seq_length))
+  (float_accuracy, float_time, float_outputs) = evaluator.evaluate(
+      float_model, batches)
+  (int8_accuracy, int8_time, int8_outputs) = evaluator.evaluate(
+      int8_model, batches)
+
+  max_diff = 0.0
+  for (x, y) in zip(float_outputs, int8_outputs):
+    max_diff = max(max_diff,
+                   float(np.max(np.abs(x.sequence_output - y.sequence_output))))
+
+  tf.logging.info("***** Quantization results *****")
+  if float_accuracy is not None:
+    tf.logging.info("  accuracy: %.4f float32, %.4f int8 (delta %+.4f)",
+                    float_accuracy, int8_accuracy,
+                    int8_accuracy - float_accuracy)
+  tf.logging.info("  max |sequence_output delta| = %.4f", max_diff)
+  tf.logging.info("  run time: %.2fs float32, %.2fs int8", float_time,
+                  int8_time)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("bert_config_file")
+  flags.mark_flag_as_required("init_checkpoint")
+  flags.mark_flag_as_required("output_file")
+  tf.app.run()
@@ -21,6 +21,7 @@ from __future__ import print_function
 import collections
 import csv
 import os
+import bucketing
 import modeling
 import optimization
 import tokenization
@@ -61,12 +62,56 @@ flags.DEFINE_bool(
     "Whether to lower case the input text. Should be True for uncased "
     "models and False for cased models.")
 
+flags.DEFINE_integer(
+    "tokenizer_cache_size", 0,
+    "If > 0, the tokenizer keeps the WordPiece output of up to this many "
+    "distinct words in an LRU cache. Frequent words then skip the WordPiece "
+    "search entirely.")
+
+flags.DEFINE_string(
+    "vocab_snapshot_file", None,
+    "Optional snapshot of `vocab_file` written by compile_vocab_snapshot.py. "
+    "If set, the vocab is loaded from it instead of parsing `vocab_file`; a "
+    "snapshot that does not match `vocab_file` is rejected.")
+
 flags.DEFINE_integer(
     "max_seq_length", 128,
     "The maximum total input sequence length after WordPiece tokenization. "
     "Sequences longer than this will be truncated, and sequences shorter "
     "than this will be padded.")
 
+flags.DEFINE_string(
+    "seq_length_buckets", "",
+    "Optional comma-separated sequence lengths, e.g. \"32,64\". If set, each "
+    "batch runs at the shortest of these lengths (or `max_seq_length`) that "
+    "holds all of its tokens instead of at `max_seq_length`, and training "
+    "batches are grouped by length. Not supported on TPU.")
+
+flags.DEFINE_string(
+    "early_exit_layers", "",
+    "Optional comma-separated layer counts, e.g. \"4,8\". If set, a small "
+    "classifier is trained on the output of each of these encoder layers "
+    "(counting from 1) next to the classifier on the last layer. Prediction "
+    "then stops at the first of these layers whose output distribution has "
+    "an entropy below `early_exit_entropy`.")
+
+flags.DEFINE_float(
+    "early_exit_entropy", 0.0,
+    "Entropy (in nats) below which an example exits at an early exit layer. "
+    "0 never exits early; larger values trade accuracy for speed.")
+
+flags.DEFINE_bool(
+    "train_exit_heads_only", False,
+    "If True, only the early exit classifiers are trained and the rest of "
+    "the model is kept fixed. Use this to add exits to an already "
+    "fine-tuned model. Otherwise all classifiers are trained jointly.")
+
+flags.DEFINE_bool(
+    "pooled_output_only", True,
+    "Whether the last encoder layer only computes the first ([CLS]) token, "
+    "which is all the classifier uses. Set to False if you change "
+    "`create_model` to use `get_sequence_output()`.")
+
 flags.DEFINE_bool("do_train", False, "Whether to run training.")
 
 flags.DEFINE_bool("do_eval", False, "Whether to run eval on the dev set.")
@@ -390,10 +435,13 @@ def convert_single_example(ex_index, example, label_list, max_seq_length,
   for (i, label) in enumerate(label_list):
     label_map[label] = i
 
-  tokens_a = tokenizer.tokenize(example.text_a)
+  # Nothing past `max_seq_length - 2` word pieces of either text can survive
+  # the truncation below, so there is no need to tokenize the rest.
+  tokens_a = tokenizer.tokenize(example.text_a, max_tokens=max_seq_length - 2)
   tokens_b = None
   if example.text_b:
-    tokens_b = tokenizer.tokenize(example.text_b)
+    tokens_b = tokenizer.tokenize(
+        example.text_b, max_tokens=max_seq_length - 2)
 
   if tokens_b:
     # Modifies `tokens_a` and `tokens_b` in place so that the total
@@ -507,8 +555,12 @@ def file_based_convert_examples_to_features(
 
 
 def file_based_input_fn_builder(input_file, seq_length, is_training,
-                                drop_remainder):
-  """Creates an `input_fn` closure to be passed to TPUEstimator."""
+                                drop_remainder, seq_length_buckets=None):
+  """Creates an `input_fn` closure to be passed to TPUEstimator.
+
+  If `seq_length_buckets` is given (see `bucketing.parse_seq_length_buckets`),
+  every batch is trimmed to the shortest bucket that holds it.
+  """
 
   name_to_features = {
       "input_ids": tf.FixedLenFeature([seq_length], tf.int64),
@@ -543,6 +595,16 @@ def file_based_input_fn_builder(input_file, seq_length, is_training,
       d = d.repeat()
       d = d.shuffle(buffer_size=100)
 
+    if seq_length_buckets:
+      d = d.map(lambda record: _decode_record(record, name_to_features))
+      return bucketing.batch_by_sequence_length(
+          d,
+          batch_size=batch_size,
+          seq_length_buckets=seq_length_buckets,
+          sequence_feature_names=["input_ids", "input_mask", "segment_ids"],
+          group_by_length=is_training,
+          drop_remainder=drop_remainder)
+
     d = d.apply(
         tf.contrib.data.map_and_batch(
             lambda record: _decode_record(record, name_to_features),
@@ -572,23 +634,35 @@ def _truncate_seq_pair(tokens_a, tokens_b, max_length):
 
 
 def create_model(bert_config, is_training, input_ids, input_mask, segment_ids,
-                 labels, num_labels, use_one_hot_embeddings):
-  """Creates a classification model."""
+                 labels, num_labels, use_one_hot_embeddings,
+                 pooled_output_only=True):
+  """Creates a classification model.
+
+  With `pooled_output_only` (see `--pooled_output_only`), the last encoder
+  layer only computes the first token, so `get_sequence_output()` of the
+  model built here only holds that token.
+  """
   model = modeling.BertModel(
       config=bert_config,
       is_training=is_training,
       input_ids=input_ids,
       input_mask=input_mask,
       token_type_ids=segment_ids,
-      use_one_hot_embeddings=use_one_hot_embeddings)
+      use_one_hot_embeddings=use_one_hot_embeddings,
+      pooled_output_only=pooled_output_only)
 
   # In the demo, we are doing a simple classification task on the entire
   # segment.
   #
   # If you want to use the token-level output, use model.get_sequence_output()
-  # instead.
+  # instead, and set `pooled_output_only` to False.
   output_layer = model.get_pooled_output()
 
+  return create_classifier(output_layer, labels, num_labels, is_training)
+
+
+def create_classifier(output_layer, labels, num_labels, is_training):
+  """Creates the classification layer on top of a pooled output."""
   hidden_size = output_layer.shape[-1].value
 
   output_weights = tf.get_variable(
@@ -616,9 +690,215 @@ def create_model(bert_config, is_training, input_ids, input_mask, segment_ids,
     return (loss, per_example_loss, logits, probabilities)
 
 
+def parse_early_exit_layers(layers_string, num_hidden_layers):
+  """Parses `--early_exit_layers` into a sorted list of layer counts.
+
+  Args:
+    layers_string: String such as "4,8". May be empty.
+    num_hidden_layers: int. The number of encoder layers. The last layer
+      always has the regular classifier and is not an early exit.
+
+  Returns:
+    A sorted list of distinct ints, empty if `layers_string` is empty.
+
+  Raises:
+    ValueError: A layer is not in [1, num_hidden_layers).
+  """
+  layers = set()
+  for x in layers_string.split(",") if layers_string else []:
+    layer = int(x)
+    if layer < 1 or layer >= num_hidden_layers:
+      raise ValueError(
+          "Early exit layer %d is not in [1, num_hidden_layers=%d)." %
+          (layer, num_hidden_layers))
+    layers.add(layer)
+  return sorted(layers)
+
+
+def create_exit_classifier(sequence_output, labels, num_labels, is_training,
+                           bert_config):
+  """Creates an early exit classifier on the output of an encoder layer.
+
+  Like the regular classifier, it runs on the first token after a "pooler"
+  dense layer of its own. The variables are created in the current variable
+  scope.
+  """
+  first_token_tensor = sequence_output[:, 0, :]
+  pooled_output = tf.layers.dense(
+      first_token_tensor,
+      bert_config.hidden_size,
+      activation=tf.tanh,
+      kernel_initializer=modeling.create_initializer(
+          bert_config.initializer_range),
+      name="pooler")
+  return create_classifier(pooled_output, labels, num_labels, is_training)
+
+
+def get_entropy(probabilities):
+  """Returns the entropy in nats of each row of `probabilities`."""
+  return -tf.reduce_sum(
+      probabilities * tf.log(tf.maximum(probabilities, 1e-12)), axis=-1)
+
+
+def create_early_exit_model(bert_config, is_training, input_ids, input_mask,
+                            segment_ids, labels, num_labels,
+                            use_one_hot_embeddings, early_exit_layers,
+                            train_exit_heads_only, pooled_output_only=True):
+  """Creates a classification model with early exit classifiers.
+
+  The exits use the intermediate layers. With `pooled_output_only`, the last
+  layer only computes the first token, as in `create_model`.
+
+  Returns:
+    (loss, per_example_loss, all_logits), where `per_example_loss` is the loss
+    of the last layer's classifier and `all_logits` holds the logits of every
+    early exit in order, followed by those of the last layer.
+  """
+  model = modeling.BertModel(
+      config=bert_config,
+      is_training=is_training,
+      input_ids=input_ids,
+      input_mask=input_mask,
+      token_type_ids=segment_ids,
+      use_one_hot_embeddings=use_one_hot_embeddings,
+      pooled_output_only=pooled_output_only)
+
+  (final_loss, per_example_loss, final_logits,
+   _) = create_classifier(model.get_pooled_output(), labels, num_labels,
+                          is_training)
+
+  all_encoder_layers = model.get_all_encoder_layers()
+  all_logits = []
+  exit_losses = []
+  for layer in early_exit_layers:
+    sequence_output = all_encoder_layers[layer - 1]
+    if train_exit_heads_only:
+      sequence_output = tf.stop_gradient(sequence_output)
+    with tf.variable_scope("early_exit_%d" % layer):
+      (exit_loss, _, exit_logits, _) = create_exit_classifier(
+          sequence_output, labels, num_labels, is_training, bert_config)
+    all_logits.append(exit_logits)
+    exit_losses.append(exit_loss)
+  all_logits.append(final_logits)
+
+  loss = tf.add_n(exit_losses)
+  if not train_exit_heads_only:
+    loss += final_loss
+  return (loss, per_example_loss, all_logits)
+
+
+def select_early_exit(all_probabilities, early_exit_layers, num_hidden_layers,
+                      entropy_threshold):
+  """Picks the prediction of the first confident exit of each example.
+
+  Args:
+    all_probabilities: List of [batch_size, num_labels] Tensors, as
+      `all_logits` of `create_early_exit_model` after a softmax.
+    early_exit_layers: Non-empty list of layer counts of the early exits.
+    num_hidden_layers: int. Number of encoder layers.
+    entropy_threshold: float. See `--early_exit_entropy`.
+
+  Returns:
+    (probabilities, exit_layer), where `exit_layer` is the int32 layer count
+    of the exit that each example used.
+  """
+  # `confident` = [num_exits, batch_size]
+  confident = [
+      get_entropy(probabilities) < entropy_threshold
+      for probabilities in all_probabilities[:-1]
+  ]
+  confident.append(tf.ones_like(confident[0]))
+  confident = tf.stack(confident)
+
+  # The first confident exit; the last layer is always confident.
+  exit_index = tf.argmax(tf.to_int32(confident), axis=0, output_type=tf.int32)
+  batch_size = tf.shape(exit_index)[0]
+  probabilities = tf.gather_nd(
+      tf.stack(all_probabilities),
+      tf.stack([exit_index, tf.range(batch_size)], axis=1))
+  exit_layer = tf.gather(early_exit_layers + [num_hidden_layers], exit_index)
+  return (probabilities, exit_layer)
+
+
+def create_early_exit_predictions(bert_config, input_ids, input_mask,
+                                  segment_ids, num_labels,
+                                  use_one_hot_embeddings, early_exit_layers,
+                                  entropy_threshold):
+  """Runs the encoder only as deep as each example needs.
+
+  After each early exit layer, the examples whose exit classifier is confident
+  are removed from the batch, so the remaining layers run on fewer examples.
+  The results match `select_early_exit` on the full model. This needs dynamic
+  shapes, so it does not run on TPU.
+
+  Returns:
+    (probabilities, exit_layer) as returned by `select_early_exit`.
+  """
+  model = modeling.BertModel(
+      config=bert_config,
+      is_training=False,
+      input_ids=input_ids,
+      input_mask=input_mask,
+      token_type_ids=segment_ids,
+      use_one_hot_embeddings=use_one_hot_embeddings,
+      num_layers_to_run=early_exit_layers[0])
+  batch_size = modeling.get_shape_list(input_ids, expected_rank=2)[0]
+
+  # `example_index` holds the batch positions of the remaining examples.
+  example_index = tf.range(batch_size)
+  sequence_output = model.get_sequence_output()
+  attention_mask = model.get_attention_mask()
+  global_attention_mask = model.get_global_attention_mask()
+  probabilities = tf.zeros([batch_size, num_labels])
+  exit_layer = tf.zeros([batch_size], dtype=tf.int32)
+  num_layers_run = early_exit_layers[0]
+  for layer in early_exit_layers + [bert_config.num_hidden_layers]:
+    if layer > num_layers_run:
+      sequence_output = model.run_encoder_layers(
+          sequence_output, num_layers_run, layer, attention_mask,
+          global_attention_mask)[-1]
+      num_layers_run = layer
+
+    if layer == bert_config.num_hidden_layers:
+      with tf.variable_scope("bert/pooler", reuse=True):
+        pooled_output = tf.layers.dense(
+            sequence_output[:, 0, :],
+            bert_config.hidden_size,
+            activation=tf.tanh,
+            name="dense")
+      (_, _, _, layer_probabilities) = create_classifier(
+          pooled_output, tf.zeros_like(example_index), num_labels, False)
+      is_exit = tf.ones_like(example_index, dtype=tf.bool)
+    else:
+      with tf.variable_scope("early_exit_%d" % layer):
+        (_, _, _, layer_probabilities) = create_exit_classifier(
+            sequence_output, tf.zeros_like(example_index), num_labels, False,
+            bert_config)
+      is_exit = get_entropy(layer_probabilities) < entropy_threshold
+
+    exit_index = tf.expand_dims(tf.boolean_mask(example_index, is_exit), 1)
+    probabilities += tf.scatter_nd(
+        exit_index, tf.boolean_mask(layer_probabilities, is_exit),
+        [batch_size, num_labels])
+    exit_layer += tf.scatter_nd(
+        exit_index, tf.fill(tf.shape(exit_index)[:1], layer), [batch_size])
+
+    is_remaining = tf.logical_not(is_exit)
+    example_index = tf.boolean_mask(example_index, is_remaining)
+    sequence_output = tf.boolean_mask(sequence_output, is_remaining)
+    attention_mask = tf.boolean_mask(attention_mask, is_remaining)
+    if global_attention_mask is not None:
+      global_attention_mask = tf.boolean_mask(global_attention_mask,
+                                              is_remaining)
+
+  return (probabilities, exit_layer)
+
+
 def model_fn_builder(bert_config, num_labels, init_checkpoint, learning_rate,
                      num_train_steps, num_warmup_steps, use_tpu,
-                     use_one_hot_embeddings):
+                     use_one_hot_embeddings, early_exit_layers=None,
+                     early_exit_entropy=0.0, train_exit_heads_only=False,
+                     pooled_output_only=True):
   """Returns `model_fn` closure for TPUEstimator."""
 
   def model_fn(features, labels, mode, params):  # pylint: disable=unused-argument
@@ -640,9 +920,24 @@ def model_fn_builder(bert_config, num_labels, init_checkpoint, learning_rate,
 
     is_training = (mode == tf.estimator.ModeKeys.TRAIN)
 
-    (total_loss, per_example_loss, logits, probabilities) = create_model(
-        bert_config, is_training, input_ids, input_mask, segment_ids, label_ids,
-        num_labels, use_one_hot_embeddings)
+    exit_layer = None
+    if not early_exit_layers:
+      (total_loss, per_example_loss, logits, probabilities) = create_model(
+          bert_config, is_training, input_ids, input_mask, segment_ids,
+          label_ids, num_labels, use_one_hot_embeddings, pooled_output_only)
+    elif mode == tf.estimator.ModeKeys.PREDICT:
+      (probabilities, exit_layer) = create_early_exit_predictions(
+          bert_config, input_ids, input_mask, segment_ids, num_labels,
+          use_one_hot_embeddings, early_exit_layers, early_exit_entropy)
+    else:
+      (total_loss, per_example_loss, all_logits) = create_early_exit_model(
+          bert_config, is_training, input_ids, input_mask, segment_ids,
+          label_ids, num_labels, use_one_hot_embeddings, early_exit_layers,
+          train_exit_heads_only, pooled_output_only)
+      logits = all_logits[-1]
+      (exit_probabilities, exit_layer) = select_early_exit(
+          [tf.nn.softmax(x, axis=-1) for x in all_logits], early_exit_layers,
+          bert_config.num_hidden_layers, early_exit_entropy)
 
     tvars = tf.trainable_variables()
     initialized_variable_names = {}
@@ -672,7 +967,8 @@ def model_fn_builder(bert_config, num_labels, init_checkpoint, learning_rate,
     if mode == tf.estimator.ModeKeys.TRAIN:
 
       train_op = optimization.create_optimizer(
-          total_loss, learning_rate, num_train_steps, num_warmup_steps, use_tpu)
+          total_loss, learning_rate, num_train_steps, num_warmup_steps, use_tpu,
+          use_loss_scaling=(bert_config.compute_dtype == "float16"))
 
       output_spec = tf.contrib.tpu.TPUEstimatorSpec(
           mode=mode,
@@ -693,15 +989,46 @@ def model_fn_builder(bert_config, num_labels, init_checkpoint, learning_rate,
 
       eval_metrics = (metric_fn,
                       [per_example_loss, label_ids, logits, is_real_example])
+
+      if early_exit_layers:
+
+        def early_exit_metric_fn(per_example_loss, label_ids, logits,
+                                 is_real_example, exit_probabilities,
+                                 exit_layer, *exit_logits):
+          """Adds the accuracy of each exit and of early exit inference."""
+          metrics = metric_fn(per_example_loss, label_ids, logits,
+                              is_real_example)
+          for (layer, layer_logits) in zip(early_exit_layers, exit_logits):
+            metrics["eval_accuracy_layer_%d" % layer] = tf.metrics.accuracy(
+                labels=label_ids,
+                predictions=tf.argmax(
+                    layer_logits, axis=-1, output_type=tf.int32),
+                weights=is_real_example)
+          metrics["eval_early_exit_accuracy"] = tf.metrics.accuracy(
+              labels=label_ids,
+              predictions=tf.argmax(
+                  exit_probabilities, axis=-1, output_type=tf.int32),
+              weights=is_real_example)
+          metrics["eval_mean_exit_layer"] = tf.metrics.mean(
+              values=tf.to_float(exit_layer), weights=is_real_example)
+          return metrics
+
+        eval_metrics = (early_exit_metric_fn, [
+            per_example_loss, label_ids, logits, is_real_example,
+            exit_probabilities, exit_layer
+        ] + all_logits[:-1])
       output_spec = tf.contrib.tpu.TPUEstimatorSpec(
           mode=mode,
           loss=total_loss,
           eval_metrics=eval_metrics,
           scaffold_fn=scaffold_fn)
     else:
+      predictions = {"probabilities": probabilities}
+      if exit_layer is not None:
+        predictions["exit_layer"] = exit_layer
       output_spec = tf.contrib.tpu.TPUEstimatorSpec(
           mode=mode,
-          predictions={"probabilities": probabilities},
+          predictions=predictions,
           scaffold_fn=scaffold_fn)
     return output_spec
 
@@ -805,6 +1132,25 @@ def main(_):
         "was only trained up to sequence length %d" %
         (FLAGS.max_seq_length, bert_config.max_position_embeddings))
 
+  seq_length_buckets = bucketing.parse_seq_length_buckets(
+      FLAGS.seq_length_buckets, FLAGS.max_seq_length)
+  if seq_length_buckets and FLAGS.use_tpu:
+    raise ValueError("`seq_length_buckets` is not supported on TPU, which "
+                     "requires a fixed sequence length.")
+
+  early_exit_layers = parse_early_exit_layers(FLAGS.early_exit_layers,
+                                              bert_config.num_hidden_layers)
+  if early_exit_layers and FLAGS.use_tpu and FLAGS.do_predict:
+    raise ValueError("Early exit prediction is not supported on TPU, which "
+                     "requires a fixed batch size in every layer.")
+  if FLAGS.train_exit_heads_only and not early_exit_layers:
+    raise ValueError(
+        "`train_exit_heads_only` requires `early_exit_layers` to be set.")
+  if (early_exit_layers and FLAGS.do_predict and
+      bert_config.token_pruning_schedule):
+    raise ValueError(
+        "Early exit prediction is not supported with `token_pruning_schedule`.")
+
   tf.gfile.MakeDirs(FLAGS.output_dir)
 
   task_name = FLAGS.task_name.lower()
@@ -817,7 +1163,9 @@ def main(_):
   label_list = processor.get_labels()
 
   tokenizer = tokenization.FullTokenizer(
-      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case)
+      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case,
+      cache_size=FLAGS.tokenizer_cache_size,
+      snapshot_file=FLAGS.vocab_snapshot_file)
 
   tpu_cluster_resolver = None
   if FLAGS.use_tpu and FLAGS.tpu_name:
@@ -844,15 +1192,22 @@ def main(_):
         len(train_examples) / FLAGS.train_batch_size * FLAGS.num_train_epochs)
     num_warmup_steps = int(num_train_steps * FLAGS.warmup_proportion)
 
+  init_checkpoint = modeling.maybe_fuse_qkv_checkpoint(
+      bert_config, FLAGS.init_checkpoint, FLAGS.output_dir)
+
   model_fn = model_fn_builder(
       bert_config=bert_config,
       num_labels=len(label_list),
-      init_checkpoint=FLAGS.init_checkpoint,
+      init_checkpoint=init_checkpoint,
       learning_rate=FLAGS.learning_rate,
       num_train_steps=num_train_steps,
       num_warmup_steps=num_warmup_steps,
       use_tpu=FLAGS.use_tpu,
-      use_one_hot_embeddings=FLAGS.use_tpu)
+      use_one_hot_embeddings=FLAGS.use_tpu,
+      early_exit_layers=early_exit_layers,
+      early_exit_entropy=FLAGS.early_exit_entropy,
+      train_exit_heads_only=FLAGS.train_exit_heads_only,
+      pooled_output_only=FLAGS.pooled_output_only)
 
   # If TPU is not available, this will fall back to normal Estimator on CPU
   # or GPU.
@@ -876,7 +1231,8 @@ def main(_):
         input_file=train_file,
         seq_length=FLAGS.max_seq_length,
         is_training=True,
-        drop_remainder=True)
+        drop_remainder=True,
+        seq_length_buckets=seq_length_buckets)
     estimator.train(input_fn=train_input_fn, max_steps=num_train_steps)
 
   if FLAGS.do_eval:
@@ -914,7 +1270,8 @@ def main(_):
         input_file=eval_file,
         seq_length=FLAGS.max_seq_length,
         is_training=False,
-        drop_remainder=eval_drop_remainder)
+        drop_remainder=eval_drop_remainder,
+        seq_length_buckets=seq_length_buckets)
 
     result = estimator.evaluate(input_fn=eval_input_fn, steps=eval_steps)
 
@@ -952,11 +1309,13 @@ def main(_):
         input_file=predict_file,
         seq_length=FLAGS.max_seq_length,
         is_training=False,
-        drop_remainder=predict_drop_remainder)
+        drop_remainder=predict_drop_remainder,
+        seq_length_buckets=seq_length_buckets)
 
     result = estimator.predict(input_fn=predict_input_fn)
 
     output_predict_file = os.path.join(FLAGS.output_dir, "test_results.tsv")
+    exit_layers = []
     with tf.gfile.GFile(output_predict_file, "w") as writer:
       num_written_lines = 0
       tf.logging.info("***** Predict results *****")
@@ -969,8 +1328,20 @@ def main(_):
             for class_probability in probabilities) + "\n"
         writer.write(output_line)
         num_written_lines += 1
+        if "exit_layer" in prediction:
+          exit_layers.append(prediction["exit_layer"])
     assert num_written_lines == num_actual_predict_examples
 
+    if exit_layers:
+      # One line per example with the number of layers it ran through.
+      output_exit_file = os.path.join(FLAGS.output_dir, "test_exit_layers.txt")
+      with tf.gfile.GFile(output_exit_file, "w") as writer:
+        for exit_layer in exit_layers:
+          writer.write("%d\n" % exit_layer)
+      tf.logging.info("  Mean exit layer = %.2f of %d",
+                      float(sum(exit_layers)) / len(exit_layers),
+                      bert_config.num_hidden_layers)
+
 
 if __name__ == "__main__":
   flags.mark_flag_as_required("data_dir")
@@ -0,0 +1,86 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import modeling
+import run_classifier
+import tensorflow as tf
+
+
+class RunClassifierTest(tf.test.TestCase):
+
+  def test_early_exit_predictions_with_pruned_and_factorized_layers(self):
+    bert_config = modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        intermediate_size=37,
+        num_attention_heads_per_layer=[4, 2, 2, 1],
+        intermediate_size_per_layer=[37, 30, 20, 10],
+        ffn_ranks_per_layer=[[4, 4], [4, 0], [0, 4], [4, 4]])
+    input_ids = [[31, 51, 98, 3], [15, 5, 9, 0], [7, 8, 2, 1]]
+    input_mask = [[1, 1, 1, 1], [1, 1, 1, 0], [1, 1, 1, 1]]
+    segment_ids = [[0, 0, 1, 1], [0, 0, 0, 0], [0, 1, 1, 1]]
+    num_labels = 3
+    early_exit_layers = [2]
+    checkpoint = os.path.join(self.get_temp_dir(), "model.ckpt")
+
+    def run_model(entropy_threshold, init_checkpoint=None):
+      """Runs the full model, or the predict path from `init_checkpoint`."""
+      with tf.Graph().as_default():
+        inputs = (tf.constant(input_ids), tf.constant(input_mask),
+                  tf.constant(segment_ids))
+        if init_checkpoint is None:
+          (_, _, all_logits) = run_classifier.create_early_exit_model(
+              bert_config, False, *inputs, labels=tf.zeros([3], tf.int32),
+              num_labels=num_labels, use_one_hot_embeddings=False,
+              early_exit_layers=early_exit_layers,
+              train_exit_heads_only=False)
+          outputs = run_classifier.select_early_exit(
+              [tf.nn.softmax(x, axis=-1) for x in all_logits],
+              early_exit_layers, bert_config.num_hidden_layers,
+              entropy_threshold)
+        else:
+          outputs = run_classifier.create_early_exit_predictions(
+              bert_config, *inputs, num_labels=num_labels,
+              use_one_hot_embeddings=False,
+              early_exit_layers=early_exit_layers,
+              entropy_threshold=entropy_threshold)
+        with tf.Session() as sess:
+          if init_checkpoint is None:
+            sess.run(tf.global_variables_initializer())
+            tf.train.Saver().save(sess, checkpoint)
+          else:
+            tf.train.Saver().restore(sess, init_checkpoint)
+          return sess.run(outputs)
+
+    # No example exits early with a threshold of 0, all of them with a large
+    # one.
+    for entropy_threshold in (0.0, 10.0):
+      (expected_probabilities, expected_exit_layer) = run_model(
+          entropy_threshold)
+      (probabilities, exit_layer) = run_model(entropy_threshold, checkpoint)
+      self.assertAllEqual(exit_layer, expected_exit_layer)
+      self.assertAllClose(probabilities, expected_probabilities, atol=1e-5)
+    self.assertAllEqual(exit_layer, [2, 2, 2])
+
+
+if __name__ == "__main__":
+  tf.test.main()
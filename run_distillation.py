@@ -0,0 +1,708 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Distills a fine-tuned classifier or POS tagger into a smaller BERT.
+
+The teacher is a checkpoint fine-tuned by `run_classifier.py` or
+`run_pos_tagging.py`; the student is built from a smaller `BertConfig`,
+typically with 4 or 6 layers. The student's encoder layers are initialized
+from selected teacher layers and it is trained on
+
+  * the teacher's soft targets: its temperature-softened class distribution,
+    or its per-token tag distribution from the CRF emissions for POS tagging,
+  * the hidden states of the mapped teacher layers (and the embeddings),
+  * optionally the gold labels.
+
+The teacher runs frozen alongside the student, or its logits are computed once
+with `--do_cache_teacher_logits` and read back from the training file, which
+saves running it at every step but leaves out the hidden-state losses.
+
+The student checkpoints in `output_dir` can be used as `init_checkpoint` of
+`run_classifier.py` or `run_pos_tagging.py` with the student's config, which is
+copied to `output_dir/bert_config.json`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import modeling
+import optimization
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+## Required parameters
+flags.DEFINE_string(
+    "teacher_config_file", None,
+    "The config json file corresponding to the fine-tuned teacher model.")
+
+flags.DEFINE_string(
+    "teacher_checkpoint", None,
+    "The teacher checkpoint, fine-tuned by run_classifier.py or "
+    "run_pos_tagging.py.")
+
+flags.DEFINE_string(
+    "student_config_file", None,
+    "The config json file of the smaller student model.")
+
+flags.DEFINE_string(
+    "train_file", None,
+    "TFRecord file of converted training features with labels, i.e. the "
+    "train.tf_record written by run_classifier.py or run_pos_tagging.py, or "
+    "a file written by --do_cache_teacher_logits.")
+
+flags.DEFINE_string(
+    "output_dir", None,
+    "The output directory where the student checkpoints will be written.")
+
+## Other parameters
+flags.DEFINE_string(
+    "eval_file", None,
+    "TFRecord file of converted dev set features, for --do_eval.")
+
+flags.DEFINE_string(
+    "student_layer_map", None,
+    "Comma-separated teacher layer indices, one for every student layer, "
+    "e.g. \"2,5,8,11\". Student layer i is initialized from and its output is "
+    "matched to the output of the i-th teacher layer. Defaults to evenly "
+    "spaced layers ending with the last one.")
+
+flags.DEFINE_bool(
+    "init_student_from_teacher", True,
+    "Whether to initialize the student from the teacher checkpoint, with "
+    "the encoder layers of --student_layer_map. Needs the student to have "
+    "the teacher's hidden, intermediate and vocabulary sizes.")
+
+flags.DEFINE_bool(
+    "do_cache_teacher_logits", False,
+    "Whether to run the teacher over --train_file once, write its examples "
+    "with the teacher's logits to output_dir/teacher_logits.tf_record and "
+    "train from that file.")
+
+flags.DEFINE_float("temperature", 2.0,
+                   "Temperature of the teacher and student soft targets.")
+
+flags.DEFINE_float("soft_loss_weight", 1.0,
+                   "Weight of the loss on the teacher's soft targets.")
+
+flags.DEFINE_float(
+    "hidden_loss_weight", 1.0,
+    "Weight of the mean squared error between the student's and the mapped "
+    "teacher layers' hidden states. Must be 0 with cached teacher logits.")
+
+flags.DEFINE_float("hard_loss_weight", 0.0,
+                   "Weight of the task loss on the gold labels.")
+
+flags.DEFINE_integer(
+    "max_seq_length", 128,
+    "The sequence length the features were written with.")
+
+flags.DEFINE_bool("do_train", False, "Whether to run training.")
+
+flags.DEFINE_bool("do_eval", False,
+                  "Whether to evaluate the student on --eval_file.")
+
+flags.DEFINE_integer("train_batch_size", 32, "Total batch size for training.")
+
+flags.DEFINE_integer("eval_batch_size", 8, "Total batch size for eval.")
+
+flags.DEFINE_float("learning_rate", 1e-4, "The initial learning rate for Adam.")
+
+flags.DEFINE_float("num_train_epochs", 3.0,
+                   "Total number of training epochs to perform.")
+
+flags.DEFINE_float(
+    "warmup_proportion", 0.1,
+    "Proportion of training to perform linear learning rate warmup for. "
+    "E.g., 0.1 = 10% of training.")
+
+flags.DEFINE_integer("save_checkpoints_steps", 1000,
+                     "How often to save the model checkpoint.")
+
+
+def get_task_head(init_checkpoint):
+  """Returns the task and number of labels of a fine-tuned checkpoint.
+
+  The task is "classifier" for a `run_classifier.py` checkpoint and "pos" for
+  a `run_pos_tagging.py` one, whose number of labels is the number of tags.
+  """
+  var_to_shape = tf.train.load_checkpoint(
+      init_checkpoint).get_variable_to_shape_map()
+  if "output_weights" in var_to_shape:
+    return ("classifier", var_to_shape["output_weights"][0])
+  if "loss/dense/kernel" in var_to_shape:
+    return ("pos", var_to_shape["loss/dense/kernel"][1])
+  raise ValueError("%s has neither a classifier nor a POS tagging head" %
+                   init_checkpoint)
+
+
+def get_layer_map(student_layer_map, num_teacher_layers, num_student_layers):
+  """Returns a dict from every student layer to its teacher layer.
+
+  Args:
+    student_layer_map: string. Comma-separated teacher layer indices, or None
+      for evenly spaced layers ending with the last teacher layer.
+    num_teacher_layers: int. Number of teacher layers.
+    num_student_layers: int. Number of student layers.
+
+  Returns:
+    dict from student layer index to teacher layer index.
+
+  Raises:
+    ValueError: If the map does not have a valid teacher layer for every
+      student layer.
+  """
+  if student_layer_map:
+    teacher_layers = [int(x) for x in student_layer_map.split(",")]
+  else:
+    teacher_layers = [(i + 1) * num_teacher_layers // num_student_layers - 1
+                      for i in range(num_student_layers)]
+  if len(teacher_layers) != num_student_layers:
+    raise ValueError(
+        "The student layer map has %d entries but the student has %d layers" %
+        (len(teacher_layers), num_student_layers))
+  for layer_idx in teacher_layers:
+    if layer_idx < 0 or layer_idx >= num_teacher_layers:
+      raise ValueError("Teacher layer %d is out of range [0, %d)" %
+                       (layer_idx, num_teacher_layers))
+  return dict(enumerate(teacher_layers))
+
+
+def create_task_logits(model, task, num_labels, is_training):
+  """Creates the task head of `run_classifier.py` or `run_pos_tagging.py`.
+
+  Returns:
+    (logits, crf_params): logits of shape [batch_size, num_labels] for a
+    classifier, or the CRF emissions of shape [batch_size, seq_length - 1,
+    num_labels] and the CRF transition parameters for POS tagging.
+  """
+  if task == "classifier":
+    output_layer = model.get_pooled_output()
+    output_weights = tf.get_variable(
+        "output_weights", [num_labels, output_layer.shape[-1].value],
+        initializer=tf.truncated_normal_initializer(stddev=0.02))
+    output_bias = tf.get_variable(
+        "output_bias", [num_labels], initializer=tf.zeros_initializer())
+    if is_training:
+      output_layer = tf.nn.dropout(output_layer, keep_prob=0.9)
+    logits = tf.nn.bias_add(
+        tf.matmul(output_layer, output_weights, transpose_b=True), output_bias)
+    return (logits, None)
+
+  with tf.variable_scope("loss"):
+    output_layer = model.get_sequence_output()
+    if is_training:
+      output_layer = tf.nn.dropout(output_layer, keep_prob=0.9)
+    # Ignore the [CLS] token, as `run_pos_tagging.create_model` does.
+    logits = tf.layers.dense(output_layer[:, 1:, :], num_labels)
+    crf_params = tf.get_variable(
+        "crf", [num_labels, num_labels], dtype=tf.float32)
+  return (logits, crf_params)
+
+
+def _non_trainable_getter(getter, *args, **kwargs):
+  """Creates the teacher's variables outside of `tf.trainable_variables()`."""
+  kwargs["trainable"] = False
+  return getter(*args, **kwargs)
+
+
+def create_teacher(teacher_config, task, num_labels, input_ids, input_mask,
+                   segment_ids):
+  """Creates the frozen teacher model under the "teacher" variable scope.
+
+  Returns:
+    (model, logits): the teacher `BertModel` and its task logits.
+  """
+  with tf.variable_scope("teacher", custom_getter=_non_trainable_getter):
+    model = modeling.BertModel(
+        config=teacher_config,
+        is_training=False,
+        input_ids=input_ids,
+        input_mask=input_mask,
+        token_type_ids=segment_ids)
+    (logits, _) = create_task_logits(model, task, num_labels, False)
+  return (model, tf.stop_gradient(logits))
+
+
+def soft_cross_entropy(student_logits, teacher_logits, temperature):
+  """Cross-entropy of the student on the teacher's softened distribution.
+
+  Scaled by `temperature**2`, which keeps the gradient magnitudes independent
+  of the temperature (Hinton et al., 2015).
+
+  Returns:
+    float Tensor with the loss of every position of the logits' shape
+    without the last dimension.
+  """
+  teacher_probs = tf.nn.softmax(teacher_logits / temperature, axis=-1)
+  student_log_probs = tf.nn.log_softmax(student_logits / temperature, axis=-1)
+  return -tf.reduce_sum(
+      teacher_probs * student_log_probs, axis=-1) * temperature**2
+
+
+def hidden_state_loss(student_model, teacher_model, layer_map, input_mask):
+  """Mean squared error between student and mapped teacher hidden states.
+
+  The embedding outputs are matched too. If the student is narrower than the
+  teacher, its hidden states are first projected to the teacher's width by a
+  learned "distillation/hidden_projection" kernel, as in TinyBERT.
+
+  Returns:
+    float scalar Tensor averaged over the matched layers and real tokens.
+  """
+  pairs = [(student_model.get_embedding_output(),
+            teacher_model.get_embedding_output())]
+  student_layers = student_model.get_all_encoder_layers()
+  teacher_layers = teacher_model.get_all_encoder_layers()
+  for (student_idx, teacher_idx) in sorted(layer_map.items()):
+    pairs.append((student_layers[student_idx], teacher_layers[teacher_idx]))
+
+  student_width = modeling.get_shape_list(pairs[0][0])[-1]
+  teacher_width = modeling.get_shape_list(pairs[0][1])[-1]
+  projection = None
+  if student_width != teacher_width:
+    projection = tf.get_variable(
+        "distillation/hidden_projection", [student_width, teacher_width],
+        initializer=tf.truncated_normal_initializer(stddev=0.02))
+
+  weights = tf.cast(input_mask, tf.float32)
+  losses = []
+  for (student_hidden, teacher_hidden) in pairs:
+    student_hidden = tf.cast(student_hidden, tf.float32)
+    if projection is not None:
+      student_hidden = tf.einsum("bsh,hk->bsk", student_hidden, projection)
+    per_token_loss = tf.reduce_mean(
+        tf.squared_difference(student_hidden,
+                              tf.stop_gradient(
+                                  tf.cast(teacher_hidden, tf.float32))),
+        axis=-1)
+    losses.append(
+        tf.reduce_sum(per_token_loss * weights) / tf.reduce_sum(weights))
+  return tf.add_n(losses) / len(losses)
+
+
+def create_model(teacher_config, student_config, task, num_labels, is_training,
+                 features, layer_map, temperature, soft_loss_weight,
+                 hidden_loss_weight, hard_loss_weight):
+  """Creates the student and its distillation loss.
+
+  Args:
+    teacher_config: `BertConfig` of the teacher.
+    student_config: `BertConfig` of the student.
+    task: "classifier" or "pos", see `get_task_head`.
+    num_labels: int. Number of classes or tags.
+    is_training: bool. Whether the student applies dropout.
+    features: dict of feature Tensors. With a "teacher_logits" feature, the
+      teacher is not built.
+    layer_map: dict from student layer index to teacher layer index.
+    temperature: float. Temperature of the soft targets.
+    soft_loss_weight: float. Weight of the soft target loss.
+    hidden_loss_weight: float. Weight of the hidden-state loss.
+    hard_loss_weight: float. Weight of the gold label loss.
+
+  Returns:
+    (total_loss, per_example_loss, logits, crf_params) of the student, where
+    `per_example_loss` is the gold label loss and `crf_params` is None for a
+    classifier.
+
+  Raises:
+    ValueError: If the hidden-state loss is used with cached teacher logits.
+  """
+  input_ids = features["input_ids"]
+  input_mask = features["input_mask"]
+  segment_ids = features["segment_ids"]
+
+  student_model = modeling.BertModel(
+      config=student_config,
+      is_training=is_training,
+      input_ids=input_ids,
+      input_mask=input_mask,
+      token_type_ids=segment_ids)
+  (logits, crf_params) = create_task_logits(student_model, task, num_labels,
+                                            is_training)
+
+  teacher_model = None
+  if "teacher_logits" in features:
+    if hidden_loss_weight:
+      raise ValueError(
+          "The hidden-state loss needs the teacher's hidden states, which "
+          "are not cached with its logits; set hidden_loss_weight to 0.")
+    teacher_logits = tf.reshape(features["teacher_logits"],
+                                modeling.get_shape_list(logits))
+  else:
+    (teacher_model, teacher_logits) = create_teacher(
+        teacher_config, task, num_labels, input_ids, input_mask, segment_ids)
+
+  soft_loss = soft_cross_entropy(logits, teacher_logits, temperature)
+  if task == "classifier":
+    labels = tf.one_hot(features["label_ids"], depth=num_labels,
+                        dtype=tf.float32)
+    per_example_loss = -tf.reduce_sum(
+        labels * tf.nn.log_softmax(logits, axis=-1), axis=-1)
+    soft_loss = tf.reduce_mean(soft_loss)
+  else:
+    (per_example_loss, _) = tf.contrib.crf.crf_log_likelihood(
+        logits, features["tag_ids"], features["sentence_len"], crf_params)
+    per_example_loss = -per_example_loss
+    weights = tf.sequence_mask(
+        features["sentence_len"],
+        modeling.get_shape_list(logits)[1],
+        dtype=tf.float32)
+    soft_loss = tf.reduce_sum(soft_loss * weights) / tf.reduce_sum(weights)
+
+  total_loss = soft_loss_weight * soft_loss
+  if hard_loss_weight:
+    total_loss += hard_loss_weight * tf.reduce_mean(per_example_loss)
+  if hidden_loss_weight:
+    total_loss += hidden_loss_weight * hidden_state_loss(
+        student_model, teacher_model, layer_map, input_mask)
+
+  return (total_loss, per_example_loss, logits, crf_params)
+
+
+def model_fn_builder(teacher_config, student_config, task, num_labels,
+                     teacher_checkpoint, layer_map, init_student_from_teacher,
+                     learning_rate, num_train_steps, num_warmup_steps):
+  """Returns `model_fn` closure for Estimator."""
+
+  def model_fn(features, labels, mode, params):  # pylint: disable=unused-argument
+    """The `model_fn` for Estimator."""
+
+    tf.logging.info("*** Features ***")
+    for name in sorted(features.keys()):
+      tf.logging.info("  name = %s, shape = %s" % (name, features[name].shape))
+
+    is_training = (mode == tf.estimator.ModeKeys.TRAIN)
+
+    (total_loss, per_example_loss, logits, crf_params) = create_model(
+        teacher_config, student_config, task, num_labels, is_training,
+        features, layer_map, FLAGS.temperature, FLAGS.soft_loss_weight,
+        FLAGS.hidden_loss_weight, FLAGS.hard_loss_weight)
+
+    # The teacher's variables are not trainable, so `tvars` is the student
+    # (and the hidden-state projection).
+    tvars = tf.trainable_variables()
+    initialized_variable_names = {}
+    if init_student_from_teacher:
+      (assignment_map, initialized_variable_names
+      ) = modeling.get_assignment_map_from_checkpoint(
+          tvars, teacher_checkpoint, layer_map=layer_map)
+      tf.train.init_from_checkpoint(teacher_checkpoint, assignment_map)
+    (teacher_assignment_map,
+     _) = modeling.get_assignment_map_from_checkpoint(
+         tf.global_variables(), teacher_checkpoint, scope="teacher")
+    if teacher_assignment_map:
+      tf.train.init_from_checkpoint(teacher_checkpoint, teacher_assignment_map)
+
+    tf.logging.info("**** Trainable Variables ****")
+    for var in tvars:
+      init_string = ""
+      if var.name in initialized_variable_names:
+        init_string = ", *INIT_FROM_CKPT*"
+      tf.logging.info("  name = %s, shape = %s%s", var.name, var.shape,
+                      init_string)
+
+    output_spec = None
+    if mode == tf.estimator.ModeKeys.TRAIN:
+      train_op = optimization.create_optimizer(
+          total_loss, learning_rate, num_train_steps, num_warmup_steps,
+          use_tpu=False,
+          use_loss_scaling=(student_config.compute_dtype == "float16"))
+
+      output_spec = tf.estimator.EstimatorSpec(
+          mode=mode, loss=total_loss, train_op=train_op)
+    elif mode == tf.estimator.ModeKeys.EVAL:
+      if task == "classifier":
+        predictions = tf.argmax(logits, axis=-1, output_type=tf.int32)
+        weights = tf.cast(features["is_real_example"], tf.float32)
+        metrics = {
+            "eval_accuracy":
+                tf.metrics.accuracy(
+                    labels=features["label_ids"],
+                    predictions=predictions,
+                    weights=weights),
+            "eval_loss":
+                tf.metrics.mean(values=per_example_loss, weights=weights),
+        }
+      else:
+        (predictions, _) = tf.contrib.crf.crf_decode(
+            logits, crf_params, features["sentence_len"])
+        weights = tf.sequence_mask(
+            features["sentence_len"],
+            modeling.get_shape_list(logits)[1],
+            dtype=tf.float32)
+        metrics = {
+            "eval_accuracy":
+                tf.metrics.accuracy(
+                    labels=features["tag_ids"],
+                    predictions=predictions,
+                    weights=weights),
+            "eval_loss": tf.metrics.mean(values=per_example_loss),
+        }
+      output_spec = tf.estimator.EstimatorSpec(
+          mode=mode, loss=total_loss, eval_metric_ops=metrics)
+    else:
+      raise ValueError("Only TRAIN and EVAL modes are supported: %s" % (mode))
+
+    return output_spec
+
+  return model_fn
+
+
+def teacher_model_fn_builder(teacher_config, task, num_labels,
+                             teacher_checkpoint):
+  """Returns a `model_fn` predicting the teacher's logits."""
+
+  def model_fn(features, labels, mode, params):  # pylint: disable=unused-argument
+    """The `model_fn` for Estimator."""
+    (_, logits) = create_teacher(teacher_config, task, num_labels,
+                                 features["input_ids"], features["input_mask"],
+                                 features["segment_ids"])
+    (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+        tf.global_variables(), teacher_checkpoint, scope="teacher")
+    tf.train.init_from_checkpoint(teacher_checkpoint, assignment_map)
+    return tf.estimator.EstimatorSpec(
+        mode=mode, predictions={"teacher_logits": logits})
+
+  return model_fn
+
+
+def get_name_to_features(task, seq_length, num_labels, with_teacher_logits):
+  """Returns the features of the training and eval TFRecord files."""
+  name_to_features = {
+      "input_ids": tf.FixedLenFeature([seq_length], tf.int64),
+      "input_mask": tf.FixedLenFeature([seq_length], tf.int64),
+      "segment_ids": tf.FixedLenFeature([seq_length], tf.int64),
+  }
+  if task == "classifier":
+    name_to_features["label_ids"] = tf.FixedLenFeature([], tf.int64)
+    name_to_features["is_real_example"] = tf.FixedLenFeature(
+        [], tf.int64, default_value=1)
+    num_logits = num_labels
+  else:
+    name_to_features["sentence_len"] = tf.FixedLenFeature([], tf.int64)
+    name_to_features["tag_ids"] = tf.FixedLenFeature([seq_length - 1],
+                                                     tf.int64)
+    num_logits = (seq_length - 1) * num_labels
+  if with_teacher_logits:
+    name_to_features["teacher_logits"] = tf.FixedLenFeature([num_logits],
+                                                            tf.float32)
+  return name_to_features
+
+
+def file_based_input_fn_builder(input_file, name_to_features, batch_size,
+                                is_training, drop_remainder):
+  """Creates an `input_fn` closure to be passed to Estimator."""
+
+  def _decode_record(record, name_to_features):
+    """Decodes a record to a TensorFlow example."""
+    example = tf.parse_single_example(record, name_to_features)
+
+    # tf.Example only supports tf.int64, but the TPU only supports tf.int32.
+    # So cast all int64 to int32.
+    for name in list(example.keys()):
+      t = example[name]
+      if t.dtype == tf.int64:
+        t = tf.to_int32(t)
+      example[name] = t
+
+    return example
+
+  def input_fn(params):  # pylint: disable=unused-argument
+    """The actual input function."""
+    d = tf.data.TFRecordDataset(input_file)
+    if is_training:
+      d = d.repeat()
+      d = d.shuffle(buffer_size=100)
+
+    d = d.apply(
+        tf.contrib.data.map_and_batch(
+            lambda record: _decode_record(record, name_to_features),
+            batch_size=batch_size,
+            drop_remainder=drop_remainder))
+    return d
+
+  return input_fn
+
+
+def has_teacher_logits(input_file):
+  """Whether a TFRecord file was written by `write_teacher_logits`."""
+  for record in tf.python_io.tf_record_iterator(input_file):
+    example = tf.train.Example.FromString(record)
+    return "teacher_logits" in example.features.feature
+  return False
+
+
+def write_teacher_logits(estimator, input_file, name_to_features, output_file):
+  """Writes the examples of `input_file` with the teacher's logits.
+
+  Args:
+    estimator: Estimator with a `teacher_model_fn_builder` model_fn.
+    input_file: TFRecord file of converted features.
+    name_to_features: The features of `input_file`.
+    output_file: Where to write the examples with a "teacher_logits" feature,
+      flattened for POS tagging.
+
+  Returns:
+    The number of written examples.
+  """
+  input_fn = file_based_input_fn_builder(
+      input_file=input_file,
+      name_to_features=name_to_features,
+      batch_size=FLAGS.eval_batch_size,
+      is_training=False,
+      drop_remainder=False)
+  num_written = 0
+  with tf.python_io.TFRecordWriter(output_file) as writer:
+    # The records and the predictions are both in file order.
+    for (record, prediction) in zip(
+        tf.python_io.tf_record_iterator(input_file),
+        estimator.predict(input_fn=input_fn, yield_single_examples=True)):
+      example = tf.train.Example.FromString(record)
+      example.features.feature["teacher_logits"].float_list.value.extend(
+          prediction["teacher_logits"].flatten().tolist())
+      writer.write(example.SerializeToString())
+      num_written += 1
+  return num_written
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  if not FLAGS.do_train and not FLAGS.do_eval:
+    raise ValueError("At least one of `do_train` or `do_eval` must be True.")
+
+  teacher_config = modeling.BertConfig.from_json_file(FLAGS.teacher_config_file)
+  student_config = modeling.BertConfig.from_json_file(FLAGS.student_config_file)
+  for config in (teacher_config, student_config):
+    if config.token_pruning_schedule:
+      raise ValueError(
+          "Distillation matches the hidden states of every position, so it "
+          "cannot be used with `token_pruning_schedule`.")
+
+  (task, num_labels) = get_task_head(FLAGS.teacher_checkpoint)
+  layer_map = get_layer_map(FLAGS.student_layer_map,
+                            teacher_config.num_hidden_layers,
+                            student_config.num_hidden_layers)
+  tf.logging.info("Distilling a %s teacher into student layers %s", task,
+                  ", ".join("%d <- %d" % x for x in sorted(layer_map.items())))
+
+  if (FLAGS.init_student_from_teacher and
+      student_config.hidden_size != teacher_config.hidden_size):
+    raise ValueError(
+        "Cannot initialize a student with hidden size %d from a teacher with "
+        "hidden size %d; set --init_student_from_teacher=false." %
+        (student_config.hidden_size, teacher_config.hidden_size))
+
+  tf.gfile.MakeDirs(FLAGS.output_dir)
+  tf.gfile.Copy(
+      FLAGS.student_config_file,
+      os.path.join(FLAGS.output_dir, "bert_config.json"),
+      overwrite=True)
+
+  if FLAGS.do_train and not FLAGS.train_file:
+    raise ValueError("`do_train` needs `train_file`.")
+  if FLAGS.do_eval and not FLAGS.eval_file:
+    raise ValueError("`do_eval` needs `eval_file`.")
+  if (FLAGS.do_train and FLAGS.hidden_loss_weight and
+      (FLAGS.do_cache_teacher_logits or has_teacher_logits(FLAGS.train_file))):
+    raise ValueError(
+        "The hidden-state loss needs the teacher's hidden states, which are "
+        "not cached with its logits; set --hidden_loss_weight=0.")
+
+  train_file = FLAGS.train_file
+  if FLAGS.do_train and FLAGS.do_cache_teacher_logits:
+    teacher_estimator = tf.estimator.Estimator(
+        model_fn=teacher_model_fn_builder(teacher_config, task, num_labels,
+                                          FLAGS.teacher_checkpoint))
+    train_file = os.path.join(FLAGS.output_dir, "teacher_logits.tf_record")
+    num_written = write_teacher_logits(
+        teacher_estimator, FLAGS.train_file,
+        get_name_to_features(task, FLAGS.max_seq_length, num_labels, False),
+        train_file)
+    tf.logging.info("Wrote the teacher logits of %d examples to %s",
+                    num_written, train_file)
+
+  num_train_steps = None
+  num_warmup_steps = None
+  if FLAGS.do_train:
+    num_train_examples = sum(
+        1 for _ in tf.python_io.tf_record_iterator(train_file))
+    num_train_steps = int(
+        num_train_examples / FLAGS.train_batch_size * FLAGS.num_train_epochs)
+    num_warmup_steps = int(num_train_steps * FLAGS.warmup_proportion)
+
+  model_fn = model_fn_builder(
+      teacher_config=teacher_config,
+      student_config=student_config,
+      task=task,
+      num_labels=num_labels,
+      teacher_checkpoint=FLAGS.teacher_checkpoint,
+      layer_map=layer_map,
+      init_student_from_teacher=FLAGS.init_student_from_teacher,
+      learning_rate=FLAGS.learning_rate,
+      num_train_steps=num_train_steps,
+      num_warmup_steps=num_warmup_steps)
+
+  config = tf.estimator.RunConfig(
+      model_dir=FLAGS.output_dir,
+      save_checkpoints_steps=FLAGS.save_checkpoints_steps)
+  estimator = tf.estimator.Estimator(model_fn=model_fn, config=config)
+
+  if FLAGS.do_train:
+    train_input_fn = file_based_input_fn_builder(
+        input_file=train_file,
+        name_to_features=get_name_to_features(task, FLAGS.max_seq_length,
+                                              num_labels,
+                                              has_teacher_logits(train_file)),
+        batch_size=FLAGS.train_batch_size,
+        is_training=True,
+        drop_remainder=True)
+    tf.logging.info("***** Running training *****")
+    tf.logging.info("  Num examples = %d", num_train_examples)
+    tf.logging.info("  Batch size = %d", FLAGS.train_batch_size)
+    tf.logging.info("  Num steps = %d", num_train_steps)
+    estimator.train(input_fn=train_input_fn, max_steps=num_train_steps)
+
+  if FLAGS.do_eval:
+    eval_input_fn = file_based_input_fn_builder(
+        input_file=FLAGS.eval_file,
+        name_to_features=get_name_to_features(task, FLAGS.max_seq_length,
+                                              num_labels, False),
+        batch_size=FLAGS.eval_batch_size,
+        is_training=False,
+        drop_remainder=False)
+    tf.logging.info("***** Running evaluation *****")
+    tf.logging.info("  Batch size = %d", FLAGS.eval_batch_size)
+    result = estimator.evaluate(input_fn=eval_input_fn)
+
+    output_eval_file = os.path.join(FLAGS.output_dir, "eval_results.txt")
+    with tf.gfile.GFile(output_eval_file, "w") as writer:
+      tf.logging.info("***** Eval results *****")
+      for key in sorted(result.keys()):
+        tf.logging.info("  %s = %s", key, str(result[key]))
+        writer.write("%s = %s\n" % (key, str(result[key])))
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("teacher_config_file")
+  flags.mark_flag_as_required("teacher_checkpoint")
+  flags.mark_flag_as_required("student_config_file")
+  flags.mark_flag_as_required("output_dir")
+  tf.app.run()
@@ -0,0 +1,167 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import modeling
+import numpy as np
+import run_distillation
+import tensorflow as tf
+
+
+class RunDistillationTest(tf.test.TestCase):
+
+  def get_config(self, num_hidden_layers):
+    return modeling.BertConfig(
+        vocab_size=99,
+        hidden_size=32,
+        num_hidden_layers=num_hidden_layers,
+        num_attention_heads=4,
+        intermediate_size=37)
+
+  def create_teacher_checkpoint(self, bert_config):
+    """Writes a randomly initialized classifier checkpoint."""
+    checkpoint = os.path.join(self.get_temp_dir(), "teacher.ckpt")
+    with tf.Graph().as_default():
+      modeling.BertModel(
+          config=bert_config,
+          is_training=False,
+          input_ids=tf.zeros([1, 4], dtype=tf.int32))
+      tf.get_variable("output_weights", [3, bert_config.hidden_size])
+      tf.get_variable("output_bias", [3])
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, checkpoint)
+    return checkpoint
+
+  def test_get_layer_map(self):
+    self.assertEqual(
+        run_distillation.get_layer_map(None, 12, 4), {
+            0: 2,
+            1: 5,
+            2: 8,
+            3: 11
+        })
+    self.assertEqual(
+        list(run_distillation.get_layer_map(None, 12, 6).values()),
+        [1, 3, 5, 7, 9, 11])
+    self.assertEqual(
+        run_distillation.get_layer_map("0,6", 12, 2), {
+            0: 0,
+            1: 6
+        })
+    with self.assertRaises(ValueError):
+      run_distillation.get_layer_map("0,6", 12, 3)
+    with self.assertRaises(ValueError):
+      run_distillation.get_layer_map("0,12", 12, 2)
+
+  def test_soft_cross_entropy(self):
+    student_logits = np.array([[1.0, -2.0, 0.5]], dtype=np.float32)
+    teacher_logits = np.array([[0.3, 2.0, -1.0]], dtype=np.float32)
+    temperature = 2.0
+
+    def softmax(x):
+      e = np.exp(x - x.max(axis=-1, keepdims=True))
+      return e / e.sum(axis=-1, keepdims=True)
+
+    expected = -np.sum(
+        softmax(teacher_logits / temperature) *
+        np.log(softmax(student_logits / temperature)),
+        axis=-1) * temperature**2
+    with self.test_session() as sess:
+      loss = sess.run(
+          run_distillation.soft_cross_entropy(
+              tf.constant(student_logits), tf.constant(teacher_logits),
+              temperature))
+    self.assertAllClose(loss, expected)
+
+  def run_teacher(self, bert_config, checkpoint, features):
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=bert_config,
+          is_training=False,
+          input_ids=tf.constant(features["input_ids"]),
+          input_mask=tf.constant(features["input_mask"]),
+          token_type_ids=tf.constant(features["segment_ids"]))
+      (logits, _) = run_distillation.create_task_logits(
+          model, "classifier", 3, is_training=False)
+      with tf.Session() as sess:
+        tf.train.Saver().restore(sess, checkpoint)
+        return sess.run(logits)
+
+  def test_student_initialized_from_teacher_layers(self):
+    teacher_config = self.get_config(num_hidden_layers=4)
+    teacher_checkpoint = self.create_teacher_checkpoint(teacher_config)
+    features = {
+        "input_ids": [[31, 51, 98, 3], [15, 5, 9, 0]],
+        "input_mask": [[1, 1, 1, 1], [1, 1, 1, 0]],
+        "segment_ids": [[0, 0, 1, 1], [0, 0, 0, 0]],
+        "label_ids": [2, 0],
+    }
+    teacher_logits = self.run_teacher(teacher_config, teacher_checkpoint,
+                                      features)
+
+    # A student with all the teacher's layers matches the teacher exactly, so
+    # its hidden-state loss is zero.
+    for (num_student_layers, layer_map) in ((2, {0: 1, 1: 3}),
+                                            (4, {0: 0, 1: 1, 2: 2, 3: 3})):
+      with tf.Graph().as_default():
+        (total_loss, _, logits, _) = run_distillation.create_model(
+            teacher_config,
+            self.get_config(num_student_layers),
+            "classifier",
+            3,
+            False, {k: tf.constant(v) for (k, v) in features.items()},
+            layer_map,
+            temperature=1.0,
+            soft_loss_weight=0.0,
+            hidden_loss_weight=1.0,
+            hard_loss_weight=0.0)
+        self.assertEmpty([
+            x for x in tf.trainable_variables()
+            if x.name.startswith("teacher/")
+        ])
+        (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+            tf.trainable_variables(), teacher_checkpoint, layer_map=layer_map)
+        tf.train.init_from_checkpoint(teacher_checkpoint, assignment_map)
+        (assignment_map, _) = modeling.get_assignment_map_from_checkpoint(
+            tf.global_variables(), teacher_checkpoint, scope="teacher")
+        tf.train.init_from_checkpoint(teacher_checkpoint, assignment_map)
+
+        student_query = tf.get_default_graph().get_tensor_by_name(
+            "bert/encoder/layer_%d/attention/self/query/kernel:0" %
+            (num_student_layers - 1))
+        with tf.Session() as sess:
+          sess.run(tf.global_variables_initializer())
+          (total_loss_value, logits_value, student_query_value) = sess.run(
+              [total_loss, logits, student_query])
+
+      self.assertAllClose(
+          student_query_value,
+          tf.train.load_variable(
+              teacher_checkpoint,
+              "bert/encoder/layer_3/attention/self/query/kernel"))
+      if num_student_layers == 4:
+        self.assertAllClose(total_loss_value, 0.0)
+        self.assertAllClose(logits_value, teacher_logits)
+      else:
+        self.assertGreater(total_loss_value, 0.0)
+
+
+if __name__ == "__main__":
+  tf.test.main()
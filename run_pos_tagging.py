@@ -25,6 +25,7 @@ import os
 import tensorflow as tf
 import functools
 
+import bucketing
 import modeling
 import optimization
 import tokenization
@@ -72,6 +73,13 @@ flags.DEFINE_integer(
     "Sequences longer than this will be truncated, and sequences shorter "
     "than this will be padded.")
 
+flags.DEFINE_string(
+    "seq_length_buckets", "",
+    "Optional comma-separated sequence lengths, e.g. \"32,64\". If set, each "
+    "batch runs at the shortest of these lengths (or `max_seq_length`) that "
+    "holds all of its tokens instead of at `max_seq_length`, and training "
+    "batches are grouped by length.")
+
 flags.DEFINE_bool("do_train", False, "Whether to run training.")
 
 flags.DEFINE_bool("do_eval", False, "Whether to run eval on the dev set.")
@@ -191,12 +199,13 @@ class PosProcessor():
 
     @classmethod
     def _read_data_file(cls, input_file):
-        """Reads a tab separated value file."""
+        """Yields the stripped lines of a tab separated value file.
+
+        The file is streamed rather than read into a list up front.
+        """
         with tf.gfile.Open(input_file, "r") as f:
-            lines = []
             for line in f:
-                lines.append(line.strip())
-            return lines
+                yield line.strip()
 
     def get_labels(self):
 
@@ -214,7 +223,8 @@ def convert_single_example(ex_index, example, tag_id_map, max_seq_length,
     """Converts a single `InputExample` into a single `InputFeatures`."""
 
     tags = example.tags
-    tokens = tokenizer.tokenize(example.text)
+    # One token past the budget is enough to tell whether truncation is needed.
+    tokens = tokenizer.tokenize(example.text, max_tokens=max_seq_length - 1)
     # Account for [CLS] and [SEP] with "- 2"
     if len(tokens) > max_seq_length - 2:
         tokens = tokens[0: (max_seq_length - 2)]
@@ -316,8 +326,12 @@ def file_based_convert_examples_to_features(
 
 
 def file_based_input_fn_builder(input_file, seq_length, is_training,
-                                drop_remainder):
-    """Creates an `input_fn` closure to be passed to TPUEstimator."""
+                                drop_remainder, seq_length_buckets=None):
+    """Creates an `input_fn` closure to be passed to TPUEstimator.
+
+    If `seq_length_buckets` is given (see `bucketing.parse_seq_length_buckets`),
+    every batch is trimmed to the shortest bucket that holds it.
+    """
 
     name_to_features = {
         "input_ids": tf.FixedLenFeature([seq_length], tf.int64),
@@ -357,6 +371,17 @@ def file_based_input_fn_builder(input_file, seq_length, is_training,
             d = d.repeat()
             d = d.shuffle(buffer_size=100)
 
+        if seq_length_buckets:
+            d = d.map(lambda record: _decode_record(record, name_to_features))
+            return bucketing.batch_by_sequence_length(
+                d,
+                batch_size=batch_size,
+                seq_length_buckets=seq_length_buckets,
+                sequence_feature_names=[
+                    "input_ids", "input_mask", "segment_ids", "tag_ids"],
+                group_by_length=is_training,
+                drop_remainder=drop_remainder)
+
         d = d.apply(
             tf.contrib.data.map_and_batch(
                 lambda record: _decode_record(record, name_to_features),
@@ -391,7 +416,8 @@ def create_model(bert_config, is_training, input_ids, input_mask, segment_ids,
             # I.e., 0.1 dropout
             output_layer = tf.nn.dropout(output_layer, keep_prob=0.9)
 
-        _, sentence_len, _ = output_layer.shape.as_list()
+        sentence_len = modeling.get_shape_list(output_layer,
+                                               expected_rank=3)[1]
 
         # Ignore the [cls] token in the head of the sentence.
         output_layer = output_layer[:, 1:, :]
@@ -482,7 +508,8 @@ def model_fn_builder(bert_config, init_checkpoint, learning_rate,
         if mode == tf.estimator.ModeKeys.TRAIN:
             train_op = optimization.create_optimizer(
                 loss, learning_rate, num_train_steps,
-                num_warmup_steps, use_tpu=False)
+                num_warmup_steps, use_tpu=False,
+                use_loss_scaling=(bert_config.compute_dtype == "float16"))
 
             output_spec = tf.estimator.EstimatorSpec(
                 mode=mode,
@@ -608,6 +635,13 @@ def main(_):
             "was only trained up to sequence length %d" %
             (FLAGS.max_seq_length, bert_config.max_position_embeddings))
 
+    if bert_config.token_pruning_schedule:
+        raise ValueError("`token_pruning_schedule` drops positions, but POS "
+                         "tagging needs the output of every position.")
+
+    seq_length_buckets = bucketing.parse_seq_length_buckets(
+        FLAGS.seq_length_buckets, FLAGS.max_seq_length)
+
     tf.gfile.MakeDirs(FLAGS.output_dir)
 
     processor = PosProcessor(FLAGS.data_dir)
@@ -626,9 +660,12 @@ def main(_):
             / FLAGS.train_batch_size * FLAGS.num_train_epochs)
         num_warmup_steps = int(num_train_steps * FLAGS.warmup_proportion)
 
+    init_checkpoint = modeling.maybe_fuse_qkv_checkpoint(
+        bert_config, FLAGS.init_checkpoint, FLAGS.output_dir)
+
     model_fn = model_fn_builder(
         bert_config=bert_config,
-        init_checkpoint=FLAGS.init_checkpoint,
+        init_checkpoint=init_checkpoint,
         learning_rate=FLAGS.learning_rate,
         num_train_steps=num_train_steps,
         num_warmup_steps=num_warmup_steps)
@@ -654,7 +691,8 @@ def main(_):
             input_file=train_file,
             seq_length=FLAGS.max_seq_length,
             is_training=True,
-            drop_remainder=True)
+            drop_remainder=True,
+            seq_length_buckets=seq_length_buckets)
         train_input_fn = functools.partial(train_input_fn, params=FLAGS)
         estimator.train(input_fn=train_input_fn, max_steps=num_train_steps)
 
@@ -679,7 +717,8 @@ def main(_):
             input_file=eval_file,
             seq_length=FLAGS.max_seq_length,
             is_training=False,
-            drop_remainder=False)
+            drop_remainder=False,
+            seq_length_buckets=seq_length_buckets)
         eval_input_fn = functools.partial(eval_input_fn, params=FLAGS)
 
         result = estimator.evaluate(input_fn=eval_input_fn, steps=eval_steps)
@@ -710,7 +749,8 @@ def main(_):
             input_file=predict_file,
             seq_length=FLAGS.max_seq_length,
             is_training=False,
-            drop_remainder=False)
+            drop_remainder=False,
+            seq_length_buckets=seq_length_buckets)
 
         predict_input_fn = functools.partial(predict_input_fn, params=FLAGS)
         result = estimator.predict(input_fn=predict_input_fn)
@@ -57,6 +57,19 @@ flags.DEFINE_integer(
     "Maximum number of masked LM predictions per sequence. "
     "Must match data generation.")
 
+flags.DEFINE_integer(
+    "embedding_size", None,
+    "If set, overrides `embedding_size` of the config: the width of the "
+    "embeddings, which are projected up to `hidden_size`.")
+
+flags.DEFINE_bool(
+    "share_attention_across_layers", None,
+    "If set, overrides `share_attention_across_layers` of the config.")
+
+flags.DEFINE_bool(
+    "share_ffn_across_layers", None,
+    "If set, overrides `share_ffn_across_layers` of the config.")
+
 flags.DEFINE_bool("do_train", False, "Whether to run training.")
 
 flags.DEFINE_bool("do_eval", False, "Whether to run eval on the dev set.")
@@ -171,11 +184,16 @@ def model_fn_builder(bert_config, init_checkpoint, learning_rate,
         init_string = ", *INIT_FROM_CKPT*"
       tf.logging.info("  name = %s, shape = %s%s", var.name, var.shape,
                       init_string)
+    # Layers that share their variables and a smaller `embedding_size` show
+    # up here as fewer parameters.
+    tf.logging.info("  Total trainable parameters = %d",
+                    sum(var.shape.num_elements() for var in tvars))
 
     output_spec = None
     if mode == tf.estimator.ModeKeys.TRAIN:
       train_op = optimization.create_optimizer(
-          total_loss, learning_rate, num_train_steps, num_warmup_steps, use_tpu)
+          total_loss, learning_rate, num_train_steps, num_warmup_steps, use_tpu,
+          use_loss_scaling=(bert_config.compute_dtype == "float16"))
 
       output_spec = tf.contrib.tpu.TPUEstimatorSpec(
           mode=mode,
@@ -244,11 +262,12 @@ def get_masked_lm_output(bert_config, input_tensor, output_weights, positions,
 
   with tf.variable_scope("cls/predictions"):
     # We apply one more non-linear transformation before the output layer.
-    # This matrix is not used after pre-training.
+    # This matrix is not used after pre-training. It maps to the width of the
+    # embeddings, which is smaller than `hidden_size` with `embedding_size`.
     with tf.variable_scope("transform"):
       input_tensor = tf.layers.dense(
           input_tensor,
-          units=bert_config.hidden_size,
+          units=modeling.get_embedding_size(bert_config),
           activation=modeling.get_activation(bert_config.hidden_act),
           kernel_initializer=modeling.create_initializer(
               bert_config.initializer_range))
@@ -410,8 +429,25 @@ def main(_):
     raise ValueError("At least one of `do_train` or `do_eval` must be True.")
 
   bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+  original_config = bert_config.to_dict()
+  if FLAGS.embedding_size is not None:
+    bert_config.embedding_size = FLAGS.embedding_size
+  if FLAGS.share_attention_across_layers is not None:
+    bert_config.share_attention_across_layers = (
+        FLAGS.share_attention_across_layers)
+  if FLAGS.share_ffn_across_layers is not None:
+    bert_config.share_ffn_across_layers = FLAGS.share_ffn_across_layers
 
   tf.gfile.MakeDirs(FLAGS.output_dir)
+  if bert_config.to_dict() != original_config:
+    # Fine-tuning needs the config of the pre-trained checkpoints, including
+    # the overrides above. A distinct name keeps any "bert_config.json" in
+    # `output_dir`.
+    output_config_file = os.path.join(FLAGS.output_dir,
+                                      "pretraining_bert_config.json")
+    with tf.gfile.GFile(output_config_file, "w") as writer:
+      writer.write(bert_config.to_json_string())
+    tf.logging.info("Wrote the overridden config to %s", output_config_file)
 
   input_files = []
   for input_pattern in FLAGS.input_file.split(","):
@@ -437,9 +473,12 @@ def main(_):
           num_shards=FLAGS.num_tpu_cores,
           per_host_input_for_training=is_per_host))
 
+  init_checkpoint = modeling.maybe_fuse_qkv_checkpoint(
+      bert_config, FLAGS.init_checkpoint, FLAGS.output_dir)
+
   model_fn = model_fn_builder(
       bert_config=bert_config,
-      init_checkpoint=FLAGS.init_checkpoint,
+      init_checkpoint=init_checkpoint,
       learning_rate=FLAGS.learning_rate,
       num_train_steps=FLAGS.num_train_steps,
       num_warmup_steps=FLAGS.num_warmup_steps,
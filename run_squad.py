@@ -63,6 +63,18 @@ flags.DEFINE_bool(
     "Whether to lower case the input text. Should be True for uncased "
     "models and False for cased models.")
 
+flags.DEFINE_integer(
+    "tokenizer_cache_size", 0,
+    "If > 0, the tokenizer keeps the WordPiece output of up to this many "
+    "distinct words in an LRU cache. Frequent words then skip the WordPiece "
+    "search entirely.")
+
+flags.DEFINE_string(
+    "vocab_snapshot_file", None,
+    "Optional snapshot of `vocab_file` written by compile_vocab_snapshot.py. "
+    "If set, the vocab is loaded from it instead of parsing `vocab_file`; a "
+    "snapshot that does not match `vocab_file` is rejected.")
+
 flags.DEFINE_integer(
     "max_seq_length", 384,
     "The maximum total input sequence length after WordPiece tokenization. "
@@ -550,13 +562,21 @@ def _check_is_max_context(doc_spans, cur_span_index, position):
 def create_model(bert_config, is_training, input_ids, input_mask, segment_ids,
                  use_one_hot_embeddings):
   """Creates a classification model."""
+  # With local attention, the question tokens (segment 0, i.e. [CLS], the
+  # question and the first [SEP]) attend to and are attended from the whole
+  # document span.
+  global_attention_mask = None
+  if bert_config.attention_window:
+    global_attention_mask = (1 - segment_ids) * input_mask
+
   model = modeling.BertModel(
       config=bert_config,
       is_training=is_training,
       input_ids=input_ids,
       input_mask=input_mask,
       token_type_ids=segment_ids,
-      use_one_hot_embeddings=use_one_hot_embeddings)
+      use_one_hot_embeddings=use_one_hot_embeddings,
+      global_attention_mask=global_attention_mask)
 
   final_hidden = model.get_sequence_output()
 
@@ -660,7 +680,8 @@ def model_fn_builder(bert_config, init_checkpoint, learning_rate,
       total_loss = (start_loss + end_loss) / 2.0
 
       train_op = optimization.create_optimizer(
-          total_loss, learning_rate, num_train_steps, num_warmup_steps, use_tpu)
+          total_loss, learning_rate, num_train_steps, num_warmup_steps, use_tpu,
+          use_loss_scaling=(bert_config.compute_dtype == "float16"))
 
       output_spec = tf.contrib.tpu.TPUEstimatorSpec(
           mode=mode,
@@ -1122,6 +1143,26 @@ def validate_flags_or_throw(bert_config):
         "The max_seq_length (%d) must be greater than max_query_length "
         "(%d) + 3" % (FLAGS.max_seq_length, FLAGS.max_query_length))
 
+  if (bert_config.attention_window and
+      bert_config.num_global_tokens < FLAGS.max_query_length + 2):
+    raise ValueError(
+        "With `attention_window`, the question tokens are global, so "
+        "num_global_tokens (%d) must be at least max_query_length (%d) + 2" %
+        (bert_config.num_global_tokens, FLAGS.max_query_length))
+
+  if bert_config.token_pruning_schedule:
+    raise ValueError("`token_pruning_schedule` drops positions, but SQuAD "
+                     "needs the output of every position.")
+
+
+def log_tokenizer_cache_stats(tokenizer):
+  cache_stats = tokenizer.get_cache_stats()
+  if cache_stats is None:
+    return
+  tf.logging.info("  Tokenizer cache = %s",
+                  ", ".join("%s: %s" % (k, cache_stats[k])
+                            for k in sorted(cache_stats.keys())))
+
 
 def main(_):
   tf.logging.set_verbosity(tf.logging.INFO)
@@ -1133,7 +1174,9 @@ def main(_):
   tf.gfile.MakeDirs(FLAGS.output_dir)
 
   tokenizer = tokenization.FullTokenizer(
-      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case)
+      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case,
+      cache_size=FLAGS.tokenizer_cache_size,
+      snapshot_file=FLAGS.vocab_snapshot_file)
 
   tpu_cluster_resolver = None
   if FLAGS.use_tpu and FLAGS.tpu_name:
@@ -1166,9 +1209,12 @@ def main(_):
     rng = random.Random(12345)
     rng.shuffle(train_examples)
 
+  init_checkpoint = modeling.maybe_fuse_qkv_checkpoint(
+      bert_config, FLAGS.init_checkpoint, FLAGS.output_dir)
+
   model_fn = model_fn_builder(
       bert_config=bert_config,
-      init_checkpoint=FLAGS.init_checkpoint,
+      init_checkpoint=init_checkpoint,
       learning_rate=FLAGS.learning_rate,
       num_train_steps=num_train_steps,
       num_warmup_steps=num_warmup_steps,
@@ -1203,6 +1249,7 @@ def main(_):
     tf.logging.info("***** Running training *****")
     tf.logging.info("  Num orig examples = %d", len(train_examples))
     tf.logging.info("  Num split examples = %d", train_writer.num_features)
+    log_tokenizer_cache_stats(tokenizer)
     tf.logging.info("  Batch size = %d", FLAGS.train_batch_size)
     tf.logging.info("  Num steps = %d", num_train_steps)
     del train_examples
@@ -1240,6 +1287,7 @@ def main(_):
     tf.logging.info("***** Running predictions *****")
     tf.logging.info("  Num orig examples = %d", len(eval_examples))
     tf.logging.info("  Num split examples = %d", len(eval_features))
+    log_tokenizer_cache_stats(tokenizer)
     tf.logging.info("  Batch size = %d", FLAGS.predict_batch_size)
 
     all_results = []
@@ -18,12 +18,28 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import array
 import collections
+import gc
+import hashlib
+import itertools
+import mmap
+import multiprocessing
 import re
+import struct
 import unicodedata
+import numpy as np
 import six
 import tensorflow as tf
 
+try:
+  from multiprocessing import resource_tracker
+  from multiprocessing import shared_memory
+except ImportError:
+  # Python < 3.8.
+  resource_tracker = None
+  shared_memory = None
+
 
 def validate_case_matches_checkpoint(do_lower_case, init_checkpoint):
   """Checks whether the casing config is consistent with the checkpoint name."""
@@ -133,6 +149,174 @@ def load_vocab(vocab_file):
   return vocab
 
 
+class Vocab(object):
+  """A vocabulary shared by the tokenizers.
+
+  There is a single token-to-id map plus a list indexed by id for the inverse
+  direction. The list holds references to the same string objects as the map,
+  so the inverse costs one pointer per entry rather than a second dict.
+  `Vocab` behaves like the read-only dict returned by `load_vocab`, so it can
+  be passed anywhere that dict was used.
+  """
+
+  def __init__(self, token_to_id):
+    """Constructs a Vocab.
+
+    Args:
+      token_to_id: Mapping from token to id, e.g. the result of `load_vocab`.
+        Insertion order is preserved by `keys()`.
+    """
+    self.token_to_id = token_to_id
+    num_ids = max(token_to_id.values()) + 1 if token_to_id else 0
+    self.id_to_token = [None] * num_ids
+    for (token, index) in token_to_id.items():
+      self.id_to_token[index] = token
+
+  @classmethod
+  def from_file(cls, vocab_file, snapshot_file=None):
+    """Loads a `Vocab` from a one-token-per-line vocabulary file.
+
+    Args:
+      vocab_file: Path to the vocabulary file.
+      snapshot_file: (optional) Path to a snapshot of `vocab_file` written by
+        `write_vocab_snapshot`. If given, the vocab is loaded from it instead
+        of parsing `vocab_file`, which is then only read to check that the
+        snapshot is not stale.
+    """
+    if snapshot_file:
+      return cls.from_snapshot(snapshot_file, vocab_file=vocab_file)
+    return cls(load_vocab(vocab_file))
+
+  @classmethod
+  def from_snapshot(cls, snapshot_file, vocab_file=None):
+    """Loads a `Vocab` from a file written by `write_vocab_snapshot`.
+
+    Local files are memory-mapped; other paths are read through `tf.gfile`.
+
+    Args:
+      snapshot_file: Path to the snapshot.
+      vocab_file: (optional) The vocabulary file the snapshot was compiled
+        from. If given, its checksum must match the one in the snapshot.
+
+    Raises:
+      ValueError: The file is not a snapshot, was written by an incompatible
+        version, or does not match `vocab_file`.
+    """
+    if "://" in snapshot_file:
+      with tf.gfile.GFile(snapshot_file, "rb") as reader:
+        (checksum, tokens) = _parse_vocab_snapshot(reader.read(),
+                                                   snapshot_file)
+    else:
+      with open(snapshot_file, "rb") as reader:
+        data = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+          (checksum, tokens) = _parse_vocab_snapshot(data, snapshot_file)
+        finally:
+          data.close()
+
+    if vocab_file is not None and checksum != _vocab_file_checksum(vocab_file):
+      raise ValueError(
+          "The vocab snapshot `%s` is stale: it was not compiled from the "
+          "current `%s`. Please re-run compile_vocab_snapshot.py." %
+          (snapshot_file, vocab_file))
+
+    # Later duplicates overwrite earlier ones, exactly like `load_vocab`.
+    return cls(collections.OrderedDict(zip(tokens, range(len(tokens)))))
+
+  def __len__(self):
+    return len(self.token_to_id)
+
+  def __contains__(self, token):
+    return token in self.token_to_id
+
+  def __getitem__(self, token):
+    return self.token_to_id[token]
+
+  def __iter__(self):
+    return iter(self.token_to_id)
+
+  def get(self, token, default=None):
+    return self.token_to_id.get(token, default)
+
+  def keys(self):
+    return self.token_to_id.keys()
+
+  def values(self):
+    return self.token_to_id.values()
+
+  def items(self):
+    return self.token_to_id.items()
+
+  def convert_tokens_to_ids(self, tokens):
+    return convert_by_vocab(self.token_to_id, tokens)
+
+  def convert_ids_to_tokens(self, ids):
+    """Maps ids to tokens, raising `KeyError` for ids that are not in use."""
+    tokens = []
+    for i in ids:
+      # A negative index would silently pick a token from the end.
+      if i < 0 or i >= len(self.id_to_token) or self.id_to_token[i] is None:
+        raise KeyError(i)
+      tokens.append(self.id_to_token[i])
+    return tokens
+
+
+# A vocab snapshot is the header below followed by the tokens in id order,
+# utf-8 encoded and joined by newlines (which `load_vocab` never keeps in a
+# token). The checksum is the SHA-256 of the source vocabulary file.
+_SNAPSHOT_MAGIC = b"BERTVOCB"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct("<8sII32sQ")
+
+
+def write_vocab_snapshot(vocab_file, snapshot_file):
+  """Compiles `vocab_file` into a binary snapshot for `Vocab.from_snapshot`."""
+  tokens = []
+  with tf.gfile.GFile(vocab_file, "r") as reader:
+    while True:
+      token = convert_to_unicode(reader.readline())
+      if not token:
+        break
+      tokens.append(token.strip())
+
+  blob = "\n".join(tokens).encode("utf-8")
+  header = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION,
+                                 len(tokens), _vocab_file_checksum(vocab_file),
+                                 len(blob))
+  with tf.gfile.GFile(snapshot_file, "wb") as writer:
+    writer.write(header)
+    writer.write(blob)
+
+
+def _vocab_file_checksum(vocab_file):
+  with tf.gfile.GFile(vocab_file, "rb") as reader:
+    return hashlib.sha256(reader.read()).digest()
+
+
+def _parse_vocab_snapshot(data, snapshot_file):
+  """Returns the (checksum, tokens) stored in a snapshot's bytes."""
+  if len(data) < _SNAPSHOT_HEADER.size:
+    raise ValueError("`%s` is not a vocab snapshot." % snapshot_file)
+  (magic, version, num_tokens, checksum, blob_size) = (
+      _SNAPSHOT_HEADER.unpack_from(data, 0))
+  if magic != _SNAPSHOT_MAGIC:
+    raise ValueError("`%s` is not a vocab snapshot." % snapshot_file)
+  if version != _SNAPSHOT_VERSION:
+    raise ValueError(
+        "The vocab snapshot `%s` has version %d but this code reads version "
+        "%d. Please re-run compile_vocab_snapshot.py." %
+        (snapshot_file, version, _SNAPSHOT_VERSION))
+
+  start = _SNAPSHOT_HEADER.size
+  blob = data[start:start + blob_size]
+  if len(blob) != blob_size:
+    raise ValueError("The vocab snapshot `%s` is truncated." % snapshot_file)
+  tokens = blob.decode("utf-8").split("\n") if num_tokens else []
+  if len(tokens) != num_tokens:
+    raise ValueError("The vocab snapshot `%s` is corrupt." % snapshot_file)
+  return (checksum, tokens)
+
+
 def convert_by_vocab(vocab, items):
   """Converts a sequence of [tokens|ids] using the vocab."""
   output = []
@@ -161,81 +345,462 @@ def whitespace_tokenize(text):
   return tokens
 
 
+EncodedBatch = collections.namedtuple(
+    "EncodedBatch", ["input_ids", "input_mask", "segment_ids", "lengths"])
+
+
+def _truncate_seq_pair(tokens_a, tokens_b, max_length):
+  """Truncates a sequence pair in place to the maximum length."""
+
+  # This is a simple heuristic which will always truncate the longer sequence
+  # one token at a time. This makes more sense than truncating an equal percent
+  # of tokens from each, since if one sequence is very short then each token
+  # that's truncated likely contains more information than a longer sequence.
+  while True:
+    total_length = len(tokens_a) + len(tokens_b)
+    if total_length <= max_length:
+      break
+    if len(tokens_a) > len(tokens_b):
+      tokens_a.pop()
+    else:
+      tokens_b.pop()
+
+
 class FullTokenizer(object):
   """Runs end-to-end tokenziation."""
 
-  def __init__(self, vocab_file, do_lower_case=True):
-    self.vocab = load_vocab(vocab_file)
-    self.inv_vocab = {v: k for k, v in self.vocab.items()}
-    self.basic_tokenizer = BasicTokenizer(vocab_file=vocab_file, do_lower_case=do_lower_case)
-    self.wordpiece_tokenizer = WordpieceTokenizer(vocab=self.vocab)
+  def __init__(self, vocab_file=None, do_lower_case=True, cache_size=0,
+               vocab=None, snapshot_file=None):
+    """Constructs a FullTokenizer.
+
+    Args:
+      vocab_file: Path to the vocabulary file. Ignored if `vocab` is given.
+      do_lower_case: Whether to lower case the input.
+      cache_size: If > 0, the number of words whose WordPiece output is kept
+        in an LRU cache.
+      vocab: (optional) An already loaded `Vocab`, e.g. one shared with other
+        tokenizers in the same process.
+      snapshot_file: (optional) A compiled snapshot of `vocab_file` to load
+        instead of parsing it. See `Vocab.from_file`.
+    """
+    if vocab is None:
+      if vocab_file is None and snapshot_file is None:
+        raise ValueError("One of `vocab_file` or `vocab` must be specified.")
+      if vocab_file is None:
+        vocab = Vocab.from_snapshot(snapshot_file)
+      else:
+        vocab = Vocab.from_file(vocab_file, snapshot_file=snapshot_file)
+    self.vocab = vocab
+    self.inv_vocab = vocab.id_to_token
+    self.basic_tokenizer = BasicTokenizer(
+        do_lower_case=do_lower_case, vocab=vocab)
+    self.wordpiece_tokenizer = WordpieceTokenizer(
+        vocab=vocab.token_to_id, cache_size=cache_size)
+
+  def tokenize(self, text, max_tokens=None):
+    """Tokenizes a piece of text into word pieces.
+
+    Args:
+      text: The text to tokenize.
+      max_tokens: (optional) int. If set, tokenization stops once this many
+        word pieces have been produced. The result is identical to
+        `tokenize(text)[:max_tokens]`.
+
+    Returns:
+      A list of word pieces.
+    """
+    if max_tokens is not None:
+      return list(itertools.islice(self.iter_tokenize(text), max_tokens))
 
-  def tokenize(self, text):
     split_tokens = []
     for token in self.basic_tokenizer.tokenize(text):
-      for sub_token in self.wordpiece_tokenizer.tokenize(token):
-        split_tokens.append(sub_token)
+      split_tokens.extend(self.wordpiece_tokenizer.tokenize_word(token))
 
     return split_tokens
 
+  def iter_tokenize(self, text):
+    """Lazily yields the word pieces of `tokenize(text)`.
+
+    Words are only run through the WordPiece search as the consumer asks for
+    them, so stopping early skips the rest of the text.
+    """
+    for token in self.basic_tokenizer.iter_tokenize(text):
+      for sub_token in self.wordpiece_tokenizer.tokenize_word(token):
+        yield sub_token
+
+  def tokenize_to_ids(self, text):
+    """Equivalent to `convert_tokens_to_ids(tokenize(text))`."""
+    split_ids = []
+    for token in self.basic_tokenizer.tokenize(text):
+      split_ids.extend(self.wordpiece_tokenizer.tokenize_word_to_ids(token))
+
+    return split_ids
+
+  def tokenize_with_offsets(self, text):
+    """Like `tokenize`, but also returns where each word piece came from.
+
+    Args:
+      text: The text to tokenize.
+
+    Returns:
+      A tuple (tokens, offsets). `tokens` is identical to `tokenize(text)`
+      and `offsets[i]` is the (start, end) character span of `tokens[i]` in
+      `convert_to_unicode(text)`. A piece that stands for a whole word (e.g.
+      `[UNK]`) spans the whole word.
+    """
+    split_tokens = []
+    offsets = []
+    for (token, start_map, end_map) in (
+        self.basic_tokenizer._tokenize_with_char_maps(text)):
+      for (sub_token, start, end) in (
+          self.wordpiece_tokenizer.tokenize_word_with_spans(token)):
+        split_tokens.append(sub_token)
+        offsets.append((start_map[start], end_map[end - 1]))
+
+    return (split_tokens, offsets)
+
   def convert_tokens_to_ids(self, tokens):
-    return convert_by_vocab(self.vocab, tokens)
+    return self.vocab.convert_tokens_to_ids(tokens)
 
   def convert_ids_to_tokens(self, ids):
-    return convert_by_vocab(self.inv_vocab, ids)
+    return self.vocab.convert_ids_to_tokens(ids)
+
+  def encode_batch(self, texts, text_pairs=None, max_seq_length=128):
+    """Tokenizes a batch of texts straight into padded model inputs.
+
+    Each row is laid out as `[CLS] a [SEP]` or `[CLS] a [SEP] b [SEP]`, with
+    the same truncation as `run_classifier.convert_single_example`: single
+    sequences keep their first `max_seq_length - 2` pieces and pairs are
+    shortened one piece at a time from the longer side.
+
+    Args:
+      texts: List of strings, the first sequence of every row.
+      text_pairs: (optional) List of strings (or None entries) of the same
+        length as `texts`, the second sequence of every row.
+      max_seq_length: int. Width of the returned arrays.
+
+    Returns:
+      An `EncodedBatch` of int32 arrays. `input_ids`, `input_mask` and
+      `segment_ids` have shape [len(texts), max_seq_length] and are zero
+      padded; `lengths` has shape [len(texts)] and holds the number of real
+      tokens in each row.
+    """
+    if text_pairs is not None and len(text_pairs) != len(texts):
+      raise ValueError("`text_pairs` has %d entries but `texts` has %d" %
+                       (len(text_pairs), len(texts)))
+
+    num_rows = len(texts)
+    input_ids = np.zeros([num_rows, max_seq_length], dtype=np.int32)
+    input_mask = np.zeros([num_rows, max_seq_length], dtype=np.int32)
+    segment_ids = np.zeros([num_rows, max_seq_length], dtype=np.int32)
+    lengths = np.zeros([num_rows], dtype=np.int32)
+
+    cls_id = self.vocab["[CLS]"]
+    sep_id = self.vocab["[SEP]"]
+    for (i, text) in enumerate(texts):
+      ids_a = list(self.tokenize_to_ids(text))
+      ids_b = None
+      if text_pairs is not None and text_pairs[i]:
+        ids_b = list(self.tokenize_to_ids(text_pairs[i]))
+
+      if ids_b:
+        # Account for [CLS], [SEP], [SEP] with "- 3"
+        _truncate_seq_pair(ids_a, ids_b, max_seq_length - 3)
+      else:
+        # Account for [CLS] and [SEP] with "- 2"
+        del ids_a[max_seq_length - 2:]
+
+      row = [cls_id] + ids_a + [sep_id]
+      first_length = len(row)
+      if ids_b:
+        row.extend(ids_b)
+        row.append(sep_id)
+
+      length = len(row)
+      input_ids[i, :length] = row
+      input_mask[i, :length] = 1
+      segment_ids[i, first_length:length] = 1
+      lengths[i] = length
+
+    return EncodedBatch(
+        input_ids=input_ids,
+        input_mask=input_mask,
+        segment_ids=segment_ids,
+        lengths=lengths)
+
+  def get_cache_stats(self):
+    """Returns the word cache counters, or None if caching is disabled."""
+    cache = self.wordpiece_tokenizer.cache
+    if cache is None:
+      return None
+    return cache.get_stats()
+
+
+class WordpieceCache(object):
+  """Size-bounded LRU map from a basic token to its wordpiece output.
+
+  Natural text is Zipfian, so a small cache absorbs most of the wordpiece
+  searches. `hits`, `misses` and `evictions` are kept so the cache can be
+  sized from real conversion runs.
+  """
+
+  def __init__(self, max_size):
+    if max_size <= 0:
+      raise ValueError("`max_size` must be positive, got %d" % max_size)
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entries = collections.OrderedDict()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key):
+    """Returns the cached value for `key` (or None) and updates its recency."""
+    value = self._entries.pop(key, None)
+    if value is None:
+      self.misses += 1
+      return None
+    self._entries[key] = value
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    if key in self._entries:
+      del self._entries[key]
+    elif len(self._entries) >= self.max_size:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+    self._entries[key] = value
+
+  def get_stats(self):
+    lookups = self.hits + self.misses
+    return {
+        "size": len(self._entries),
+        "max_size": self.max_size,
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+    }
 
 
 class BasicTokenizer(object):
   """Runs basic tokenization (punctuation splitting, lower casing, etc.)."""
 
-  def __init__(self, vocab_file, do_lower_case=True):
+  def __init__(self, vocab_file=None, do_lower_case=True, vocab=None):
     """Constructs a BasicTokenizer.
 
     Args:
+      vocab_file: (optional) Path to the vocabulary file, needed only for
+        `convert_tokens_to_ids` and `convert_ids_to_tokens`. Ignored if
+        `vocab` is given.
       do_lower_case: Whether to lower case the input.
+      vocab: (optional) An already loaded `Vocab`.
     """
     self.do_lower_case = do_lower_case
-    self.vocab = load_vocab(vocab_file)
-    self.inv_vocab = {v: k for k, v in self.vocab.items()}
+    if vocab is None and vocab_file is not None:
+      vocab = Vocab.from_file(vocab_file)
+    self.vocab = vocab
 
-  def tokenize(self, text):
-    """Tokenizes a piece of text."""
+  def tokenize(self, text, max_tokens=None):
+    """Tokenizes a piece of text.
+
+    Args:
+      text: The text to tokenize.
+      max_tokens: (optional) int. If set, only the first `max_tokens` tokens
+        are produced. The result is identical to `tokenize(text)[:max_tokens]`.
+
+    Returns:
+      A list of tokens.
+    """
+    text = convert_to_unicode(text)
+    if _is_ascii(text):
+      output_tokens = self._tokenize_ascii(text)
+      if max_tokens is not None:
+        del output_tokens[max_tokens:]
+      return output_tokens
+
+    return list(itertools.islice(self._iter_tokenize_unicode(text), max_tokens))
+
+  def iter_tokenize(self, text):
+    """Returns an iterator over the tokens of `tokenize(text)`.
+
+    Non-ASCII text is tokenized lazily as the iterator is consumed. ASCII text
+    goes through the `str.split` fast path up front, which is cheaper than
+    stopping early.
+    """
     text = convert_to_unicode(text)
-    text = self._clean_text(text)
+    if _is_ascii(text):
+      return iter(self._tokenize_ascii(text))
+    return self._iter_tokenize_unicode(text)
 
+  def _iter_tokenize_unicode(self, text):
     # This was added on November 1st, 2018 for the multilingual and Chinese
     # models. This is also applied to the English models now, but it doesn't
     # matter since the English models were not trained on any Chinese data
     # and generally don't have any Chinese data in them (there are Chinese
     # characters in the vocabulary because Wikipedia does have some Chinese
     # words in the English Wikipedia.).
-    text = self._tokenize_chinese_chars(text)
-
-    orig_tokens = whitespace_tokenize(text)
-    split_tokens = []
-    for token in orig_tokens:
-      if self.do_lower_case:
-        token = token.lower()
-        token = self._run_strip_accents(token)
-      split_tokens.append(token)
+    for token in self._iter_clean_and_split_text(text):
+      if not self.do_lower_case:
+        yield token
+        continue
+      token = token.lower()
+      if _is_ascii(token):
+        yield token
+      else:
+        # Stripping accents can leave nothing behind (e.g. a lone combining
+        # mark), in which case the token is dropped.
+        for sub_token in whitespace_tokenize(self._run_strip_accents(token)):
+          yield sub_token
       # split_tokens.extend(self._run_split_on_punc(token))
 
-    output_tokens = whitespace_tokenize(" ".join(split_tokens))
-    return output_tokens
+  def _tokenize_ascii(self, text):
+    """Fast path of `tokenize` for pure ASCII text.
+
+    ASCII has no CJK characters or combining marks, so cleaning reduces to
+    deleting control characters and accent stripping is a no-op.
+    """
+    text = text.translate(_ASCII_CONTROL_CHARS)
+    if self.do_lower_case:
+      text = text.lower()
+    return text.split()
+
+  def _iter_clean_and_split_text(self, text):
+    """Runs `_clean_text`, `_tokenize_chinese_chars` and `whitespace_tokenize`.
+
+    This is done in a single pass over the text using the character class
+    table rather than three passes that each build a new string. Tokens are
+    yielded as soon as they are complete.
+    """
+    current = []
+    for char in text:
+      cp = ord(char)
+      if cp < 0x10000:
+        char_class = _BMP_CHAR_CLASSES[cp]
+      else:
+        char_class = _get_astral_char_class(cp)
+      if not char_class & (_CHAR_DROP | _CHAR_SPLIT | _CHAR_CHINESE):
+        current.append(char)
+      elif char_class & _CHAR_DROP:
+        continue
+      else:
+        if current:
+          yield "".join(current)
+          current = []
+        if char_class & _CHAR_CHINESE:
+          yield char
+    if current:
+      yield "".join(current)
+
+  def tokenize_with_offsets(self, text):
+    """Like `tokenize`, but also returns where each token came from.
+
+    Args:
+      text: The text to tokenize.
+
+    Returns:
+      A tuple (tokens, offsets). `tokens` is identical to `tokenize(text)`
+      and `offsets[i]` is the (start, end) character span of `tokens[i]` in
+      `convert_to_unicode(text)`, so `text[start:end]` is the original,
+      un-normalized form of the token.
+    """
+    tokens = []
+    offsets = []
+    for (token, start_map, end_map) in self._tokenize_with_char_maps(text):
+      tokens.append(token)
+      offsets.append((start_map[0], end_map[-1]))
+    return (tokens, offsets)
+
+  def _tokenize_with_char_maps(self, text):
+    """Tokenizes `text`, mapping every output character back to the input.
+
+    Returns:
+      A list of (token, start_map, end_map) tuples where `token[j]` was
+      produced by the input characters `text[start_map[j]:end_map[j]]`.
+    """
+    text = convert_to_unicode(text)
+    output = []
+    for (token, char_indices) in self._clean_and_split_text_with_indices(text):
+      start_map = char_indices
+      end_map = [i + 1 for i in char_indices]
+      if not self.do_lower_case:
+        output.append((token, start_map, end_map))
+        continue
+
+      normalized = token.lower()
+      if not _is_ascii(token):
+        if not _is_ascii(normalized):
+          normalized = self._run_strip_accents(normalized)
+        (start_map, end_map) = self._map_normalized_chars(
+            token, normalized, char_indices)
+
+      # Stripping accents can leave nothing behind (e.g. a lone combining
+      # mark), in which case the token is dropped.
+      for m in _NON_WHITESPACE_RE.finditer(normalized):
+        output.append((m.group(), start_map[m.start():m.end()],
+                       end_map[m.start():m.end()]))
+    return output
+
+  def _map_normalized_chars(self, token, normalized, char_indices):
+    """Maps each character of the lower cased, accent stripped `token`."""
+    start_map = []
+    end_map = []
+    pieces = []
+    for (char, index) in zip(token, char_indices):
+      piece = self._run_strip_accents(char.lower())
+      pieces.append(piece)
+      start_map.extend([index] * len(piece))
+      end_map.extend([index + 1] * len(piece))
+    if "".join(pieces) != normalized:
+      # Normalizing character by character doesn't always match normalizing
+      # the whole token (e.g. the final sigma rule of `lower()`). In that case
+      # every character is attributed to the whole token.
+      start_map = [char_indices[0]] * len(normalized)
+      end_map = [char_indices[-1] + 1] * len(normalized)
+    return (start_map, end_map)
+
+  def _clean_and_split_text_with_indices(self, text):
+    """Like `_iter_clean_and_split_text`, but keeps each character's index."""
+    output = []
+    current = []
+    current_indices = []
+    for (index, char) in enumerate(text):
+      char_class = _get_char_class(char)
+      if not char_class & (_CHAR_DROP | _CHAR_SPLIT | _CHAR_CHINESE):
+        current.append(char)
+        current_indices.append(index)
+      elif char_class & _CHAR_DROP:
+        continue
+      else:
+        if current:
+          output.append(("".join(current), current_indices))
+          current = []
+          current_indices = []
+        if char_class & _CHAR_CHINESE:
+          output.append((char, [index]))
+    if current:
+      output.append(("".join(current), current_indices))
+    return output
 
   def convert_tokens_to_ids(self, tokens):
-    return convert_by_vocab(self.vocab, tokens)
+    if self.vocab is None:
+      raise ValueError("BasicTokenizer was constructed without a vocab.")
+    return self.vocab.convert_tokens_to_ids(tokens)
 
   def convert_ids_to_tokens(self, ids):
-    return convert_by_vocab(self.inv_vocab, ids)
+    if self.vocab is None:
+      raise ValueError("BasicTokenizer was constructed without a vocab.")
+    return self.vocab.convert_ids_to_tokens(ids)
 
   def _run_strip_accents(self, text):
     """Strips accents from a piece of text."""
     text = unicodedata.normalize("NFD", text)
     output = []
     for char in text:
-      cat = unicodedata.category(char)
-      if cat == "Mn":
+      if _get_char_class(char) & _CHAR_MARK:
         continue
       output.append(char)
     return "".join(output)
@@ -275,34 +840,18 @@ class BasicTokenizer(object):
 
   def _is_chinese_char(self, cp):
     """Checks whether CP is the codepoint of a CJK character."""
-    # This defines a "chinese character" as anything in the CJK Unicode block:
-    #   https://en.wikipedia.org/wiki/CJK_Unified_Ideographs_(Unicode_block)
-    #
-    # Note that the CJK Unicode block is NOT all Japanese and Korean characters,
-    # despite its name. The modern Korean Hangul alphabet is a different block,
-    # as is Japanese Hiragana and Katakana. Those alphabets are used to write
-    # space-separated words, so they are not treated specially and handled
-    # like the all of the other languages.
-    if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
-        (cp >= 0x3400 and cp <= 0x4DBF) or  #
-        (cp >= 0x20000 and cp <= 0x2A6DF) or  #
-        (cp >= 0x2A700 and cp <= 0x2B73F) or  #
-        (cp >= 0x2B740 and cp <= 0x2B81F) or  #
-        (cp >= 0x2B820 and cp <= 0x2CEAF) or
-        (cp >= 0xF900 and cp <= 0xFAFF) or  #
-        (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
-      return True
-
-    return False
+    if cp < 0x10000:
+      return (_BMP_CHAR_CLASSES[cp] & _CHAR_CHINESE) != 0
+    return (_get_astral_char_class(cp) & _CHAR_CHINESE) != 0
 
   def _clean_text(self, text):
     """Performs invalid character removal and whitespace cleanup on text."""
     output = []
     for char in text:
-      cp = ord(char)
-      if cp == 0 or cp == 0xfffd or _is_control(char):
+      char_class = _get_char_class(char)
+      if char_class & _CHAR_DROP:
         continue
-      if _is_whitespace(char):
+      if char_class & _CHAR_WHITESPACE:
         output.append(" ")
       else:
         output.append(char)
@@ -312,10 +861,15 @@ class BasicTokenizer(object):
 class WordpieceTokenizer(object):
   """Runs WordPiece tokenziation."""
 
-  def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=200):
+  def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=200,
+               cache_size=0):
     self.vocab = vocab
     self.unk_token = unk_token
     self.max_input_chars_per_word = max_input_chars_per_word
+    (self.word_start_trie, self.suffix_trie) = build_wordpiece_tries(vocab)
+    self.cache = None
+    if cache_size > 0:
+      self.cache = WordpieceCache(cache_size)
 
   def tokenize(self, text):
     """Tokenizes a piece of text into its word pieces.
@@ -339,73 +893,574 @@ class WordpieceTokenizer(object):
 
     output_tokens = []
     for token in whitespace_tokenize(text):
-      chars = list(token)
-      if len(chars) > self.max_input_chars_per_word:
-        output_tokens.append(self.unk_token)
+      output_tokens.extend(self.tokenize_word(token))
+    return output_tokens
+
+  def tokenize_word(self, token):
+    """Returns the word pieces of a single whitespace-free token."""
+    if self.cache is None:
+      return self._tokenize_word(token)
+    return self._get_cache_entry(token)[0]
+
+  def tokenize_word_with_spans(self, token):
+    """Returns (piece, start, end) triples locating each piece in `token`."""
+    sub_tokens = self.tokenize_word(token)
+    spans = []
+    start = 0
+    for sub_token in sub_tokens:
+      end = start + len(sub_token)
+      if start > 0:
+        end -= 2
+      spans.append((sub_token, start, end))
+      start = end
+    if start != len(token):
+      # The word didn't split into vocab pieces, so the pieces (i.e. the
+      # unknown token) stand for all of it.
+      return [(sub_token, 0, len(token)) for sub_token in sub_tokens]
+    return spans
+
+  def tokenize_word_to_ids(self, token):
+    """Returns the vocab ids of the word pieces of a single token."""
+    if self.cache is None:
+      return convert_by_vocab(self.vocab, self._tokenize_word(token))
+    entry = self._get_cache_entry(token)
+    if entry[1] is None:
+      entry[1] = tuple(convert_by_vocab(self.vocab, entry[0]))
+    return entry[1]
+
+  def _get_cache_entry(self, token):
+    # Entries are [pieces, ids]; the ids are only filled in on first request
+    # and both are stored as tuples so callers can't mutate the cache.
+    entry = self.cache.get(token)
+    if entry is None:
+      entry = [tuple(self._tokenize_word(token)), None]
+      self.cache.put(token, entry)
+    return entry
+
+  def _tokenize_word(self, token):
+    """Runs the greedy longest-match-first search over a single word.
+
+    Rather than probing the vocab with every candidate substring, this walks
+    the trie once from each piece start and remembers the last node that
+    ended a vocab entry, which is the longest match.
+    """
+    num_chars = len(token)
+    if num_chars > self.max_input_chars_per_word:
+      return [self.unk_token]
+
+    sub_tokens = []
+    start = 0
+    root = self.word_start_trie
+    while start < num_chars:
+      node = root
+      cur_substr = None
+      end = start
+      pos = start
+      while pos < num_chars:
+        node = node.get(token[pos])
+        if node is None:
+          break
+        pos += 1
+        if _TRIE_END in node:
+          cur_substr = node[_TRIE_END]
+          end = pos
+      if cur_substr is None:
+        return [self.unk_token]
+      sub_tokens.append(cur_substr)
+      start = end
+      root = self.suffix_trie
+    return sub_tokens
+
+
+_NON_WHITESPACE_RE = re.compile(r"\S+", re.UNICODE)
+
+# Key under which a trie node stores the vocab entry that ends at that node.
+# Trie edges are always single characters, so the empty string never collides.
+_TRIE_END = ""
+
+
+def build_wordpiece_tries(vocab):
+  """Builds the prefix tries used by `WordpieceTokenizer`.
+
+  Args:
+    vocab: An iterable of vocab entries (e.g. the dict from `load_vocab`).
+
+  Returns:
+    A tuple (word_start_trie, suffix_trie) of nested dicts keyed by character.
+    `word_start_trie` holds every vocab entry verbatim and is used for the
+    first piece of a word. `suffix_trie` holds the "##" continuation entries
+    with the prefix removed and is used for every following piece.
+  """
+  word_start_trie = {}
+  suffix_trie = {}
+  # The tries are a large number of small, acyclic dicts. Letting the garbage
+  # collector rescan them while they are allocated only slows the build down,
+  # so it is paused here.
+  gc_was_enabled = gc.isenabled()
+  gc.disable()
+  try:
+    for token in vocab:
+      if not token:
         continue
+      _insert_into_trie(word_start_trie, token, token)
+      if token.startswith("##") and len(token) > 2:
+        _insert_into_trie(suffix_trie, token[2:], token)
+  finally:
+    if gc_was_enabled:
+      gc.enable()
+  return (word_start_trie, suffix_trie)
+
+
+def _insert_into_trie(trie, key, value):
+  node = trie
+  for char in key:
+    child = node.get(char)
+    if child is None:
+      child = {}
+      node[char] = child
+    node = child
+  node[_TRIE_END] = value
+
+
+class ParallelTokenizer(object):
+  """Tokenizes lines to ids across a pool of worker processes.
+
+  The vocab is loaded once in the parent, so a bad `vocab_file` raises here
+  instead of leaving the pool respawning workers that fail to start. Each
+  worker receives it once, when the pool starts, so it is never pickled per
+  task. Workers hand their ids back through
+  shared memory blocks rather than as pickled lists, and the parent only
+  copies each block once into the final arrays.
+
+  Example usage:
+
+  ```python
+  with tokenization.ParallelTokenizer(vocab_file, num_workers=8) as tokenizer:
+    (ids, offsets) = tokenizer.tokenize_to_ids(lines)
+  # The ids of `lines[i]` are `ids[offsets[i]:offsets[i + 1]]`.
+  ```
+  """
+
+  def __init__(self, vocab_file, do_lower_case=True, num_workers=None,
+               cache_size=0):
+    if shared_memory is None:
+      raise ValueError("ParallelTokenizer requires Python 3.8 or newer.")
+    if num_workers is None:
+      num_workers = multiprocessing.cpu_count()
+    self.num_workers = num_workers
+    vocab = Vocab.from_file(vocab_file)
+    # Start the resource tracker before forking so that the workers, which
+    # create the shared memory blocks, and the parent, which unlinks them,
+    # report to the same tracker.
+    resource_tracker.ensure_running()
+    self._pool = multiprocessing.Pool(
+        processes=num_workers,
+        initializer=_init_parallel_worker,
+        initargs=(vocab, do_lower_case, cache_size))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    self._pool.close()
+    self._pool.join()
+
+  def tokenize_to_ids(self, lines, chunk_size=1000):
+    """Tokenizes `lines` with `FullTokenizer.tokenize_to_ids` in parallel.
+
+    Args:
+      lines: List of strings.
+      chunk_size: int. Number of lines sent to a worker per task.
+
+    Returns:
+      A tuple (ids, offsets). `ids` is a flat int32 array holding the ids of
+      every line back to back and `offsets` is an int64 array of length
+      `len(lines) + 1` such that line `i` maps to `ids[offsets[i]:offsets[i+1]]`.
+    """
+    shards = [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+    blocks = self._pool.map(_tokenize_shard_to_shared_memory, shards)
+
+    total_ids = sum(num_ids for (_, _, num_ids) in blocks)
+    ids = np.zeros([total_ids], dtype=np.int32)
+    offsets = np.zeros([len(lines) + 1], dtype=np.int64)
+    line_start = 0
+    id_start = 0
+    num_consumed = 0
+    try:
+      for (name, num_lines, num_ids) in blocks:
+        num_consumed += 1
+        block = shared_memory.SharedMemory(name=name)
+        try:
+          (block_offsets, block_ids) = _view_shard_block(
+              block.buf, num_lines, num_ids)
+          ids[id_start:id_start + num_ids] = block_ids
+          offsets[line_start + 1:line_start + num_lines + 1] = (
+              block_offsets[1:] + id_start)
+          del block_offsets, block_ids
+        finally:
+          block.close()
+          block.unlink()
+        line_start += num_lines
+        id_start += num_ids
+    finally:
+      # Don't leak the blocks we never got to if one of the copies failed.
+      for (name, _, _) in blocks[num_consumed:]:
+        _unlink_shared_memory(name)
+    return (ids, offsets)
+
+
+_PARALLEL_WORKER_TOKENIZER = None
+
+
+def _init_parallel_worker(vocab, do_lower_case, cache_size):
+  global _PARALLEL_WORKER_TOKENIZER
+  _PARALLEL_WORKER_TOKENIZER = FullTokenizer(
+      vocab=vocab, do_lower_case=do_lower_case, cache_size=cache_size)
+
+
+def _view_shard_block(buf, num_lines, num_ids):
+  """Returns (offsets, ids) views over a shard's shared memory block."""
+  # The int64 offsets go first so that both arrays are naturally aligned.
+  offsets = np.ndarray([num_lines + 1], dtype=np.int64, buffer=buf)
+  ids = np.ndarray([num_ids], dtype=np.int32, buffer=buf,
+                   offset=offsets.nbytes)
+  return (offsets, ids)
+
+
+def _tokenize_shard_to_shared_memory(lines):
+  """Worker side of `ParallelTokenizer.tokenize_to_ids`."""
+  tokenizer = _PARALLEL_WORKER_TOKENIZER
+  offsets = [0]
+  ids = []
+  for line in lines:
+    ids.extend(tokenizer.tokenize_to_ids(line))
+    offsets.append(len(ids))
+
+  size = 8 * len(offsets) + 4 * len(ids)
+  block = shared_memory.SharedMemory(create=True, size=size)
+  (block_offsets, block_ids) = _view_shard_block(block.buf, len(lines),
+                                                 len(ids))
+  block_offsets[:] = offsets
+  block_ids[:] = ids
+  del block_offsets, block_ids
+  block.close()
+  return (block.name, len(lines), len(ids))
+
+
+def _unlink_shared_memory(name):
+  try:
+    block = shared_memory.SharedMemory(name=name)
+  except OSError:
+    return
+  block.close()
+  block.unlink()
+
 
-      is_bad = False
-      start = 0
-      sub_tokens = []
-      while start < len(chars):
-        end = len(chars)
-        cur_substr = None
-        while start < end:
-          substr = "".join(chars[start:end])
-          if start > 0:
-            substr = "##" + substr
-          if substr in self.vocab:
-            cur_substr = substr
+class TokenIdShardWriter(object):
+  """Streams tokenized documents into compact shards of token ids.
+
+  Each shard is a pair of files:
+
+    * `<prefix>-NNNNN.ids`: the ids of every line back to back, as a raw
+      little-endian uint16 array if every id fits, int32 otherwise.
+    * `<prefix>-NNNNN.ids.index.npz`: `line_offsets` (int64, one more than
+      the number of lines) such that line `i` is
+      `ids[line_offsets[i]:line_offsets[i + 1]]`, `doc_offsets` (int64) which
+      does the same for documents over lines, and the `vocab_size`.
+
+  Documents never straddle shards. A new shard is started once the current
+  one holds at least `max_tokens_per_shard` ids. Ids are flushed to disk every
+  `flush_size` ids, so memory use does not grow with the input.
+  """
+
+  def __init__(self, output_prefix, vocab_size, max_tokens_per_shard=1 << 28,
+               flush_size=1 << 20):
+    self.output_prefix = output_prefix
+    self.vocab_size = vocab_size
+    self.dtype = _get_token_id_dtype(vocab_size)
+    self.max_tokens_per_shard = max_tokens_per_shard
+    self.flush_size = flush_size
+    self.shard_files = []
+
+    self._writer = None
+    self._pending_ids = array.array("i")
+    self._line_offsets = None
+    self._doc_offsets = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def add_line(self, ids):
+    """Appends the ids of one line to the current document.
+
+    Lines without ids are dropped.
+    """
+    if not ids:
+      return
+    if self._writer is None:
+      self._open_shard()
+    self._pending_ids.extend(ids)
+    self._line_offsets.append(self._line_offsets[-1] + len(ids))
+    if len(self._pending_ids) >= self.flush_size:
+      self._flush()
+
+  def end_document(self):
+    """Ends the current document. Empty documents are dropped."""
+    if self._writer is None:
+      return
+    num_lines = len(self._line_offsets) - 1
+    if self._doc_offsets[-1] == num_lines:
+      return
+    self._doc_offsets.append(num_lines)
+    if self._line_offsets[-1] >= self.max_tokens_per_shard:
+      self._close_shard()
+
+  def close(self):
+    """Ends the current document and closes the current shard."""
+    self.end_document()
+    if self._writer is not None:
+      self._close_shard()
+
+  def _open_shard(self):
+    shard_file = "%s-%05d.ids" % (self.output_prefix, len(self.shard_files))
+    self.shard_files.append(shard_file)
+    self._writer = tf.gfile.GFile(shard_file, "wb")
+    self._line_offsets = array.array("q", [0])
+    self._doc_offsets = array.array("q", [0])
+
+  def _flush(self):
+    ids = np.frombuffer(self._pending_ids, dtype=np.int32)
+    self._writer.write(ids.astype(self.dtype).tobytes())
+    del ids
+    self._pending_ids = array.array("i")
+
+  def _close_shard(self):
+    self._flush()
+    self._writer.close()
+    self._writer = None
+    # `np.savez` seeks in its output, which a write-mode `GFile` does not
+    # support, so the index is built in memory first.
+    buf = six.BytesIO()
+    np.savez(
+        buf,
+        line_offsets=np.frombuffer(self._line_offsets, dtype=np.int64),
+        doc_offsets=np.frombuffer(self._doc_offsets, dtype=np.int64),
+        vocab_size=np.int64(self.vocab_size))
+    with tf.gfile.GFile(self.shard_files[-1] + ".index.npz", "wb") as writer:
+      writer.write(buf.getvalue())
+
+
+class TokenIdShard(object):
+  """A shard written by `TokenIdShardWriter`.
+
+  Local shards are memory-mapped, so opening one does not read its ids.
+  """
+
+  def __init__(self, shard_file):
+    with tf.gfile.GFile(shard_file + ".index.npz", "rb") as reader:
+      index = np.load(six.BytesIO(reader.read()))
+      self.line_offsets = index["line_offsets"]
+      self.doc_offsets = index["doc_offsets"]
+      self.vocab_size = int(index["vocab_size"])
+
+    dtype = _get_token_id_dtype(self.vocab_size)
+    if "://" in shard_file:
+      with tf.gfile.GFile(shard_file, "rb") as reader:
+        self.ids = np.frombuffer(reader.read(), dtype=dtype)
+    elif self.line_offsets[-1] == 0:
+      self.ids = np.zeros([0], dtype=dtype)
+    else:
+      self.ids = np.memmap(shard_file, dtype=dtype, mode="r")
+    if len(self.ids) != self.line_offsets[-1]:
+      raise ValueError("The ids of `%s` do not match its index." % shard_file)
+
+  @property
+  def num_lines(self):
+    return len(self.line_offsets) - 1
+
+  @property
+  def num_documents(self):
+    return len(self.doc_offsets) - 1
+
+  def get_line(self, line_index):
+    """Returns the ids of a line as an array view."""
+    return self.ids[self.line_offsets[line_index]:
+                    self.line_offsets[line_index + 1]]
+
+  def get_document(self, doc_index):
+    """Returns the ids of every line of a document as a list of arrays."""
+    return [
+        self.get_line(i) for i in range(self.doc_offsets[doc_index],
+                                        self.doc_offsets[doc_index + 1])
+    ]
+
+
+def write_token_id_shards(input_files, tokenizer, output_prefix,
+                          max_tokens_per_shard=1 << 28):
+  """Tokenizes text files to ids and writes them with `TokenIdShardWriter`.
+
+  The input uses the `create_pretraining_data.py` format: one sentence per
+  line, with blank lines between documents. As there, a document that is not
+  followed by a blank line continues into the next file. Files are read line
+  by line, so they are never held in memory as a whole.
+
+  Args:
+    input_files: List of text file paths.
+    tokenizer: A `FullTokenizer`.
+    output_prefix: Prefix of the shard files.
+    max_tokens_per_shard: Approximate number of ids per shard.
+
+  Returns:
+    The list of shard files written.
+  """
+  with TokenIdShardWriter(output_prefix, len(tokenizer.vocab),
+                          max_tokens_per_shard=max_tokens_per_shard) as writer:
+    for input_file in input_files:
+      with tf.gfile.GFile(input_file, "r") as reader:
+        while True:
+          line = convert_to_unicode(reader.readline())
+          if not line:
             break
-          end -= 1
-        if cur_substr is None:
-          is_bad = True
-          break
-        sub_tokens.append(cur_substr)
-        start = end
+          line = line.strip()
+          if not line:
+            writer.end_document()
+          else:
+            writer.add_line(tokenizer.tokenize_to_ids(line))
+  return writer.shard_files
 
-      if is_bad:
-        output_tokens.append(self.unk_token)
-      else:
-        output_tokens.extend(sub_tokens)
-    return output_tokens
+
+def _get_token_id_dtype(vocab_size):
+  if vocab_size <= np.iinfo(np.uint16).max + 1:
+    return np.dtype("<u2")
+  return np.dtype("<i4")
 
 
 def _is_whitespace(char):
   """Checks whether `chars` is a whitespace character."""
-  # \t, \n, and \r are technically contorl characters but we treat them
-  # as whitespace since they are generally considered as such.
-  if char == " " or char == "\t" or char == "\n" or char == "\r":
-    return True
-  cat = unicodedata.category(char)
-  if cat == "Zs":
-    return True
-  return False
+  return (_get_char_class(char) & _CHAR_WHITESPACE) != 0
 
 
 def _is_control(char):
   """Checks whether `chars` is a control character."""
-  # These are technically control characters but we count them as whitespace
-  # characters.
-  if char == "\t" or char == "\n" or char == "\r":
-    return False
-  cat = unicodedata.category(char)
-  if cat in ("Cc", "Cf"):
-    return True
-  return False
+  return (_get_char_class(char) & _CHAR_CONTROL) != 0
 
 
 def _is_punctuation(char):
   """Checks whether `chars` is a punctuation character."""
+  return (_get_char_class(char) & _CHAR_PUNCTUATION) != 0
+
+
+def _is_ascii(text):
+  """Checks whether every character of `text` is 7-bit ASCII."""
+  return not text or max(text) < u"\x80"
+
+
+# Bit flags describing how the tokenizers treat a character.
+_CHAR_WHITESPACE = 0x01
+_CHAR_CONTROL = 0x02
+_CHAR_PUNCTUATION = 0x04
+_CHAR_CHINESE = 0x08
+# Nonspacing mark, removed when stripping accents.
+_CHAR_MARK = 0x10
+# Removed by `BasicTokenizer._clean_text`.
+_CHAR_DROP = 0x20
+# Separates tokens once the text has been cleaned. This is `_CHAR_WHITESPACE`
+# plus the few characters (e.g. U+2028) that survive cleaning and that
+# `str.split()` still treats as whitespace.
+_CHAR_SPLIT = 0x40
+
+
+def _is_cjk_codepoint(cp):
+  """Checks whether CP is in one of the CJK Unicode blocks."""
+  # This defines a "chinese character" as anything in the CJK Unicode block:
+  #   https://en.wikipedia.org/wiki/CJK_Unified_Ideographs_(Unicode_block)
+  #
+  # Note that the CJK Unicode block is NOT all Japanese and Korean characters,
+  # despite its name. The modern Korean Hangul alphabet is a different block,
+  # as is Japanese Hiragana and Katakana. Those alphabets are used to write
+  # space-separated words, so they are not treated specially and handled
+  # like the all of the other languages.
+  if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
+      (cp >= 0x3400 and cp <= 0x4DBF) or  #
+      (cp >= 0x20000 and cp <= 0x2A6DF) or  #
+      (cp >= 0x2A700 and cp <= 0x2B73F) or  #
+      (cp >= 0x2B740 and cp <= 0x2B81F) or  #
+      (cp >= 0x2B820 and cp <= 0x2CEAF) or
+      (cp >= 0xF900 and cp <= 0xFAFF) or  #
+      (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
+    return True
+
+  return False
+
+
+def _classify_char(char):
+  """Computes the `_CHAR_*` flags of a single character."""
   cp = ord(char)
+  cat = unicodedata.category(char)
+  char_class = 0
+
+  # \t, \n, and \r are technically contorl characters but we treat them
+  # as whitespace since they are generally considered as such.
+  if char == " " or char == "\t" or char == "\n" or char == "\r":
+    char_class |= _CHAR_WHITESPACE
+  elif cat == "Zs":
+    char_class |= _CHAR_WHITESPACE
+  elif cat in ("Cc", "Cf"):
+    char_class |= _CHAR_CONTROL
+
   # We treat all non-letter/number ASCII as punctuation.
   # Characters such as "^", "$", and "`" are not in the Unicode
   # Punctuation class but we treat them as punctuation anyways, for
   # consistency.
   if ((cp >= 33 and cp <= 47) or (cp >= 58 and cp <= 64) or
       (cp >= 91 and cp <= 96) or (cp >= 123 and cp <= 126)):
-    return True
-  cat = unicodedata.category(char)
-  if cat.startswith("P"):
-    return True
-  return False
+    char_class |= _CHAR_PUNCTUATION
+  elif cat.startswith("P"):
+    char_class |= _CHAR_PUNCTUATION
+
+  if _is_cjk_codepoint(cp):
+    char_class |= _CHAR_CHINESE
+
+  if cat == "Mn":
+    char_class |= _CHAR_MARK
+
+  if cp == 0 or cp == 0xfffd or char_class & _CHAR_CONTROL:
+    char_class |= _CHAR_DROP
+  elif char_class & _CHAR_WHITESPACE or char.isspace():
+    char_class |= _CHAR_SPLIT
+
+  return char_class
+
+
+def _get_char_class(char):
+  cp = ord(char)
+  if cp < 0x10000:
+    return _BMP_CHAR_CLASSES[cp]
+  return _get_astral_char_class(cp)
+
+
+def _get_astral_char_class(cp):
+  """Looks up (and memoizes) the flags of a codepoint outside the BMP."""
+  char_class = _ASTRAL_CHAR_CLASSES.get(cp)
+  if char_class is None:
+    char_class = _classify_char(six.unichr(cp))
+    _ASTRAL_CHAR_CLASSES[cp] = char_class
+  return char_class
+
+
+# One byte of flags per Basic Multilingual Plane codepoint (64KB). Characters
+# from the astral planes are rare enough that they are classified on demand.
+_BMP_CHAR_CLASSES = bytearray(
+    _classify_char(six.unichr(cp)) for cp in range(0x10000))
+_ASTRAL_CHAR_CLASSES = {}
+
+# `str.translate` table deleting every ASCII character that `_clean_text`
+# would drop.
+_ASCII_CONTROL_CHARS = dict(
+    (cp, None) for cp in range(0x80) if _BMP_CHAR_CLASSES[cp] & _CHAR_DROP)
@@ -16,8 +16,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import os
 import tempfile
+import numpy as np
 import tokenization
 import six
 import tensorflow as tf
@@ -48,6 +50,189 @@ class TokenizationTest(tf.test.TestCase):
     self.assertAllEqual(
         tokenizer.convert_tokens_to_ids(tokens), [7, 4, 5, 10, 8, 9])
 
+  def test_shared_vocab(self):
+    vocab = tokenization.Vocab(
+        collections.OrderedDict([("[UNK]", 0), ("want", 1), ("##ed", 2)]))
+
+    tokenizer = tokenization.FullTokenizer(vocab=vocab)
+    self.assertIs(tokenizer.basic_tokenizer.vocab, vocab)
+    self.assertIs(tokenizer.wordpiece_tokenizer.vocab, vocab.token_to_id)
+
+    self.assertEqual(len(vocab), 3)
+    self.assertEqual(list(vocab.keys()), ["[UNK]", "want", "##ed"])
+    self.assertAllEqual(
+        tokenizer.convert_tokens_to_ids(["want", "##ed", "x"]), [1, 2, 0])
+    self.assertAllEqual(
+        tokenizer.convert_ids_to_tokens([2, 1]), ["##ed", "want"])
+    for bad_id in (-1, 3):
+      with self.assertRaises(KeyError):
+        vocab.convert_ids_to_tokens([1, bad_id])
+
+  def test_vocab_snapshot(self):
+    vocab_tokens = ["[UNK]", "want", "##ed", "\u535A", "want"]
+    with tempfile.NamedTemporaryFile(delete=False) as vocab_writer:
+      if six.PY2:
+        vocab_writer.write("".join([x + "\n" for x in vocab_tokens]))
+      else:
+        vocab_writer.write("".join(
+            [x + "\n" for x in vocab_tokens]).encode("utf-8"))
+      vocab_file = vocab_writer.name
+    snapshot_file = vocab_file + ".snapshot"
+
+    tokenization.write_vocab_snapshot(vocab_file, snapshot_file)
+    vocab = tokenization.Vocab.from_file(vocab_file, snapshot_file=snapshot_file)
+    expected = tokenization.load_vocab(vocab_file)
+    self.assertEqual(list(vocab.items()), list(expected.items()))
+
+    tokenizer = tokenization.FullTokenizer(snapshot_file=snapshot_file)
+    self.assertAllEqual(tokenizer.tokenize(u"wanted"), ["want", "##ed"])
+
+    with open(vocab_file, "ab") as vocab_writer:
+      vocab_writer.write(b"new\n")
+    with self.assertRaises(ValueError):
+      tokenization.Vocab.from_file(vocab_file, snapshot_file=snapshot_file)
+    with self.assertRaises(ValueError):
+      tokenization.Vocab.from_snapshot(vocab_file)
+
+    os.unlink(vocab_file)
+    os.unlink(snapshot_file)
+
+  def test_token_id_shards(self):
+    vocab_tokens = ["[UNK]", "want", "##ed", "run", "##ning"]
+    vocab = tokenization.Vocab(
+        collections.OrderedDict((x, i) for (i, x) in enumerate(vocab_tokens)))
+    tokenizer = tokenization.FullTokenizer(vocab=vocab)
+
+    with tempfile.NamedTemporaryFile(delete=False) as text_writer:
+      text_writer.write(
+          b"wanted running\nwant\n\n\nrun\n\nwanted\n \nrunning\n")
+      text_file = text_writer.name
+    output_prefix = text_file + ".shard"
+
+    shard_files = tokenization.write_token_id_shards(
+        [text_file], tokenizer, output_prefix, max_tokens_per_shard=3)
+    self.assertEqual(len(shard_files), 3)
+
+    documents = []
+    for shard_file in shard_files:
+      shard = tokenization.TokenIdShard(shard_file)
+      self.assertEqual(shard.ids.dtype, np.uint16)
+      for doc_index in range(shard.num_documents):
+        documents.append([x.tolist() for x in shard.get_document(doc_index)])
+    self.assertEqual(documents,
+                     [[[1, 2, 3, 4], [1]], [[3]], [[1, 2]], [[3, 4]]])
+
+    os.unlink(text_file)
+    for shard_file in shard_files:
+      os.unlink(shard_file)
+      os.unlink(shard_file + ".index.npz")
+
+  def test_tokenize_with_offsets(self):
+    vocab_tokens = [
+        "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
+        "##ing", ","
+    ]
+    vocab = tokenization.Vocab(
+        collections.OrderedDict((x, i) for (i, x) in enumerate(vocab_tokens)))
+    tokenizer = tokenization.FullTokenizer(vocab=vocab)
+
+    text = u" UNwant\u00E9d\u0000  runningX \u535Arunning"
+    (tokens, offsets) = tokenizer.tokenize_with_offsets(text)
+    self.assertAllEqual(tokens, tokenizer.tokenize(text))
+    self.assertAllEqual(
+        tokens, ["un", "##want", "##ed", "[UNK]", "[UNK]", "runn", "##ing"])
+    self.assertAllEqual(
+        offsets, [(1, 3), (3, 7), (7, 9), (12, 20), (21, 22), (22, 26),
+                  (26, 29)])
+    self.assertEqual(text[offsets[2][0]:offsets[2][1]], u"\u00E9d")
+
+  def test_tokenize_max_tokens(self):
+    vocab_tokens = [
+        "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
+        "##ing", ","
+    ]
+    vocab = tokenization.Vocab(
+        collections.OrderedDict((x, i) for (i, x) in enumerate(vocab_tokens)))
+    tokenizer = tokenization.FullTokenizer(vocab=vocab)
+
+    for text in [u"unwanted running wa", u"UNwant\u00E9d \u535A running"]:
+      tokens = tokenizer.tokenize(text)
+      for max_tokens in range(len(tokens) + 2):
+        self.assertAllEqual(
+            tokenizer.tokenize(text, max_tokens=max_tokens),
+            tokens[:max_tokens])
+        self.assertAllEqual(
+            tokenizer.basic_tokenizer.tokenize(text, max_tokens=max_tokens),
+            tokenizer.basic_tokenizer.tokenize(text)[:max_tokens])
+      self.assertAllEqual(list(tokenizer.iter_tokenize(text)), tokens)
+
+  def test_encode_batch(self):
+    vocab_tokens = [
+        "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
+        "##ing", ","
+    ]
+    with tempfile.NamedTemporaryFile(delete=False) as vocab_writer:
+      if six.PY2:
+        vocab_writer.write("".join([x + "\n" for x in vocab_tokens]))
+      else:
+        vocab_writer.write("".join(
+            [x + "\n" for x in vocab_tokens]).encode("utf-8"))
+
+      vocab_file = vocab_writer.name
+
+    tokenizer = tokenization.FullTokenizer(vocab_file)
+    os.unlink(vocab_file)
+
+    batch = tokenizer.encode_batch(
+        [u"UNwant\u00E9d running", u"want", u"unwanted running"],
+        text_pairs=[None, u"wa ,", u"running"],
+        max_seq_length=8)
+
+    self.assertAllEqual(batch.input_ids,
+                        [[1, 7, 4, 5, 8, 9, 2, 0],
+                         [1, 3, 2, 6, 10, 2, 0, 0],
+                         [1, 7, 4, 5, 2, 8, 9, 2]])
+    self.assertAllEqual(batch.input_mask,
+                        [[1, 1, 1, 1, 1, 1, 1, 0],
+                         [1, 1, 1, 1, 1, 1, 0, 0],
+                         [1, 1, 1, 1, 1, 1, 1, 1]])
+    self.assertAllEqual(batch.segment_ids,
+                        [[0, 0, 0, 0, 0, 0, 0, 0],
+                         [0, 0, 0, 1, 1, 1, 0, 0],
+                         [0, 0, 0, 0, 0, 1, 1, 1]])
+    self.assertAllEqual(batch.lengths, [7, 6, 8])
+    self.assertEqual(batch.input_ids.dtype, np.int32)
+
+  def test_parallel_tokenizer(self):
+    vocab_tokens = [
+        "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
+        "##ing", ","
+    ]
+    with tempfile.NamedTemporaryFile(delete=False) as vocab_writer:
+      if six.PY2:
+        vocab_writer.write("".join([x + "\n" for x in vocab_tokens]))
+      else:
+        vocab_writer.write("".join(
+            [x + "\n" for x in vocab_tokens]).encode("utf-8"))
+
+      vocab_file = vocab_writer.name
+
+    lines = [u"unwanted running", u"", u"wa X", u"UNwant\u00E9d"] * 5
+    with tokenization.ParallelTokenizer(vocab_file, num_workers=2) as tokenizer:
+      (ids, offsets) = tokenizer.tokenize_to_ids(lines, chunk_size=3)
+    os.unlink(vocab_file)
+
+    self.assertEqual(ids.dtype, np.int32)
+    self.assertAllEqual(offsets[:5], [0, 5, 5, 7, 10])
+    self.assertEqual(len(offsets), len(lines) + 1)
+    self.assertEqual(offsets[-1], len(ids))
+    self.assertAllEqual(ids[offsets[18]:offsets[20]], [6, 0, 7, 4, 5])
+
+    # A vocab that can't be read fails in the parent instead of hanging the
+    # pool.
+    with self.assertRaises(tf.errors.NotFoundError):
+      tokenization.ParallelTokenizer(vocab_file, num_workers=2)
+
   def test_chinese(self):
     tokenizer = tokenization.BasicTokenizer()
 
@@ -90,6 +275,47 @@ class TokenizationTest(tf.test.TestCase):
     self.assertAllEqual(
         tokenizer.tokenize("unwantedX running"), ["[UNK]", "runn", "##ing"])
 
+  def test_wordpiece_tokenizer_longest_match(self):
+    vocab_tokens = [
+        "[UNK]", "a", "ab", "abc", "##b", "##bc", "##c", "##cd", "##", "##x"
+    ]
+
+    vocab = {}
+    for (i, token) in enumerate(vocab_tokens):
+      vocab[token] = i
+    tokenizer = tokenization.WordpieceTokenizer(vocab=vocab)
+
+    self.assertAllEqual(tokenizer.tokenize("abcd"), ["[UNK]"])
+    self.assertAllEqual(tokenizer.tokenize("abcc"), ["abc", "##c"])
+    self.assertAllEqual(tokenizer.tokenize("abcbc"), ["abc", "##bc"])
+    self.assertAllEqual(tokenizer.tokenize("acd"), ["a", "##cd"])
+    # Word-initial pieces are matched verbatim, so a literal "##x" is kept.
+    self.assertAllEqual(tokenizer.tokenize("##x"), ["##x"])
+    self.assertAllEqual(tokenizer.tokenize("a##"), ["[UNK]"])
+
+  def test_wordpiece_tokenizer_cache(self):
+    vocab_tokens = [
+        "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
+        "##ing"
+    ]
+
+    vocab = {}
+    for (i, token) in enumerate(vocab_tokens):
+      vocab[token] = i
+    tokenizer = tokenization.WordpieceTokenizer(vocab=vocab, cache_size=2)
+
+    self.assertAllEqual(
+        tokenizer.tokenize("unwanted running unwanted"),
+        ["un", "##want", "##ed", "runn", "##ing", "un", "##want", "##ed"])
+    self.assertAllEqual(tokenizer.tokenize_word_to_ids("running"), [8, 9])
+    self.assertAllEqual(tokenizer.tokenize("wa"), ["wa"])
+
+    stats = tokenizer.cache.get_stats()
+    self.assertEqual(stats["hits"], 2)
+    self.assertEqual(stats["misses"], 3)
+    self.assertEqual(stats["evictions"], 1)
+    self.assertEqual(stats["size"], 2)
+
   def test_convert_tokens_to_ids(self):
     vocab_tokens = [
         "[UNK]", "[CLS]", "[SEP]", "want", "##want", "##ed", "wa", "un", "runn",
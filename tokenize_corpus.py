@@ -0,0 +1,93 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tokenize a raw text corpus once into memory-mappable token id shards."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tokenization
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    "input_file", None,
+    "Input raw text file (or comma-separated list of files), in the "
+    "create_pretraining_data.py format.")
+
+flags.DEFINE_string(
+    "output_prefix", None,
+    "Prefix of the output shards. Shard `i` is written to "
+    "`<output_prefix>-<i>.ids` with its index next to it.")
+
+flags.DEFINE_string("vocab_file", None,
+                    "The vocabulary file that the BERT model was trained on.")
+
+flags.DEFINE_bool(
+    "do_lower_case", True,
+    "Whether to lower case the input text. Should be True for uncased "
+    "models and False for cased models.")
+
+flags.DEFINE_integer(
+    "tokenizer_cache_size", 0,
+    "If > 0, the tokenizer keeps the WordPiece output of up to this many "
+    "distinct words in an LRU cache. Frequent words then skip the WordPiece "
+    "search entirely.")
+
+flags.DEFINE_string(
+    "vocab_snapshot_file", None,
+    "Optional snapshot of `vocab_file` written by compile_vocab_snapshot.py. "
+    "If set, the vocab is loaded from it instead of parsing `vocab_file`; a "
+    "snapshot that does not match `vocab_file` is rejected.")
+
+flags.DEFINE_integer(
+    "max_tokens_per_shard", 1 << 28,
+    "A new shard is started at the first document boundary after this many "
+    "token ids.")
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  tokenizer = tokenization.FullTokenizer(
+      vocab_file=FLAGS.vocab_file, do_lower_case=FLAGS.do_lower_case,
+      cache_size=FLAGS.tokenizer_cache_size,
+      snapshot_file=FLAGS.vocab_snapshot_file)
+
+  input_files = []
+  for input_pattern in FLAGS.input_file.split(","):
+    input_files.extend(tf.gfile.Glob(input_pattern))
+
+  tf.logging.info("*** Reading from input files ***")
+  for input_file in input_files:
+    tf.logging.info("  %s", input_file)
+
+  shard_files = tokenization.write_token_id_shards(
+      input_files, tokenizer, FLAGS.output_prefix,
+      max_tokens_per_shard=FLAGS.max_tokens_per_shard)
+
+  tf.logging.info("*** Wrote shards ***")
+  for shard_file in shard_files:
+    tf.logging.info("  %s", shard_file)
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("input_file")
+  flags.mark_flag_as_required("output_prefix")
+  flags.mark_flag_as_required("vocab_file")
+  tf.app.run()
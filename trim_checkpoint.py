@@ -0,0 +1,283 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Truncates the encoder layers and trims the vocabulary of a checkpoint.
+
+Keeps the first `num_hidden_layers` encoder layers and only the vocabulary
+entries that occur in a domain corpus, and writes the reduced checkpoint
+(model.ckpt), the remapped vocab.txt and the matching bert_config.json.
+
+Kept tokens keep their relative order, so [PAD] stays at id 0 and the rows of
+"bert/embeddings/word_embeddings" (and the masked LM "cls/predictions/
+output_bias") are gathered in the order of the new vocab.txt. The greedy
+WordPiece search never produces a token that is longer than the one it picks,
+so text from the corpus tokenizes to exactly the same word pieces with the
+trimmed vocabulary. Other text can fall back to [UNK] more often, which
+`keep_single_characters` limits.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+import re
+
+import modeling
+import numpy as np
+import tokenization
+import tensorflow as tf
+
+flags = tf.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    "bert_config_file", None,
+    "The config json file corresponding to the BERT model to reduce.")
+
+flags.DEFINE_string("vocab_file", None,
+                    "The vocabulary file that the BERT model was trained on.")
+
+flags.DEFINE_string("init_checkpoint", None, "The checkpoint to reduce.")
+
+flags.DEFINE_string(
+    "output_dir", None,
+    "Where to write the reduced checkpoint (model.ckpt), vocab.txt and "
+    "bert_config.json.")
+
+flags.DEFINE_integer(
+    "num_hidden_layers", None,
+    "If set, only the first this many encoder layers are kept.")
+
+flags.DEFINE_string(
+    "corpus_file", None,
+    "Raw text file (or comma-separated list of file patterns) of the domain "
+    "corpus. If set, only the tokens that occur in it are kept in the "
+    "vocabulary.")
+
+flags.DEFINE_bool(
+    "do_lower_case", True,
+    "Whether to lower case the input text. Should be True for uncased "
+    "models and False for cased models.")
+
+flags.DEFINE_integer(
+    "min_token_count", 1,
+    "Tokens that occur fewer times than this in the corpus are removed.")
+
+flags.DEFINE_bool(
+    "keep_single_characters", True,
+    "Whether to keep all single-character tokens (and their \"##\" forms), "
+    "so that words outside the corpus still split into word pieces instead "
+    "of becoming [UNK].")
+
+flags.DEFINE_integer(
+    "tokenizer_cache_size", 100000,
+    "The number of words whose WordPiece output the corpus tokenizer keeps "
+    "in an LRU cache.")
+
+# Tokens that are always kept, whether or not they occur in the corpus.
+SPECIAL_TOKENS = ("[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]")
+
+# Variables with one row per vocabulary entry, and the axis of the rows.
+VOCAB_VARIABLES = {
+    "bert/embeddings/word_embeddings": 0,
+    "cls/predictions/output_bias": 0,
+}
+
+
+def count_corpus_tokens(input_files, tokenizer):
+  """Returns the number of occurrences of every token id in the corpus.
+
+  Args:
+    input_files: List of raw text file paths.
+    tokenizer: A `FullTokenizer`.
+
+  Returns:
+    int64 array of shape [vocab_size].
+  """
+  counts = np.zeros([len(tokenizer.vocab)], dtype=np.int64)
+  for input_file in input_files:
+    with tf.gfile.GFile(input_file, "r") as reader:
+      while True:
+        line = tokenization.convert_to_unicode(reader.readline())
+        if not line:
+          break
+        ids = tokenizer.tokenize_to_ids(line.strip())
+        if ids:
+          counts += np.bincount(ids, minlength=len(counts))
+  return counts
+
+
+def select_vocab_ids(vocab, counts, min_token_count=1,
+                     keep_single_characters=True):
+  """Returns the sorted ids of the tokens to keep.
+
+  Args:
+    vocab: `tokenization.Vocab`.
+    counts: Array with the corpus count of every token id.
+    min_token_count: int. Tokens that occur fewer times are removed.
+    keep_single_characters: bool. Whether to keep all single-character
+      tokens and their "##" continuation forms.
+
+  Returns:
+    int array with the kept token ids in increasing order. Id 0, the padding
+    id, and the `SPECIAL_TOKENS` are always kept.
+  """
+  keep = counts >= min_token_count
+  keep[0] = True
+  for (token, index) in vocab.items():
+    if token in SPECIAL_TOKENS:
+      keep[index] = True
+    elif keep_single_characters and (len(token) == 1 or
+                                     (len(token) == 3 and
+                                      token.startswith("##"))):
+      keep[index] = True
+  return np.nonzero(keep)[0]
+
+
+def write_vocab(vocab, kept_ids, output_file):
+  """Writes the kept tokens of `vocab`, in order, to a vocabulary file."""
+  with tf.gfile.GFile(output_file, "w") as writer:
+    for index in kept_ids:
+      writer.write(vocab.id_to_token[index] + "\n")
+
+
+def trim_checkpoint(bert_config, init_checkpoint, output_checkpoint,
+                    num_hidden_layers=None, kept_ids=None):
+  """Writes a checkpoint with fewer encoder layers and vocabulary entries.
+
+  Args:
+    bert_config: `BertConfig` of `init_checkpoint`.
+    init_checkpoint: The checkpoint to reduce.
+    output_checkpoint: Where to write the reduced checkpoint.
+    num_hidden_layers: (optional) int. The number of leading encoder layers
+      to keep. All layers are kept if None.
+    kept_ids: (optional) Sorted array of the token ids to keep, as returned
+      by `select_vocab_ids`. The whole vocabulary is kept if None.
+
+  Returns:
+    The `BertConfig` of the reduced checkpoint.
+
+  Raises:
+    ValueError: If `num_hidden_layers` is larger than the model.
+  """
+  if num_hidden_layers is None:
+    num_hidden_layers = bert_config.num_hidden_layers
+  if num_hidden_layers < 1 or num_hidden_layers > bert_config.num_hidden_layers:
+    raise ValueError(
+        "Cannot keep %d of the %d encoder layers" %
+        (num_hidden_layers, bert_config.num_hidden_layers))
+
+  reader = tf.train.load_checkpoint(init_checkpoint)
+  values = {}
+  for name in sorted(reader.get_variable_to_shape_map()):
+    m = re.match("^.*/encoder/layer_(\\d+)/", name)
+    if m is not None and int(m.group(1)) >= num_hidden_layers:
+      continue
+    value = reader.get_tensor(name)
+    # Optimizer slots, e.g. ".../word_embeddings/adam_m", are trimmed like
+    # their variable.
+    variable_name = name
+    for suffix in ("/adam_m", "/adam_v"):
+      if name.endswith(suffix):
+        variable_name = name[:-len(suffix)]
+    if kept_ids is not None and variable_name in VOCAB_VARIABLES:
+      value = np.take(value, kept_ids, axis=VOCAB_VARIABLES[variable_name])
+    values[name] = value
+  modeling.write_checkpoint(values, output_checkpoint)
+
+  trimmed_config = copy.deepcopy(bert_config)
+  trimmed_config.num_hidden_layers = num_hidden_layers
+  if kept_ids is not None:
+    trimmed_config.vocab_size = len(kept_ids)
+  if bert_config.num_attention_heads_per_layer:
+    trimmed_config.num_attention_heads_per_layer = (
+        bert_config.num_attention_heads_per_layer[:num_hidden_layers])
+  if bert_config.intermediate_size_per_layer:
+    trimmed_config.intermediate_size_per_layer = (
+        bert_config.intermediate_size_per_layer[:num_hidden_layers])
+  if bert_config.ffn_ranks_per_layer:
+    trimmed_config.ffn_ranks_per_layer = (
+        bert_config.ffn_ranks_per_layer[:num_hidden_layers])
+  if bert_config.token_pruning_schedule:
+    # The schedule's layers are 1-based.
+    trimmed_config.token_pruning_schedule = [
+        x for x in bert_config.token_pruning_schedule
+        if x[0] <= num_hidden_layers
+    ]
+  return trimmed_config
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+
+  bert_config = modeling.BertConfig.from_json_file(FLAGS.bert_config_file)
+  vocab = tokenization.Vocab.from_file(FLAGS.vocab_file)
+  if len(vocab) != bert_config.vocab_size:
+    raise ValueError("%s has %d tokens but the config has vocab_size %d" %
+                     (FLAGS.vocab_file, len(vocab), bert_config.vocab_size))
+
+  kept_ids = None
+  if FLAGS.corpus_file:
+    tokenization.validate_case_matches_checkpoint(FLAGS.do_lower_case,
+                                                  FLAGS.init_checkpoint)
+    tokenizer = tokenization.FullTokenizer(
+        do_lower_case=FLAGS.do_lower_case,
+        cache_size=FLAGS.tokenizer_cache_size,
+        vocab=vocab)
+    input_files = []
+    for input_pattern in FLAGS.corpus_file.split(","):
+      input_files.extend(tf.gfile.Glob(input_pattern))
+    counts = count_corpus_tokens(input_files, tokenizer)
+    kept_ids = select_vocab_ids(vocab, counts, FLAGS.min_token_count,
+                                FLAGS.keep_single_characters)
+    tf.logging.info("Counted %d corpus tokens, %.2f%% of them [UNK]",
+                    counts.sum(),
+                    100.0 * counts[vocab["[UNK]"]] / max(counts.sum(), 1))
+
+  tf.gfile.MakeDirs(FLAGS.output_dir)
+  output_checkpoint = os.path.join(FLAGS.output_dir, "model.ckpt")
+  trimmed_config = trim_checkpoint(bert_config, FLAGS.init_checkpoint,
+                                   output_checkpoint, FLAGS.num_hidden_layers,
+                                   kept_ids)
+  output_config_file = os.path.join(FLAGS.output_dir, "bert_config.json")
+  with tf.gfile.GFile(output_config_file, "w") as writer:
+    writer.write(trimmed_config.to_json_string())
+  output_vocab_file = os.path.join(FLAGS.output_dir, "vocab.txt")
+  if kept_ids is None:
+    tf.gfile.Copy(FLAGS.vocab_file, output_vocab_file, overwrite=True)
+  else:
+    write_vocab(vocab, kept_ids, output_vocab_file)
+
+  tf.logging.info("***** Trimming results *****")
+  tf.logging.info("  Wrote %s, %s and %s", output_checkpoint,
+                  output_vocab_file, output_config_file)
+  tf.logging.info("  encoder layers: %d -> %d", bert_config.num_hidden_layers,
+                  trimmed_config.num_hidden_layers)
+  tf.logging.info("  vocab size: %d -> %d", bert_config.vocab_size,
+                  trimmed_config.vocab_size)
+  tf.logging.info(
+      "  word embedding parameters: %d -> %d",
+      bert_config.vocab_size * modeling.get_embedding_size(bert_config),
+      trimmed_config.vocab_size * modeling.get_embedding_size(trimmed_config))
+
+
+if __name__ == "__main__":
+  flags.mark_flag_as_required("bert_config_file")
+  flags.mark_flag_as_required("vocab_file")
+  flags.mark_flag_as_required("init_checkpoint")
+  flags.mark_flag_as_required("output_dir")
+  tf.app.run()
@@ -0,0 +1,144 @@
+# coding=utf-8
+# Copyright 2018 The Google AI Language Team Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+
+import modeling
+import numpy as np
+import tokenization
+import trim_checkpoint
+import tensorflow as tf
+
+
+class TrimCheckpointTest(tf.test.TestCase):
+
+  VOCAB_TOKENS = [
+      "[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "cat", "##s", "dog",
+      "run", "##ning", "walk", "a", "##b", "."
+  ]
+
+  def write_vocab_file(self):
+    vocab_file = os.path.join(self.get_temp_dir(), "vocab.txt")
+    with tf.gfile.GFile(vocab_file, "w") as writer:
+      writer.write("".join([x + "\n" for x in self.VOCAB_TOKENS]))
+    return vocab_file
+
+  def test_select_vocab_ids(self):
+    vocab = tokenization.Vocab.from_file(self.write_vocab_file())
+    counts = np.zeros([len(vocab)], dtype=np.int64)
+    counts[vocab["cat"]] = 3
+    counts[vocab["dog"]] = 1
+
+    self.assertAllEqual(
+        trim_checkpoint.select_vocab_ids(
+            vocab, counts, keep_single_characters=False),
+        [0, 1, 2, 3, 4, vocab["cat"], vocab["dog"]])
+    self.assertAllEqual(
+        trim_checkpoint.select_vocab_ids(
+            vocab, counts, min_token_count=2, keep_single_characters=True),
+        [
+            0, 1, 2, 3, 4, vocab["cat"], vocab["##s"], vocab["a"], vocab["##b"],
+            vocab["."]
+        ])
+
+  def test_trim_checkpoint(self):
+    vocab_file = self.write_vocab_file()
+    bert_config = modeling.BertConfig(
+        vocab_size=len(self.VOCAB_TOKENS),
+        hidden_size=32,
+        num_hidden_layers=3,
+        num_attention_heads=4,
+        intermediate_size=37,
+        intermediate_size_per_layer=[37, 20, 37],
+        token_pruning_schedule=[[2, 3], [3, 2]])
+    corpus_file = os.path.join(self.get_temp_dir(), "corpus.txt")
+    with tf.gfile.GFile(corpus_file, "w") as writer:
+      writer.write("The cats run .\n\nA dog\n")
+
+    # The token pruning schedule is only checked in the trimmed config, the
+    # models compare the outputs of all positions.
+    unpruned_config = copy.deepcopy(bert_config)
+    unpruned_config.token_pruning_schedule = None
+    init_checkpoint = os.path.join(self.get_temp_dir(), "model.ckpt")
+    with tf.Graph().as_default():
+      input_ids = tf.placeholder(tf.int32, [None, None])
+      model = modeling.BertModel(
+          config=unpruned_config, is_training=False, input_ids=input_ids)
+      output_bias = tf.get_variable(
+          "cls/predictions/output_bias", [bert_config.vocab_size])
+      adam_m = tf.get_variable(
+          "bert/embeddings/word_embeddings/adam_m",
+          [bert_config.vocab_size, bert_config.hidden_size])
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        tf.train.Saver().save(sess, init_checkpoint)
+        tokenizer = tokenization.FullTokenizer(vocab_file=vocab_file)
+        tokens = tokenizer.tokenize("The cats run . A dog")
+        (expected_output, expected_bias, expected_adam_m) = sess.run(
+            (model.get_all_encoder_layers()[1], output_bias, adam_m),
+            {input_ids: [tokenizer.convert_tokens_to_ids(tokens)]})
+
+    vocab = tokenization.Vocab.from_file(vocab_file)
+    counts = trim_checkpoint.count_corpus_tokens([corpus_file], tokenizer)
+    kept_ids = trim_checkpoint.select_vocab_ids(
+        vocab, counts, keep_single_characters=False)
+    trimmed_vocab_file = os.path.join(self.get_temp_dir(), "trimmed_vocab.txt")
+    trim_checkpoint.write_vocab(vocab, kept_ids, trimmed_vocab_file)
+    trimmed_checkpoint = os.path.join(self.get_temp_dir(), "trimmed.ckpt")
+    trimmed_config = trim_checkpoint.trim_checkpoint(
+        bert_config, init_checkpoint, trimmed_checkpoint,
+        num_hidden_layers=2, kept_ids=kept_ids)
+
+    self.assertEqual(trimmed_config.num_hidden_layers, 2)
+    self.assertEqual(trimmed_config.vocab_size, 12)
+    self.assertEqual(trimmed_config.intermediate_size_per_layer, [37, 20])
+    self.assertEqual(trimmed_config.token_pruning_schedule, [[2, 3]])
+    self.assertAllClose(
+        tf.train.load_variable(trimmed_checkpoint,
+                               "cls/predictions/output_bias"),
+        expected_bias[kept_ids])
+    self.assertAllClose(
+        tf.train.load_variable(trimmed_checkpoint,
+                               "bert/embeddings/word_embeddings/adam_m"),
+        expected_adam_m[kept_ids])
+    self.assertEmpty([
+        name for (name, _) in tf.train.list_variables(trimmed_checkpoint)
+        if "layer_2" in name
+    ])
+
+    # The corpus tokenizes to the same word pieces with the trimmed vocab,
+    # and the reduced model gives the output of the original second layer.
+    trimmed_tokenizer = tokenization.FullTokenizer(
+        vocab_file=trimmed_vocab_file)
+    self.assertEqual(trimmed_tokenizer.tokenize("The cats run . A dog"), tokens)
+    trimmed_config.token_pruning_schedule = None
+    with tf.Graph().as_default():
+      model = modeling.BertModel(
+          config=trimmed_config,
+          is_training=False,
+          input_ids=tf.constant(
+              [trimmed_tokenizer.convert_tokens_to_ids(tokens)]))
+      with tf.Session() as sess:
+        tf.train.Saver().restore(sess, trimmed_checkpoint)
+        self.assertAllClose(
+            sess.run(model.get_sequence_output()), expected_output)
+
+
+if __name__ == "__main__":
+  tf.test.main()